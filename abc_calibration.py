@@ -0,0 +1,240 @@
+"""
+Approximate Bayesian computation (ABC-SMC) over simulation runs.
+
+Draws parameter sets, simulates each one and keeps those whose yearly
+incidence lands within a tolerance of the target; successive generations
+shrink the tolerance and resample around the accepted particles:
+
+    target = target_from_result(SimulationResult.load(name))
+    posterior = abc_smc(target, n_particles=100, n_generations=4, engine='abm',
+                        initial_population=10000, initial_infected_count=300)
+    posterior['particles'], posterior['weights']
+
+The distance is the squared error of the yearly incidence relative to the mean
+target, summed over years, so it can only grow as a run goes on. Every run
+checks its partial distance at the end of each simulated year and stops as
+soon as it exceeds the tolerance: such a candidate could never be accepted,
+and its worker moves on to the next candidate.
+
+Priors are uniform over ranges in the global_sensitivity format
+{parameter: (low, high, 'log' | 'linear')}; log ranges are uniform in the log.
+"""
+import os
+import time
+from math import erf
+import numpy as np
+from calibration import OBSERVABLES
+from global_sensitivity import DEFAULT_RANGES, scale_samples
+
+YEARLY_KEYS = {'infections': 'yearly_new_infections', 'acute_cases': 'num_acute_cases_yearly'}
+
+
+def _normal_cdf(z):
+    """Standard normal CDF, elementwise."""
+    return 0.5 * (1.0 + np.vectorize(erf)(z / np.sqrt(2.0)))
+
+
+def _partial_distance(population_history, target, scale, observable):
+    """Distance of the years simulated so far (year 0 is the initial snapshot)."""
+    incidence = np.array([year[YEARLY_KEYS[observable]] for year in population_history if year['year'] > 0], dtype=float)
+    errors = (incidence - target[:len(incidence)]) / scale
+    return float(errors @ errors)
+
+
+def _run_candidate(task):
+    """
+    Simulates one candidate, stopping once its partial distance exceeds the
+    tolerance. Executed in the worker processes.
+
+    Returns:
+        Tuple: (unit point, distance of the simulated years, years simulated, accepted).
+    """
+    import contextlib
+    import io
+    from engine import make_engine
+    from simulation import Simulation
+    from model import set_seed
+
+    unit, params, engine_name, target, scale, observable, tolerance, seed = task
+    set_seed(seed)
+
+    def exceeds_tolerance(year, population_history):
+        return _partial_distance(population_history, target, scale, observable) > tolerance
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = Simulation(make_engine(engine_name, **params)).run(
+            len(target), save=False, stop_condition=exceeds_tolerance
+        )
+    distance = _partial_distance(result.population_history, target, scale, observable)
+    years = result.metadata['completed_years']
+    return unit, distance, years, bool(years == len(target) and distance <= tolerance)
+
+
+class _Proposal:
+    """
+    Samples candidates on the unit hypercube: the prior, or perturbed particles of
+    the previous generation. Each perturbation is a component-wise Gaussian kernel
+    truncated to [0, 1]^d: a candidate outside is redrawn around the same parent.
+    """
+
+    def __init__(self, d, rng, particles=None, weights=None):
+        self.d = d
+        self.rng = rng
+        self.particles = particles
+        self.weights = weights
+        if particles is not None:
+            # Twice the weighted variance of the particles in each dimension (Beaumont et al. 2009)
+            mean = weights @ particles
+            self.scales = np.sqrt(2.0 * (weights @ (particles - mean) ** 2) + 1e-10)
+            # Mass of each parent's kernel inside [0, 1]^d, the normalization of its truncated kernel
+            self.masses = np.prod(_normal_cdf((1.0 - particles) / self.scales) - _normal_cdf(-particles / self.scales), axis=1)
+
+    def sample(self):
+        if self.particles is None:
+            return self.rng.random(self.d)
+        parent = self.particles[self.rng.choice(len(self.particles), p=self.weights)]
+        while True: # Rejection on the prior support
+            candidate = parent + self.scales * self.rng.standard_normal(self.d)
+            if np.all((candidate >= 0.0) & (candidate <= 1.0)):
+                return candidate
+
+    def importance_weights(self, accepted):
+        """Prior over the mixture of truncated kernels the accepted particles were drawn from."""
+        if self.particles is None:
+            return np.full(len(accepted), 1.0 / len(accepted))
+        differences = (accepted[:, None, :] - self.particles[None, :, :]) / self.scales
+        kernel = np.exp(-0.5 * np.sum(differences ** 2, axis=2)) / self.masses
+        weights = 1.0 / (kernel @ self.weights)
+        return weights / weights.sum()
+
+
+def _run_generation(proposal, ranges, n_particles, tolerance, engine, target, scale, observable,
+                    workers, seed, max_candidates, engine_kwargs):
+    """
+    Keeps workers busy with candidates until n_particles are accepted (or max_candidates were tried).
+
+    Outcomes are collected in submission order, as in a serial run: taking whichever
+    candidates finish first would favour the parameters that simulate fastest.
+
+    Returns:
+        Tuple: (accepted unit points, their distances, candidates tried, years simulated).
+    """
+    accepted, distances = [], []
+    submitted = 0
+    tried = 0
+    years_simulated = 0
+
+    def next_task():
+        nonlocal submitted
+        unit = proposal.sample()
+        params = dict(engine_kwargs, **scale_samples(unit[None, :], ranges)[0])
+        submitted += 1
+        return (unit, params, engine, target, scale, observable, tolerance, seed + submitted)
+
+    def collect(outcome):
+        nonlocal tried, years_simulated
+        unit, distance, years, is_accepted = outcome
+        tried += 1
+        years_simulated += years
+        if is_accepted and len(accepted) < n_particles:
+            accepted.append(unit)
+            distances.append(distance)
+
+    if workers <= 1:
+        while len(accepted) < n_particles and submitted < max_candidates:
+            collect(_run_candidate(next_task()))
+    else:
+        from collections import deque
+        from multiprocessing import Pool
+        with Pool(workers) as pool:
+            pending = deque(pool.apply_async(_run_candidate, (next_task(),))
+                            for _ in range(min(workers, max_candidates)))
+            while pending and len(accepted) < n_particles:
+                collect(pending.popleft().get())
+                # Keep every worker busy while more particles are needed
+                if len(accepted) < n_particles and submitted < max_candidates:
+                    pending.append(pool.apply_async(_run_candidate, (next_task(),)))
+            # Candidates still running were submitted after every accepted one: dropping them adds no bias
+            pool.terminate()
+    return np.array(accepted), np.array(distances), tried, years_simulated
+
+
+def abc_smc(target, n_particles=100, n_generations=4, ranges=None, engine='abm', observable='infections',
+            initial_tolerance=None, quantile=0.5, workers=None, seed=None, max_candidates=None, **engine_kwargs):
+    """
+    ABC sequential Monte Carlo calibration against a yearly incidence target.
+
+    Args:
+        target (array): Yearly incidence for years 1..N (e.g. calibration.target_from_result).
+        n_particles (int): Accepted particles per generation.
+        n_generations (int): Number of generations.
+        ranges (dict): Uniform prior ranges; defaults to global_sensitivity.DEFAULT_RANGES.
+        engine (str): Engine name ('abm', 'stochastic', 'ode', ...).
+        observable (str): 'infections' or 'acute_cases'.
+        initial_tolerance (float): Tolerance of the first generation (default: none, i.e. the prior).
+        quantile (float): Each next tolerance is this quantile of the accepted distances.
+        workers (int): Worker processes; defaults to the number of CPUs.
+        seed (int): Seeds the proposals and the runs.
+        max_candidates (int): Candidates tried per generation before giving up (default 100 * n_particles).
+        **engine_kwargs: Fixed parameters shared by every run.
+
+    Returns:
+        dict: Final 'particles' (parameter dicts), normalized 'weights', 'distances',
+        the per-generation 'generations' log (tolerance, accepted, candidates,
+        acceptance_rate, years_simulated, years_saved), 'posterior_mean' and 'wall_time'.
+    """
+    if observable not in OBSERVABLES:
+        raise ValueError(f"Unknown observable '{observable}'. Choose from: {', '.join(OBSERVABLES)}")
+    start_time = time.perf_counter()
+    target = np.asarray(target, dtype=float)
+    ranges = ranges if ranges is not None else DEFAULT_RANGES
+    scale = max(float(np.mean(np.abs(target))), 1.0)
+    workers = workers if workers is not None else os.cpu_count() or 1
+    max_candidates = max_candidates if max_candidates is not None else 100 * n_particles
+    rng = np.random.default_rng(seed)
+    seed = seed or 0
+
+    proposal = _Proposal(len(ranges), rng)
+    tolerance = initial_tolerance if initial_tolerance is not None else np.inf
+    generations = []
+    particles = weights = distances = None
+    for generation in range(n_generations):
+        accepted, accepted_distances, tried, years_simulated = _run_generation(
+            proposal, ranges, n_particles, tolerance, engine, target, scale, observable,
+            workers, seed + generation * max_candidates, max_candidates, engine_kwargs
+        )
+        generations.append({
+            'tolerance': float(tolerance),
+            'accepted': len(accepted),
+            'candidates': tried,
+            'acceptance_rate': len(accepted) / tried if tried else 0.0,
+            'years_simulated': years_simulated,
+            'years_saved': tried * len(target) - years_simulated,
+        })
+        print(f"Generation {generation + 1}: tolerance={tolerance:.4g}, accepted {len(accepted)}/{tried} candidates, "
+              f"{years_simulated} of {tried * len(target)} years simulated")
+        if len(accepted) < 2:
+            print("Too few particles accepted; stopping.")
+            break
+        particles, distances = accepted, accepted_distances
+        weights = proposal.importance_weights(particles)
+        proposal = _Proposal(len(ranges), rng, particles, weights)
+        tolerance = float(np.quantile(distances, quantile))
+
+    if particles is None:
+        raise RuntimeError("No generation accepted enough particles; widen the ranges or raise initial_tolerance")
+    samples = scale_samples(particles, ranges)
+    report = {
+        'particles': samples,
+        'weights': weights,
+        'distances': distances,
+        'generations': generations,
+        'posterior_mean': {name: float(np.sum(weights * np.array([s[name] for s in samples]))) for name in ranges},
+        'wall_time': time.perf_counter() - start_time,
+    }
+    saved = sum(g['years_saved'] for g in generations)
+    total = sum(g['years_saved'] + g['years_simulated'] for g in generations)
+    print(f"ABC-SMC finished in {report['wall_time']:.2f} s; early rejection skipped {saved} of {total} simulated years.")
+    for name, value in report['posterior_mean'].items():
+        print(f"  {name}: posterior mean {value:.4e}")
+    return report
@@ -0,0 +1,265 @@
+"""
+Age-structured compartmental model.
+
+Stratifies every compartment of CompartmentalModel by gender and by the
+PYRAMID_AGE_BINS age groups, so that the parameters the ABM applies per agent
+are applied per group instead of being averaged over the population:
+
+- aging flows between consecutive age bins
+- age- and gender-specific death rates (MALE_DEATH_RATES / FEMALE_DEATH_RATES)
+- age- and gender-specific chronic carriage probabilities
+- age-dependent acute and subclinical durations (under/over 30)
+- vaccination of the Vaccine target age group only
+
+The state is an (8 compartments x groups) matrix, with the males' age bins
+followed by the females'. It runs through the shared Simulation loop as the
+"ode_age" engine and fills the age pyramid, at a small fraction of the cost
+of the agent-based Model.
+"""
+import numpy as np
+from compartmental_model import CompartmentalModel, STATE_KEYS
+from initialparaandconst import (
+    MALE_DEATH_RATES, FEMALE_DEATH_RATES, AGE_DISTRIBUTION, PYRAMID_AGE_BINS,
+    SUSCEPTIBLE, MATERNALLY_IMMUNE, PREPATENT, ACUTE, SUBCLINICAL, CHRONIC, RECOVERED, VACCINATED,
+    ACUTE_DURATION_UNDER_30, ACUTE_DURATION_OVER_30, SUBCLINICAL_DURATION_UNDER_30,
+    SUBCLINICAL_DURATION_OVER_30, PROB_CHRONIC_MALE, PROB_CHRONIC_FEMALE, CHRONIC_PROB_AGE_BINS,
+    PROB_CHRONIC_AFTER_ACUTE, PROB_CHRONIC_AFTER_SUBCLINICAL, PROB_ACUTE_AFTER_PREPATENT,
+    MATERNAL_IMMUNITY_DURATION, PREPATENT_DURATION, RECOVERY_DURATION, ACUTE_MORTALITY_RATE,
+    ENABLE_ENVIRONMENTAL_TRANSMISSION, TRANSMISSION_RATE, FEMALE_BIRTH_RATE, Vaccine
+)
+
+NUM_COMPARTMENTS = 8
+# Rows of the state matrix, in DISEASE_STATES order
+S, M, P, A, U, C, R, V = (SUSCEPTIBLE, MATERNALLY_IMMUNE, PREPATENT, ACUTE,
+                          SUBCLINICAL, CHRONIC, RECOVERED, VACCINATED)
+NEWBORN_MALE_FRACTION = 0.52 # As in Model.add_agents
+
+# --- Age groups ---
+AGE_BIN_LOWER = np.array(PYRAMID_AGE_BINS[:-1], dtype=float)
+# The open last bin is given the width of the others for its midpoint and vaccination share
+AGE_BIN_UPPER = np.array([upper if np.isfinite(upper) else lower + 5 for lower, upper
+                          in zip(PYRAMID_AGE_BINS[:-1], PYRAMID_AGE_BINS[1:])], dtype=float)
+AGE_BIN_MID = (AGE_BIN_LOWER + AGE_BIN_UPPER) / 2
+NUM_AGE_BINS = len(AGE_BIN_LOWER)
+NUM_GROUPS = 2 * NUM_AGE_BINS
+
+
+def _rates_by_age(rate_table, ages):
+    """Looks up an {(min_age, max_age): rate} table at the given ages (upper bounds inclusive, like the ABM)."""
+    upper_bounds = np.array([key[1] for key in rate_table])
+    rates = np.array(list(rate_table.values()))
+    return rates[np.minimum(np.searchsorted(upper_bounds, ages), len(rates) - 1)]
+
+
+def _initial_age_distribution():
+    """Share of the population in each pyramid age bin, spreading AGE_DISTRIBUTION uniformly over its years."""
+    shares = np.zeros(NUM_AGE_BINS)
+    for (min_age, max_age), prob in AGE_DISTRIBUTION.items():
+        years = np.arange(min_age, max_age + 1)
+        bins = np.searchsorted(AGE_BIN_LOWER, years, side='right') - 1
+        np.add.at(shares, bins, prob / len(years))
+    return shares / shares.sum()
+
+
+def build_aging_matrix():
+    """
+    Builds the (groups x groups) aging operator. For a state row x, x @ matrix is
+    the aging flow: people leave each bin at 1/width per day and enter the next
+    bin of the same gender. Nobody ages out of the last bin.
+    """
+    matrix = np.zeros((NUM_GROUPS, NUM_GROUPS))
+    aging_rates = 1.0 / ((AGE_BIN_UPPER - AGE_BIN_LOWER) * 365.0)
+    for offset in (0, NUM_AGE_BINS):
+        for age_bin in range(NUM_AGE_BINS - 1):
+            group = offset + age_bin
+            matrix[group, group] = -aging_rates[age_bin]
+            matrix[group, group + 1] = aging_rates[age_bin]
+    return matrix
+
+
+def vaccination_target_shares():
+    """Fraction of each age group inside the Vaccine target age range (ages uniform within a bin)."""
+    target_min_years = Vaccine.target_group_min_age / 12.0
+    target_max_years = Vaccine.target_group_max_age / 12.0
+    overlap = np.clip(np.minimum(AGE_BIN_UPPER, target_max_years) - np.maximum(AGE_BIN_LOWER, target_min_years), 0, None)
+    shares = overlap / (AGE_BIN_UPPER - AGE_BIN_LOWER)
+    return np.concatenate([shares, shares])
+
+
+class AgeStructuredModel(CompartmentalModel):
+    """
+    CompartmentalModel stratified by gender and age group. The aggregated
+    self.state dict is kept in sync so it can be used wherever a
+    CompartmentalModel is expected; self.groups holds the full state matrix.
+    """
+
+    def __init__(self, **kwargs):
+        # --- Group-specific rates (per day) ---
+        over_30 = np.concatenate([AGE_BIN_LOWER, AGE_BIN_LOWER]) >= 30
+        self.aging_matrix = build_aging_matrix()
+        self.death_rates = np.concatenate([_rates_by_age(MALE_DEATH_RATES, AGE_BIN_MID),
+                                           _rates_by_age(FEMALE_DEATH_RATES, AGE_BIN_MID)])
+        self.acute_exit_rates = 1.0 / np.where(over_30, ACUTE_DURATION_OVER_30[0], ACUTE_DURATION_UNDER_30[0])
+        self.subclinical_exit_rates = 1.0 / np.where(over_30, SUBCLINICAL_DURATION_OVER_30[0], SUBCLINICAL_DURATION_UNDER_30[0])
+        chronic_bins = np.minimum(np.searchsorted(CHRONIC_PROB_AGE_BINS, AGE_BIN_MID), len(CHRONIC_PROB_AGE_BINS) - 1)
+        chronic_base = np.concatenate([PROB_CHRONIC_MALE[chronic_bins], PROB_CHRONIC_FEMALE[chronic_bins]])
+        self.prob_a_to_c = chronic_base * PROB_CHRONIC_AFTER_ACUTE
+        self.prob_u_to_c = chronic_base * PROB_CHRONIC_AFTER_SUBCLINICAL
+        self.female_groups = np.arange(NUM_AGE_BINS, NUM_GROUPS)
+
+        # Integrated here with a daily matrix RK4 that includes the environment, not by ode_kernels
+        if kwargs.get('solver', 'python') != 'python':
+            raise ValueError(f"The age-structured model has its own RK4 solver; solver='{kwargs['solver']}' is not available")
+        if not kwargs.get('coupled_environment', True):
+            raise ValueError("The age-structured model always integrates the environment with the compartments")
+        if kwargs.get('step_days', 1) != 1:
+            raise ValueError("The age-structured model steps one day at a time")
+        kwargs['solver'] = 'python'
+        super().__init__(**kwargs)
+
+    def initialize_state(self):
+        """Distributes the population over the age groups (50/50 by gender) and seeds prepatent infections."""
+        shares = _initial_age_distribution()
+        group_shares = np.concatenate([shares, shares]) / 2
+        self.groups = np.zeros((NUM_COMPARTMENTS, NUM_GROUPS))
+        self.groups[S] = (self.population - self.initial_infected_count) * group_shares
+        self.groups[P] = self.initial_infected_count * group_shares # Seed infection here
+        self.cumulative = np.zeros(2) # Cumulative infections and acute cases
+        self.environmental_contagion = 0.0
+        self._sync_state()
+
+    def _sync_state(self):
+        """Updates the aggregated state dict from the group matrix."""
+        totals = self.groups.sum(axis=1)
+        self.state = {key: float(totals[i]) for i, key in enumerate(STATE_KEYS[:NUM_COMPARTMENTS])}
+        self.state['CumInf'] = float(self.cumulative[0])
+        self.state['CumAcute'] = float(self.cumulative[1])
+
+    # --- Dynamics ---
+
+    def _pack(self):
+        return np.concatenate([self.groups.ravel(), self.cumulative, [self.environmental_contagion]])
+
+    def _unpack(self, y):
+        size = NUM_COMPARTMENTS * NUM_GROUPS
+        self.groups = y[:size].reshape(NUM_COMPARTMENTS, NUM_GROUPS).copy()
+        self.cumulative = y[size:size + 2].copy()
+        self.environmental_contagion = float(y[size + 2])
+
+    def infection_pressure(self, t, groups, environmental_contagion):
+        """Daily force of infection for the given state (same rules as CompartmentalModel)."""
+        if ENABLE_ENVIRONMENTAL_TRANSMISSION:
+            hazard_factor = environmental_contagion / (self.k_half + environmental_contagion) if environmental_contagion > 0 else 0.0
+            return self.base_transmission_risk * hazard_factor * self.get_seasonality_multiplier(t)
+        total_pop = groups.sum()
+        num_shedding = groups[[P, A, U, C]].sum() * 0.8
+        return (num_shedding / total_pop) * TRANSMISSION_RATE if total_pop > 0 else 0.0
+
+    def age_derivatives(self, t, y):
+        """Time derivatives of the packed state (group matrix, cumulative counters, environment)."""
+        size = NUM_COMPARTMENTS * NUM_GROUPS
+        X = y[:size].reshape(NUM_COMPARTMENTS, NUM_GROUPS)
+        environmental_contagion = y[size + 2]
+        infection_pressure = self.infection_pressure(t, X, environmental_contagion)
+
+        # Aging and background mortality act on every compartment
+        dX = X @ self.aging_matrix - X * self.death_rates
+
+        # Births into the maternally immune newborn groups
+        daily_births = X[:, self.female_groups].sum() * FEMALE_BIRTH_RATE
+        dX[M, 0] += daily_births * NEWBORN_MALE_FRACTION
+        dX[M, NUM_AGE_BINS] += daily_births * (1.0 - NEWBORN_MALE_FRACTION)
+
+        flow_M_to_S = X[M] / MATERNAL_IMMUNITY_DURATION
+        flow_S_to_P = X[S] * infection_pressure
+        flow_V_to_P = X[V] * (0.05 * infection_pressure * 0.1)
+        flow_P_out = X[P] / PREPATENT_DURATION[0]
+        flow_P_to_A = flow_P_out * PROB_ACUTE_AFTER_PREPATENT
+        flow_A_out = X[A] * self.acute_exit_rates
+        flow_A_to_C = flow_A_out * self.prob_a_to_c
+        flow_U_out = X[U] * self.subclinical_exit_rates
+        flow_U_to_C = flow_U_out * self.prob_u_to_c
+        flow_R_to_S = X[R] / RECOVERY_DURATION[0]
+        flow_V_to_S = X[V] / Vaccine.duration[0]
+        disease_deaths_A = X[A] * (ACUTE_MORTALITY_RATE / 365.0)
+
+        dX[S] += flow_M_to_S + flow_R_to_S + flow_V_to_S - flow_S_to_P
+        dX[M] -= flow_M_to_S
+        dX[P] += flow_S_to_P + flow_V_to_P - flow_P_out
+        dX[A] += flow_P_to_A - flow_A_out - disease_deaths_A
+        dX[U] += flow_P_out - flow_P_to_A - flow_U_out
+        dX[C] += flow_A_to_C + flow_U_to_C
+        dX[R] += flow_A_out - flow_A_to_C + flow_U_out - flow_U_to_C - flow_R_to_S
+        dX[V] += -flow_V_to_S - flow_V_to_P
+
+        d_environment = 0.0
+        if ENABLE_ENVIRONMENTAL_TRANSMISSION:
+            num_shedding = X[[P, A, U, C]].sum() * 0.8
+            d_environment = num_shedding * self.environmental_shedding_rate - self.environmental_decay_rate * environmental_contagion
+        return np.concatenate([dX.ravel(), [(flow_S_to_P + flow_V_to_P).sum(), flow_P_to_A.sum(), d_environment]])
+
+    def step(self, day):
+        """Advances one day and returns the day's state counts and environment variables."""
+        return self.advance(day - 1, 1)[0]
+
+    def advance(self, start_day, n_days):
+        """
+        Advances n_days days after start_day with daily RK4 steps.
+
+        Returns:
+            list: One record per day in the same format as CompartmentalModel.step().
+        """
+        records = []
+        y = self._pack()
+        dt = self.time_step
+        for d in range(n_days):
+            day = start_day + d + 1
+            previous_environment = self.environmental_contagion
+            previous_cumulative = self.cumulative.copy()
+
+            k1 = self.age_derivatives(day, y)
+            k2 = self.age_derivatives(day + 0.5 * dt, y + 0.5 * dt * k1)
+            k3 = self.age_derivatives(day + 0.5 * dt, y + 0.5 * dt * k2)
+            k4 = self.age_derivatives(day + dt, y + dt * k3)
+            y = np.maximum(y + (dt / 6.0) * (k1 + 2 * k2 + 2 * k3 + k4), 0.0) # Clamp to 0
+            self._unpack(y)
+            self._sync_state()
+
+            num_shedding = self.groups[[P, A, U, C]].sum() * 0.8
+            hazard_factor = 0.0
+            seasonality_multiplier = 1.0
+            if ENABLE_ENVIRONMENTAL_TRANSMISSION:
+                seasonality_multiplier = self.get_seasonality_multiplier(day)
+                hazard_factor = self.environmental_contagion / (self.k_half + self.environmental_contagion) if self.environmental_contagion > 0 else 0.0
+
+            record = {'day': day}
+            record.update(self._state_counts_record())
+            record.update({
+                'contagion': self.environmental_contagion,
+                'infection_pressure': float(self.infection_pressure(day, self.groups, self.environmental_contagion)),
+                'seasonality_multiplier': seasonality_multiplier,
+                'hazard_factor': hazard_factor,
+                'new_contagion_inc': previous_environment * np.exp(-1.0 * self.environmental_decay_rate),
+                'num_environmentally_shedding': num_shedding * self.environmental_shedding_rate,
+                'num_shedding_agents': float(num_shedding),
+                'yearly_new_infections': float(self.cumulative[0] - previous_cumulative[0]),
+                'num_acute_cases_yearly': float(self.cumulative[1] - previous_cumulative[1])
+            })
+            records.append(record)
+        return records
+
+    def vaccinate(self, year):
+        """Vaccinates Vaccine.coverage of the susceptible, recovered and prepatent people in the target age groups."""
+        if not Vaccine.is_enabled or year < Vaccine.start_year:
+            return
+        # Eligibility follows Model.vaccinate: S, R and P inside the target ages
+        moved = self.groups[[S, R, P]] * (vaccination_target_shares() * Vaccine.coverage)
+        self.groups[[S, R, P]] -= moved
+        self.groups[V] += moved.sum(axis=0)
+        self._sync_state()
+        print(f"Year {year}: Vaccinating approx {int(moved.sum())} people.")
+
+    def age_pyramid(self):
+        """Returns the male and female head counts per pyramid age bin."""
+        alive = self.groups.sum(axis=0)
+        return alive[:NUM_AGE_BINS], alive[NUM_AGE_BINS:]
@@ -1,19 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify
-import subprocess
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, stream_with_context
 import json
-import plotly
+import os
 import threading
-import visualize
-import visualize_summary
-import visualize_sir
-import visualize_environment
-import visualize_vaccination
 import initialparaandconst as const
+from engine import ENGINES
+from model import initial_infected_count_for
+from jobs import JobManager, QueueFullError, JobTooLargeError, MAX_JOB_TIME, MAX_BACKLOG
+from sessions import SessionManager, SessionLimitError, DEFAULT_SESSION_POPULATION, simulated_date
 
 app = Flask(__name__)
 
-# Global status tracking for the background simulation
-simulation_status = {"running": False, "error": None}
+# Simulation jobs run in persistent worker processes, started on the first /run
+# (so the debug reloader's parent process does not start a pool of its own).
+_job_manager = None
+_job_manager_lock = threading.Lock()
+# Interactive sessions (/state, /step, /reset) keep a live model in a worker process each
+_session_manager = None
+
+
+def get_job_manager():
+    global _job_manager
+    with _job_manager_lock:
+        if _job_manager is None:
+            _job_manager = JobManager(max_job_time=MAX_JOB_TIME, max_backlog=MAX_BACKLOG)
+        return _job_manager
+
+
+def get_session_manager():
+    global _session_manager
+    with _job_manager_lock:
+        if _session_manager is None:
+            _session_manager = SessionManager()
+        return _session_manager
+
 
 @app.route('/', methods=['GET'])
 def index():
@@ -21,6 +40,7 @@ def index():
     defaults = {
         "initial_population": const.INITIAL_POPULATION,
         "simulation_years": const.SIMULATION_YEARS,
+        "engine": const.SIMULATION_ENGINE,
         "female_birth_rate": const.FEMALE_BIRTH_RATE * 365.0,  # back to annual for UI
         "male_birth_rate": const.MALE_BIRTH_RATE * 365.0,  # back to annual for UI
         "transmission_rate": const.TRANSMISSION_RATE,
@@ -42,14 +62,20 @@ def index():
         "vaccine_duration_std": const.Vaccine.duration[1] if hasattr(const.Vaccine, "duration") else None,
     }
 
-    # Load existing figures if a previous run succeeded
-    graphs = {}
+    # Load the figures of the latest finished job (or of the latest run in the
+    # working directory) from the figure cache. The plotting modules are only
+    # imported if the cache has to be rebuilt.
     try:
-        graphs["summary"] = json.dumps(visualize_summary.get_figure(), cls=plotly.utils.PlotlyJSONEncoder)
-        graphs["pyramid"] = json.dumps(visualize.get_figure(), cls=plotly.utils.PlotlyJSONEncoder)
-        graphs["sir"] = json.dumps(visualize_sir.get_figure(), cls=plotly.utils.PlotlyJSONEncoder)
-        graphs["environment"] = json.dumps(visualize_environment.get_figure(), cls=plotly.utils.PlotlyJSONEncoder)
-        graphs["vaccination"] = json.dumps(visualize_vaccination.get_figure(), cls=plotly.utils.PlotlyJSONEncoder)
+        from figure_cache import load_figures
+        job = _job_manager.latest_finished() if _job_manager is not None else None
+        if request.args.get('run'): # A catalogued run (see /api/runs)
+            from run_catalog import get_run
+            run = get_run(request.args['run'])
+            graphs = load_figures(run['name'], run['directory']) if run is not None else None
+        elif job is not None:
+            graphs = load_figures(job['result_name'], job['directory'])
+        else:
+            graphs = load_figures()
     except Exception as e:
         print(f"Could not load graphs: {e}")
         graphs = None
@@ -58,75 +84,102 @@ def index():
         "index.html",
         defaults=defaults,
         graphs=graphs,
-        simulation_running=simulation_status["running"],
+        simulation_running=_job_manager is not None and _job_manager.summary()['running'] > 0,
     )
 
-def _run_simulation():
-    """Background worker that runs the simulation and updates status."""
-    global simulation_status
-    simulation_status = {"running": True, "error": None}
-    print("Starting simulation in background thread...")
-    try:
-        subprocess.run(["python", "runmain.py"], check=True)
-        simulation_status = {"running": False, "error": None}
-        print("Simulation completed successfully.")
-    except subprocess.CalledProcessError as e:
-        simulation_status = {"running": False, "error": str(e)}
-        print(f"Simulation failed: {e}")
-    except Exception as e:
-        simulation_status = {"running": False, "error": str(e)}
-        print(f"Unexpected error during simulation: {e}")
+def _job_request(data, is_json, default_population=100000):
+    """
+    Reads a job's engine, model parameters, duration and vaccine settings from
+    the form (or a JSON body); default_population stands in for a missing
+    initial_population.
+
+    Returns:
+        Tuple: (engine name, model parameters, years, vaccine settings).
+
+    Raises:
+        ValueError: If the duration, population or infected count is out of range.
+    """
+    def flag(name):
+        return bool(data.get(name)) if is_json else name in data
+
+    engine_name = data.get('engine', const.SIMULATION_ENGINE)
+    params = {
+        'initial_population': int(data.get('initial_population', default_population)),
+        'base_transmission_risk': float(data.get('base_transmission_risk', 0.005)),
+    }
+    if params['initial_population'] < 1:
+        raise ValueError("initial_population must be at least 1")
+    if data.get('initial_infected_count') not in (None, ''):
+        params['initial_infected_count'] = int(data['initial_infected_count'])
+    # Checks the count (and fills in the default scaled to the population)
+    params['initial_infected_count'] = initial_infected_count_for(params['initial_population'], params.get('initial_infected_count'))
+    for name in ('k_half', 'environmental_shedding_rate', 'environmental_decay_rate'):
+        if data.get(name) not in (None, ''):
+            params[name] = float(data[name])
+    if engine_name == 'abm':
+        # Birth rates are entered per year
+        params['female_birth_rate'] = float(data.get('female_birth_rate', 0.028)) / 365.0
+        if data.get('male_birth_rate') not in (None, ''):
+            params['male_birth_rate'] = float(data['male_birth_rate']) / 365.0
+    vaccine = {
+        'is_enabled': flag('vaccine_enabled'),
+        'start_year': int(data.get('vaccine_start_year', 1)),
+        'coverage': float(data.get('vaccine_coverage', 0.8)),
+        'efficacy': float(data.get('vaccine_efficacy', 0.9)),
+    }
+    years = int(data.get('simulation_years', 20))
+    if years < 1:
+        raise ValueError("simulation_years must be at least 1")
+    return engine_name, params, years, vaccine
+
 
 @app.route('/run', methods=['POST'])
 def run_simulation():
-    # Prevent starting another simulation while one is already running
-    if simulation_status["running"]:
-        return "Simulation already in progress.", 409
-
-    # Extract form data
-    initial_population = int(request.form.get('initial_population', 100000))
-    simulation_years = int(request.form.get('simulation_years', 20))
-    female_birth_rate = float(request.form.get('female_birth_rate', 0.028)) / 365.0
-    transmission_rate = float(request.form.get('transmission_rate', 0.1))
-    initial_infected_count = int(request.form.get('initial_infected_count', 3200))
-    enable_environmental = 'enable_environmental' in request.form
-    base_transmission_risk = float(request.form.get('base_transmission_risk', 0.005))
-    vaccine_enabled = 'vaccine_enabled' in request.form
-    vaccine_start_year = int(request.form.get('vaccine_start_year', 1))
-    vaccine_coverage = float(request.form.get('vaccine_coverage', 0.8))
-    vaccine_efficacy = float(request.form.get('vaccine_efficacy', 0.9))
-
-    # Write config_override.py based on user input
-    override_content = f"""
-# Auto-generated configuration override
-INITIAL_POPULATION = {initial_population}
-SIMULATION_YEARS = {simulation_years}
-FEMALE_BIRTH_RATE = {female_birth_rate}
-TRANSMISSION_RATE = {transmission_rate}
-INITIAL_INFECTED_COUNT = {initial_infected_count}
-
-ENABLE_ENVIRONMENTAL_TRANSMISSION = {enable_environmental}
-BASE_TRANSMISSION_RISK = {base_transmission_risk}
-
-class VaccineOverride:
-    is_enabled = {vaccine_enabled}
-    start_year = {vaccine_start_year}
-    target_group_min_age = 9
-    target_group_max_age = 60
-    coverage = {vaccine_coverage}
-    efficacy = {vaccine_efficacy}
-    duration = (5 * 365, 60)
-
-Vaccine = VaccineOverride
-"""
-    with open('config_override.py', 'w') as f:
-        f.write(override_content)
-
-    # Launch simulation in a daemon thread so Flask can continue serving requests
-    thread = threading.Thread(target=_run_simulation, daemon=True)
-    thread.start()
-
-    return redirect(url_for('loading'))
+    is_json = request.is_json
+    data = request.get_json() if is_json else request.form
+    try:
+        engine_name, params, years, vaccine = _job_request(data, is_json)
+    except (TypeError, ValueError) as e:
+        return f"Invalid parameters: {e}", 400
+    if engine_name not in ENGINES:
+        return f"Unknown engine '{engine_name}'.", 400
+
+    manager = get_job_manager()
+    try:
+        job_id = manager.submit(engine_name, params, years, vaccine)
+    except JobTooLargeError as e:
+        return str(e), 413
+    except QueueFullError as e:
+        return str(e), 503
+
+    if is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id),
+                        'estimate': manager.status(job_id)['estimate']}), 202
+    return redirect(url_for('loading', job=job_id))
+
+@app.route('/api/estimate', methods=['GET', 'POST'])
+def estimate_run():
+    """
+    Estimated wall time and peak memory of a /run request (same fields, as a form,
+    JSON body or query string), and whether the job queue would admit it now.
+    Answers 503 while the cost model is still calibrating.
+    """
+    is_json = request.is_json
+    data = request.get_json() if is_json else request.values
+    try:
+        engine_name, params, years, _ = _job_request(data, is_json)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameters: {e}"}), 400
+    if engine_name not in ENGINES:
+        return jsonify({"error": f"Unknown engine '{engine_name}'."}), 400
+    manager = get_job_manager()
+    estimate = manager.estimate(engine_name, params, years)
+    if estimate is None:
+        return jsonify({"error": "The cost model is still calibrating; try again shortly"}), 503
+    error = manager.admission_error(estimate)
+    estimate['admitted'] = error is None
+    estimate['reason'] = str(error) if error is not None else None
+    return jsonify(estimate)
 
 @app.route('/loading')
 def loading():
@@ -134,7 +187,248 @@ def loading():
 
 @app.route('/status')
 def status():
-    return jsonify(simulation_status)
+    # Overall view across jobs (the per-job state is at /status/<job_id>)
+    if _job_manager is None:
+        return jsonify({"running": False, "error": None, "jobs": {}})
+    counts = _job_manager.summary()
+    return jsonify({"running": counts['running'] + counts['queued'] > 0, "error": None, "jobs": counts})
+
+@app.route('/status/<job_id>')
+def job_status(job_id):
+    job = _job_manager.status(job_id) if _job_manager is not None else None
+    if job is None:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    return jsonify(job)
+
+@app.route('/stream/<job_id>')
+def stream_job(job_id):
+    """
+    Server-sent events for a job: 'progress' events with the current day and year,
+    the throughput and the latest state counts and environment variables, plus the
+    daily 'sir' and 'environment' records added since the previous event (so the
+    client can extend its partial curves), then a final 'done' or 'error' event.
+    ?since=<n> skips the first n daily records (e.g. when reconnecting).
+    """
+    if _job_manager is None or _job_manager.status(job_id) is None:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    since = request.args.get('since', 0, type=int)
+
+    def events():
+        sent = since
+        while True:
+            job, sir, environment = _job_manager.wait_for_update(job_id, sent)
+            if job is None:
+                return
+            if sir:
+                sent += len(sir)
+                payload = dict(job['progress'] or {}, state=job['state'], sir=sir, environment=environment)
+                yield f"event: progress\nid: {sent}\ndata: {json.dumps(payload)}\n\n"
+            elif job['state'] in ('done', 'error'):
+                yield f"event: {job['state']}\ndata: {json.dumps(job)}\n\n"
+                return
+            else:
+                yield ": keep-alive\n\n"
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
+@app.route('/api/runs')
+def runs_api():
+    """
+    Catalogued runs (see run_catalog.py), newest first. Any catalog column can be
+    filtered by value (?engine=abm) or range (?k_half_min=1e6&k_half_max=1e8);
+    ?limit= caps the number of runs (default 100).
+    """
+    from run_catalog import find_runs, FILTER_COLUMNS
+
+    filters = {}
+    for key, value in request.args.items():
+        if key == 'limit':
+            continue
+        name, bound = key, None
+        if key.endswith(('_min', '_max')) and key[:-4] in FILTER_COLUMNS:
+            name, bound = key[:-4], key[-3:]
+        if name not in FILTER_COLUMNS:
+            return jsonify({"error": f"Unknown filter '{key}'"}), 400
+        if FILTER_COLUMNS[name] != 'TEXT':
+            try:
+                value = float(value)
+            except ValueError:
+                return jsonify({"error": f"Filter '{key}' must be a number"}), 400
+        if bound is None:
+            filters[name] = value
+        else:
+            low, high = filters.get(name, (None, None))
+            filters[name] = (value, high) if bound == 'min' else (low, value)
+    runs = find_runs(limit=request.args.get('limit', 100, type=int), **filters)
+    return jsonify({'runs': runs})
+
+@app.route('/api/history/<kind>')
+def history_api(kind):
+    """
+    Columnar daily history ('sir' or 'environment') of one or more runs, decimated
+    for plotting. Query parameters:
+        job / run / name: job id, catalog id or run name to read (repeatable; default: the latest run)
+        variables: comma-separated variables (default: all)
+        start, end: day range
+        points: pixel budget per series (default 1000; 0 disables decimation)
+        method: 'lttb' (default) or 'minmax'
+    The response is gzip-compressed when the client accepts it.
+    """
+    import gzip
+    from downsampling import history_columns, downsample_columns, METHODS
+    from results import history_path
+
+    if kind not in ('sir', 'environment'):
+        return jsonify({"error": "kind must be 'sir' or 'environment'"}), 404
+    method = request.args.get('method', 'lttb')
+    if method not in METHODS:
+        return jsonify({"error": f"method must be one of: {', '.join(METHODS)}"}), 400
+    points = request.args.get('points', 1000, type=int)
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+    variables = [name for name in request.args.get('variables', '').split(',') if name] or None
+
+    runs = {}
+    for job_id in request.args.getlist('job'):
+        job = _job_manager.status(job_id) if _job_manager is not None else None
+        if job is None or job['state'] != 'done':
+            return jsonify({"error": f"No finished job '{job_id}'"}), 404
+        runs[job_id] = history_path(kind, job['result_name'], job['directory'])
+    if request.args.getlist('run'):
+        from run_catalog import get_run
+        for run_id in request.args.getlist('run'):
+            run = get_run(run_id) if run_id.isdigit() else None
+            if run is None:
+                return jsonify({"error": f"No catalogued run '{run_id}'"}), 404
+            runs[run_id] = history_path(kind, run['name'], run['directory'])
+    for name in request.args.getlist('name'):
+        if not name or os.path.basename(name) != name: # Names only, never paths out of the output directory
+            return jsonify({"error": f"Invalid run name '{name}'"}), 400
+        runs[name] = history_path(kind, name)
+    if not runs:
+        runs['latest'] = history_path(kind)
+
+    payload = {'kind': kind, 'method': method, 'points': points, 'runs': {}}
+    try:
+        for run_id, path in runs.items():
+            columns = history_columns(path, variables, start, end)
+            if points > 0:
+                payload['runs'][run_id] = downsample_columns(columns, points, method)
+            else:
+                payload['runs'][run_id] = {name: {'day': columns['day'].tolist(), 'value': values.tolist()}
+                                           for name, values in columns.items() if name != 'day'}
+    except FileNotFoundError as e:
+        return jsonify({"error": f"History not found: {e.filename}"}), 404
+    except KeyError as e:
+        return jsonify({"error": str(e.args[0])}), 400
+
+    body = json.dumps(payload).encode()
+    response = Response(body, mimetype='application/json')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body, compresslevel=5))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def _session_id(data):
+    return data.get('session_id') or request.args.get('session', 'default')
+
+def _session_response(summary, **extra):
+    """JSON reply of an interactive session request, with the current population pyramid as 'graph'."""
+    import plotly
+    from visualize import get_snapshot_figure
+    figure = get_snapshot_figure(summary['snapshot'], title=f"Population on {summary['date']}")
+    summary['graph'] = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+    summary.pop('yearly_snapshots', None)
+    summary.update(extra)
+    return jsonify(summary)
+
+def _session_call(method, *args):
+    """Runs a SessionManager call, mapping its failures to HTTP errors."""
+    try:
+        return method(*args), None
+    except SessionLimitError as e:
+        return None, (jsonify({"error": str(e)}), 503)
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({"error": f"Invalid parameters: {e}"}), 400)
+    except RuntimeError as e:
+        return None, (jsonify({"error": str(e)}), 500)
+    except (EOFError, BrokenPipeError, ConnectionResetError):
+        # The session manager has dropped the session; the next request opens a new one
+        return None, (jsonify({"error": "The session's worker exited; the session has been closed"}), 503)
+
+@app.route('/state', methods=['GET'])
+def session_state():
+    """Current state of an interactive session (?session=<id>, default 'default')."""
+    summary, error = _session_call(get_session_manager().state, _session_id({}))
+    return error or _session_response(summary)
+
+@app.route('/step', methods=['POST'])
+def session_step():
+    """
+    Advances an interactive session by 'days' days (JSON body or query, default 1)
+    and returns the new counts, their changes and the daily records of those days.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        days = int(data.get('days', request.args.get('days', 1)))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameters: {e}"}), 400
+    summary, error = _session_call(get_session_manager().step, _session_id(data), days)
+    return error or _session_response(summary)
+
+@app.route('/reset', methods=['POST'])
+def session_reset():
+    """
+    Re-initializes an interactive session at 2020-01-01, with the engine, model
+    parameters and vaccine settings of a /run request (JSON body or form).
+    """
+    is_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if is_json else request.form
+    try:
+        engine_name, params, _, vaccine = _job_request(data, is_json, default_population=DEFAULT_SESSION_POPULATION)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameters: {e}"}), 400
+    if engine_name not in ENGINES:
+        return jsonify({"error": f"Unknown engine '{engine_name}'."}), 400
+    if data.get('base_transmission_risk') in (None, ''):
+        del params['base_transmission_risk'] # The model's default, not the /run form's
+    summary, error = _session_call(get_session_manager().reset, _session_id(data), engine_name, params, vaccine)
+    return error or _session_response(summary)
+
+@app.route('/run_duration', methods=['POST'])
+def session_run_duration():
+    """
+    Advances an interactive session by 'years' years and returns its yearly
+    history since the last reset: one frame per year with the date, population
+    and population pyramid.
+    """
+    import plotly
+    from visualize import get_snapshot_figure
+
+    data = request.get_json(silent=True) or {}
+    session_id = _session_id(data)
+    try:
+        days = int(float(data.get('years', 1)) * 365)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid parameters: {e}"}), 400
+    manager = get_session_manager()
+    summary, error = _session_call(manager.step, session_id, days)
+    if error:
+        return error
+    summary.pop('daily') # Years of daily records are too much for one reply (use /step)
+    history = []
+    for snapshot in manager.snapshots(session_id):
+        date = simulated_date(snapshot['year'] * 365)
+        history.append({
+            'year': snapshot['year'],
+            'date': date,
+            'population': snapshot['total_population'],
+            'graph': json.dumps(get_snapshot_figure(snapshot, title=f"Population on {date}"),
+                                cls=plotly.utils.PlotlyJSONEncoder),
+        })
+    return _session_response(summary, history=history)
 
 if __name__ == '__main__':
     app.run(debug=True, threaded=True)
@@ -0,0 +1,211 @@
+"""
+Bayesian-optimization tuner for the model parameters.
+
+unified_tuning.py runs the full Cartesian product of PARAM_GRID, so every
+extra value multiplies the number of runs. This tuner instead fits a Gaussian
+process to the losses of the runs completed so far and proposes the next
+batch where the expected improvement is largest:
+
+    target = target_from_result(SimulationResult.load(name))
+    tuned = bayesian_tune(incidence_loss(target), engine='abm', duration_years=10,
+                          initial_population=10000, initial_infected_count=300, max_evaluations=30)
+    tuned['parameters'], tuned['loss']
+
+The loss is any function of a SimulationResult (lower is better). Each batch
+runs in parallel through parallel_runs.run_simulations; the points within a
+batch are chosen one after another with the pending ones added at their
+predicted loss ("kriging believer"), so they do not pile onto one optimum.
+Ranges use the global_sensitivity format {parameter: (low, high, 'log' | 'linear')}.
+"""
+import os
+import time
+from math import erf
+import numpy as np
+from calibration import target_from_result
+from global_sensitivity import DEFAULT_RANGES, scale_samples, unit_samples
+from parallel_runs import run_simulations
+
+
+def incidence_loss(target, observable='infections'):
+    """
+    Builds a loss comparing a run's yearly incidence (years 1..N) with a target
+    series: the squared error relative to the mean target, summed over years.
+    """
+    target = np.asarray(target, dtype=float)
+    scale = max(float(np.mean(np.abs(target))), 1.0)
+
+    def loss(result):
+        incidence = target_from_result(result, observable)[:len(target)]
+        errors = (incidence - target[:len(incidence)]) / scale
+        return float(errors @ errors)
+    return loss
+
+
+class GaussianProcess:
+    """
+    Gaussian-process regression on the unit hypercube with a Matern 5/2 kernel,
+    one length scale per dimension. The hyperparameters maximize the marginal
+    likelihood over a random set of candidates, which keeps the fit dependency-free.
+    """
+
+    def __init__(self, n_candidates=256, seed=None):
+        self.n_candidates = n_candidates
+        self.rng = np.random.default_rng(seed)
+        self.length_scales = None
+        self.noise = 1e-6
+
+    @staticmethod
+    def _kernel(X1, X2, length_scales):
+        distance = np.sqrt(np.sum(((X1[:, None, :] - X2[None, :, :]) / length_scales) ** 2, axis=2))
+        scaled = np.sqrt(5.0) * distance
+        return (1.0 + scaled + scaled ** 2 / 3.0) * np.exp(-scaled)
+
+    def _log_likelihood(self, X, y, length_scales, noise):
+        K = self._kernel(X, X, length_scales) + (noise + 1e-10) * np.eye(len(X))
+        try:
+            L = np.linalg.cholesky(K)
+        except np.linalg.LinAlgError:
+            return -np.inf
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        return -0.5 * y @ alpha - np.sum(np.log(np.diag(L)))
+
+    def fit(self, X, y, optimize=True):
+        """Fits to points X (n x d, in [0, 1]) and values y. optimize=False keeps the current hyperparameters."""
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.mean = y.mean()
+        self.std = y.std() if y.std() > 0 else 1.0
+        self.y = (y - self.mean) / self.std
+        if optimize or self.length_scales is None:
+            d = self.X.shape[1]
+            candidates = np.exp(self.rng.uniform(np.log(0.05), np.log(2.0), size=(self.n_candidates, d)))
+            noises = np.exp(self.rng.uniform(np.log(1e-6), np.log(1e-1), size=self.n_candidates))
+            if self.length_scales is not None: # Keep the previous fit in the running
+                candidates[0], noises[0] = self.length_scales, self.noise
+            scores = [self._log_likelihood(self.X, self.y, ls, noise) for ls, noise in zip(candidates, noises)]
+            best = int(np.argmax(scores))
+            self.length_scales, self.noise = candidates[best], noises[best]
+        K = self._kernel(self.X, self.X, self.length_scales) + (self.noise + 1e-10) * np.eye(len(self.X))
+        self.L = np.linalg.cholesky(K)
+        self.alpha = np.linalg.solve(self.L.T, np.linalg.solve(self.L, self.y))
+        return self
+
+    def predict(self, X):
+        """Posterior mean and standard deviation at the points X, in the units of y."""
+        K_star = self._kernel(np.asarray(X, dtype=float), self.X, self.length_scales)
+        mean = K_star @ self.alpha
+        v = np.linalg.solve(self.L, K_star.T)
+        variance = np.maximum(1.0 - np.sum(v ** 2, axis=0), 1e-12)
+        return self.mean + self.std * mean, self.std * np.sqrt(variance)
+
+
+def expected_improvement(mean, std, best, xi=0.01):
+    """Expected improvement below best (minimization) of a Gaussian prediction."""
+    improvement = best - mean - xi
+    z = improvement / std
+    cdf = 0.5 * (1.0 + np.vectorize(erf)(z / np.sqrt(2.0)))
+    pdf = np.exp(-0.5 * z ** 2) / np.sqrt(2.0 * np.pi)
+    return improvement * cdf + std * pdf
+
+
+def _propose_batch(gp, X, y, batch_size, rng, n_candidates=2000):
+    """Picks batch_size points by maximizing EI, adding each pick at its predicted value."""
+    d = X.shape[1]
+    X_fit, y_fit = X.copy(), y.copy()
+    batch = []
+    for _ in range(batch_size):
+        best = y_fit.min()
+        # Random points plus local perturbations of the best points so far
+        incumbents = X_fit[np.argsort(y_fit)[:5]]
+        local = incumbents[rng.integers(0, len(incumbents), n_candidates // 2)] + rng.normal(0.0, 0.05, (n_candidates // 2, d))
+        candidates = np.clip(np.vstack([rng.random((n_candidates - len(local), d)), local]), 0.0, 1.0)
+        mean, std = gp.predict(candidates)
+        choice = candidates[int(np.argmax(expected_improvement(mean, std, best)))]
+        batch.append(choice)
+        X_fit = np.vstack([X_fit, choice])
+        y_fit = np.append(y_fit, gp.predict(choice[None, :])[0])
+        gp.fit(X_fit, y_fit, optimize=False)
+    return np.array(batch)
+
+
+def bayesian_tune(loss, ranges=None, engine='abm', duration_years=None, max_evaluations=30, n_initial=None,
+                  batch_size=None, target_loss=None, log_loss=True, workers=None, seed=None, **engine_kwargs):
+    """
+    Minimizes a loss over the parameter ranges with batched Bayesian optimization.
+
+    Args:
+        loss (callable): Maps a SimulationResult to a float (lower is better), e.g. incidence_loss(target).
+        ranges (dict): {parameter: (low, high, 'log' | 'linear')}; defaults to
+            global_sensitivity.DEFAULT_RANGES.
+        engine (str): Engine name ('abm', 'ode', 'stochastic', ...).
+        duration_years (int): Length of every run.
+        max_evaluations (int): Budget of model runs.
+        n_initial (int): Size of the initial space-filling batch (default 2 * d + 1, at most max_evaluations).
+        batch_size (int): Runs per batch after the initial one (default: the number of workers).
+        target_loss (float): Stop once a run reaches this loss.
+        log_loss (bool): Model log(loss) instead of the loss (losses spanning orders of magnitude).
+        workers (int): Worker processes (see parallel_runs.run_simulations).
+        seed (int): Seeds the design, the surrogate and the runs.
+        **engine_kwargs: Fixed parameters shared by every run.
+
+    Returns:
+        dict: Best 'parameters' and 'loss' (None and inf if no run produced a finite
+        loss), every evaluated 'samples' and 'losses' in run order, 'evaluations', 'batches', 'reached_target' and 'wall_time'.
+    """
+    start_time = time.perf_counter()
+    ranges = ranges if ranges is not None else DEFAULT_RANGES
+    d = len(ranges)
+    workers = workers if workers is not None else os.cpu_count() or 1
+    n_initial = min(n_initial if n_initial is not None else 2 * d + 1, max_evaluations)
+    batch_size = batch_size if batch_size is not None else max(workers, 1)
+    rng = np.random.default_rng(seed)
+    gp = GaussianProcess(seed=seed)
+
+    X = np.empty((0, d))
+    losses = np.empty(0)
+    samples = []
+    batches = 0
+    unit = unit_samples(n_initial, d, seed)
+    while True:
+        batch_samples = scale_samples(unit, ranges)
+        results = run_simulations(batch_samples, engine, duration_years, workers,
+                                  seed=(seed or 0) + len(samples), **engine_kwargs)
+        batch_losses = np.array([loss(result) for result in results], dtype=float)
+        X = np.vstack([X, unit])
+        losses = np.append(losses, batch_losses)
+        samples.extend(batch_samples)
+        batches += 1
+        # Failed runs (NaN or infinite losses) are never the best and are left out of the fit
+        finite = np.flatnonzero(np.isfinite(losses))
+        best = int(finite[np.argmin(losses[finite])]) if len(finite) else None
+        best_loss = losses[best] if best is not None else np.inf
+        print(f"Batch {batches}: {len(unit)} runs, best loss so far {best_loss:.4g} ({len(samples)} evaluations)")
+
+        reached_target = target_loss is not None and best_loss <= target_loss
+        remaining = max_evaluations - len(samples)
+        if reached_target or remaining <= 0:
+            break
+        if best is None: # Nothing to fit yet; try another random batch
+            unit = rng.random((min(batch_size, remaining), d))
+            continue
+        y = np.log(np.maximum(losses[finite], 1e-300)) if log_loss else losses[finite]
+        gp.fit(X[finite], y)
+        unit = _propose_batch(gp, X[finite], y, min(batch_size, remaining), rng)
+
+    if best is None:
+        print("Warning: no run produced a finite loss")
+    report = {
+        'parameters': samples[best] if best is not None else None,
+        'loss': float(best_loss),
+        'samples': samples,
+        'losses': losses,
+        'evaluations': len(samples),
+        'batches': batches,
+        'reached_target': bool(reached_target),
+        'wall_time': time.perf_counter() - start_time,
+    }
+    print(f"Bayesian tuning finished after {report['evaluations']} runs in {report['batches']} batches "
+          f"({report['wall_time']:.2f} s): loss={report['loss']:.4g}")
+    for name, value in (report['parameters'] or {}).items():
+        print(f"  {name} = {value:.4e}")
+    return report
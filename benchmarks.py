@@ -0,0 +1,295 @@
+"""
+Benchmarks of the simulation hot paths.
+
+    python benchmarks.py                     # every case, populations 1e4 to 1e7
+    python benchmarks.py --quick             # populations up to 1e6, shorter timings
+    python benchmarks.py --cases daily_step vaccinate --populations 1e5 1e6
+
+Each case runs in a fresh process, so its peak resident memory and its kernel
+compile (or cache load) time are its own; the compile time is reported apart
+from the timed repeats. Throughput is reported per case in its natural unit
+(agent-days per second for the daily step). Every result is appended to
+BENCHMARK_RESULTS_FILE with the host and git commit, and its best-case
+throughput is compared with the recent results of the same case on the same
+host, so regressions show up:
+
+    daily_step       N=1,000,000   median 41.2 ms   2.43e+07 agent-days/s   ...   -3.1%
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_RESULTS_FILE = 'benchmark_results.jsonl'
+DEFAULT_POPULATIONS = (10000, 100000, 1000000, 10000000)
+QUICK_POPULATIONS = (10000, 100000, 1000000)
+MIN_TIME = 1.0 # Seconds of timed repeats per case (at least MIN_REPEATS)
+MIN_REPEATS = 3
+REGRESSION_THRESHOLD = 0.15 # Throughput drop flagged as a regression
+BASELINE_WINDOW = 5 # Previous results per case whose median is the baseline
+
+
+def _peak_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _timed(function, setup=None, min_time=MIN_TIME):
+    """Times repeated calls of function (setup runs untimed before each one). Returns the durations."""
+    durations = []
+    while len(durations) < MIN_REPEATS or sum(durations) < min_time:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def _new_model(population, initialize=True):
+    from model import Model, set_seed
+    from initialparaandconst import MALE_BIRTH_RATE, FEMALE_BIRTH_RATE
+
+    set_seed(0)
+    model = Model(population, MALE_BIRTH_RATE, FEMALE_BIRTH_RATE, initial_infected_count=population * 3 // 100)
+    if initialize:
+        model.initialize_population()
+    return model
+
+
+def _agent_arrays(model):
+    from model import AGENT_ARRAYS
+    return {name: getattr(model, name).copy() for name in AGENT_ARRAYS}
+
+
+def _restore(model, arrays):
+    for name, values in arrays.items():
+        setattr(model, name, values.copy())
+
+
+# --- Cases: each returns (durations, work per call, rate unit) ---
+
+def bench_daily_step(population, min_time):
+    """The compiled daily step (kernels._daily_step_numba) alone, always from the same initial day."""
+    model = _new_model(population)
+    # The kernel updates the agent arrays in place (deaths, transitions); every repeat starts from the snapshot
+    arrays = _agent_arrays(model)
+    durations = _timed(lambda: model._call_kernel(1), setup=lambda: _restore(model, arrays), min_time=min_time)
+    return durations, population, 'agent-days/s'
+
+
+def bench_add_agents(population, min_time):
+    """One day's births appended to every agent array."""
+    from initialparaandconst import FEMALE_BIRTH_RATE
+    model = _new_model(population)
+    arrays = _agent_arrays(model)
+    births = max(1, int(population * FEMALE_BIRTH_RATE / 2))
+    durations = _timed(lambda: model.add_agents(births), setup=lambda: _restore(model, arrays), min_time=min_time)
+    return durations, population, 'agents/s'
+
+
+def bench_compaction(population, min_time):
+    """Dropping the dead from every agent array once 10% have died."""
+    import numpy as np
+    model = _new_model(population)
+    model.is_alive[np.random.default_rng(0).random(population) < 0.1] = False
+    arrays = _agent_arrays(model)
+    return _timed(model.compact, setup=lambda: _restore(model, arrays), min_time=min_time), population, 'agents/s'
+
+
+def bench_vaccinate(population, min_time):
+    """One yearly vaccination campaign."""
+    from initialparaandconst import Vaccine
+    model = _new_model(population)
+    arrays = _agent_arrays(model)
+    enabled, start_year = Vaccine.is_enabled, Vaccine.start_year
+    Vaccine.is_enabled, Vaccine.start_year = True, 0
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            durations = _timed(lambda: model.vaccinate(1), setup=lambda: _restore(model, arrays), min_time=min_time)
+    finally:
+        Vaccine.is_enabled, Vaccine.start_year = enabled, start_year
+    return durations, population, 'agents/s'
+
+
+def bench_initialize_population(population, min_time):
+    """Drawing the initial ages, genders and infections."""
+    model = _new_model(population, initialize=False)
+    return _timed(model.initialize_population, min_time=min_time), population, 'agents/s'
+
+
+def bench_population_snapshot(population, min_time):
+    """Simulation._record_population_snapshot: the yearly age pyramid of the agent model."""
+    from engine import ABMEngine
+    from simulation import Simulation
+    from reporting_config import YEARLY_SUMMARY_VARIABLES
+    simulation = Simulation(ABMEngine(_new_model(population)))
+    aggregates = {var: 0 for var in YEARLY_SUMMARY_VARIABLES}
+
+    def record():
+        simulation._record_population_snapshot(1, aggregates)
+        simulation.population_history.clear()
+    return _timed(record, min_time=min_time), population, 'agents/s'
+
+
+def bench_history_write(years, min_time):
+    """Writing the JSON history files of a run (the daily records dominate)."""
+    from engine import make_engine
+    from simulation import Simulation
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = Simulation(make_engine('ode', initial_population=100000, initial_infected_count=3000)).run(years, save=False)
+    with tempfile.TemporaryDirectory() as directory:
+        with contextlib.redirect_stdout(io.StringIO()):
+            durations = _timed(lambda: result.save(directory, update_latest=False, catalog=False), min_time=min_time)
+    return durations, years * 365, 'days/s'
+
+
+def bench_ode_run(years, min_time):
+    """CompartmentalModel.run: the ODE engine through the shared Simulation loop."""
+    from compartmental_model import CompartmentalModel
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        durations = _timed(lambda: CompartmentalModel(initial_population=1000000).run(years, save=False), min_time=min_time)
+    return durations, years * 365, 'days/s'
+
+
+# Case name -> (function, kernels it needs compiled, parameter name, fixed value or None for the populations)
+CASES = {
+    'daily_step': (bench_daily_step, 'abm', 'N', None),
+    'add_agents': (bench_add_agents, 'abm', 'N', None),
+    'compaction': (bench_compaction, 'abm', 'N', None),
+    'vaccinate': (bench_vaccinate, 'abm', 'N', None),
+    'initialize_population': (bench_initialize_population, 'abm', 'N', None),
+    'population_snapshot': (bench_population_snapshot, 'abm', 'N', None),
+    'history_write': (bench_history_write, 'ode', 'years', 20),
+    'ode_run': (bench_ode_run, 'ode', 'years', 20),
+}
+
+
+def _run_case(name, value, min_time):
+    """Runs one case in the current (fresh) process and returns its result record."""
+    from model import compile_kernels
+    from compartmental_model import compile_ode_kernels
+
+    function, kernels, parameter, _ = CASES[name]
+    with contextlib.redirect_stdout(io.StringIO()):
+        compile_time = compile_kernels() if kernels == 'abm' else compile_ode_kernels()
+    baseline_rss = _peak_rss()
+    durations, work, unit = function(value, min_time)
+    median = statistics.median(durations)
+    return {
+        'case': name,
+        'parameter': parameter,
+        'value': value,
+        'median': median,
+        'best': min(durations),
+        'repeats': len(durations),
+        'rate': work / median,
+        'best_rate': work / min(durations), # Least disturbed by other load; used for the comparison
+        'rate_unit': unit,
+        'compile_time': compile_time,
+        'baseline_rss': baseline_rss,
+        'peak_rss': _peak_rss(),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _baselines(path, host):
+    """Median best-case throughput of the last BASELINE_WINDOW results per (case, value) on this host."""
+    previous = {}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get('host') == host:
+                    previous.setdefault((record['case'], record['value']), []).append(record['best_rate'])
+    return {key: statistics.median(rates[-BASELINE_WINDOW:]) for key, rates in previous.items()}
+
+
+def run_benchmarks(cases=None, populations=None, min_time=MIN_TIME, save=True, path=BENCHMARK_RESULTS_FILE,
+                   threshold=REGRESSION_THRESHOLD):
+    """
+    Runs the benchmark cases, each in a fresh process, and compares them with
+    the previous results of this host.
+
+    Args:
+        cases (list): Case names (default: every case in CASES).
+        populations (list): Populations of the per-agent cases (default: DEFAULT_POPULATIONS).
+        min_time (float): Seconds of timed repeats per case.
+        save (bool): Whether to append the results to path.
+        path (str): Results file (JSON lines).
+        threshold (float): Relative throughput drop reported as a regression.
+
+    Returns:
+        list: The result records; 'change' is the relative change of the best-case
+        throughput against the median of this host's last BASELINE_WINDOW results,
+        and 'regression' flags drops over threshold. A case that failed has an
+        'error' instead of timings (and is not saved); the other cases still run.
+    """
+    from cost_model import host_id
+
+    cases = list(cases or CASES)
+    populations = [int(population) for population in (populations or DEFAULT_POPULATIONS)]
+    host = host_id()
+    baselines = _baselines(path, host)
+    commit = _git_commit()
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for name in cases:
+        _, _, parameter, fixed = CASES[name]
+        for value in ([fixed] if fixed is not None else populations):
+            pool = context.Pool(1)
+            try:
+                record = pool.apply(_run_case, (name, value, min_time))
+            except Exception as e:
+                print(f"{name:<22} {parameter}={value:<11,} FAILED: {type(e).__name__}: {e}")
+                results.append({'case': name, 'parameter': parameter, 'value': value,
+                                'error': f"{type(e).__name__}: {e}", 'regression': False})
+                continue
+            finally:
+                pool.close()
+                pool.join()
+            record.update(timestamp=time.time(), host=host, commit=commit)
+            baseline = baselines.get((name, value))
+            record['change'] = record['best_rate'] / baseline - 1 if baseline else None
+            record['regression'] = record['change'] is not None and record['change'] < -threshold
+            results.append(record)
+            change = f"{record['change']:+.1%}" if record['change'] is not None else 'new'
+            flag = '  REGRESSION' if record['regression'] else ''
+            print(f"{name:<22} {parameter}={value:<11,} median {record['median'] * 1e3:>10.2f} ms  "
+                  f"{record['rate']:>10.3g} {record['rate_unit']:<13} compile {record['compile_time']:>6.2f} s  "
+                  f"peak RSS {record['peak_rss'] / 2**20:>8.1f} MB  {change}{flag}")
+            if save:
+                with open(path, 'a') as f:
+                    f.write(json.dumps({key: item for key, item in record.items() if key != 'regression'}) + '\n')
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths.")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="Cases to run (default: all)")
+    parser.add_argument("--populations", nargs="+", type=float, help="Populations of the per-agent cases")
+    parser.add_argument("--quick", action="store_true", help="Populations up to 1e6 and shorter timings")
+    parser.add_argument("--no-save", action="store_true", help=f"Do not append the results to {BENCHMARK_RESULTS_FILE}")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any case regressed")
+    args = parser.parse_args()
+
+    populations = args.populations or (QUICK_POPULATIONS if args.quick else DEFAULT_POPULATIONS)
+    results = run_benchmarks(args.cases, populations, min_time=0.3 if args.quick else MIN_TIME, save=not args.no_save)
+    if any('error' in result for result in results):
+        sys.exit(2)
+    if args.fail_on_regression and any(result['regression'] for result in results):
+        sys.exit(1)
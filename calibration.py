@@ -0,0 +1,251 @@
+"""
+Gradient-based calibration of the compartmental model against incidence data.
+
+Fits BASE_TRANSMISSION_RISK and K_HALF (optionally ENVIRONMENTAL_SHEDDING_RATE
+too) to a target incidence series (observed counts or the output of an ABM run) by minimizing
+the squared error with BFGS. Gradients come from the forward sensitivity
+equations integrated alongside the model (ode_kernels.advance_with_sensitivities),
+so one model run gives the loss and its exact gradient. Annual vaccination
+campaigns (Vaccine) are applied at the start of each year as in a Simulation of
+the ODE engine, with the sensitivities carried through them:
+
+    target = target_from_result(SimulationResult.load(name))
+    fit = calibrate(target, period=365, initial_population=10000, initial_infected_count=300)
+    print(fit['parameters'], fit['r_squared'])
+
+Parameters are fitted on a log scale. The hazard depends on the shedding rate
+and K_HALF only through their ratio, so fitting both at once leaves one
+direction unidentified; the report's condition number shows this. The default
+fit therefore leaves the shedding rate at its model value.
+"""
+import time
+import numpy as np
+from compartmental_model import CompartmentalModel, _load_ode_kernels, vaccination_target_fraction
+from initialparaandconst import ENABLE_ENVIRONMENTAL_TRANSMISSION, Vaccine
+
+# Calibrated parameters, in the order of the ode_kernels.SENS_* sensitivities
+CALIBRATION_PARAMETERS = ('base_transmission_risk', 'k_half', 'environmental_shedding_rate')
+# Fitted by default: the shedding rate is only identified through its ratio to k_half
+DEFAULT_FIT_PARAMETERS = ('base_transmission_risk', 'k_half')
+OBSERVABLES = {'infections': 'CumInf', 'acute_cases': 'CumAcute'}
+
+
+def target_from_result(result, observable='infections'):
+    """
+    Extracts a yearly incidence target from a SimulationResult (e.g. an ABM run).
+
+    Returns:
+        np.ndarray: Incidence for years 1..N (use period=365).
+    """
+    key = 'yearly_new_infections' if observable == 'infections' else 'num_acute_cases_yearly'
+    return np.array([year[key] for year in result.population_history if year['year'] > 0], dtype=float)
+
+
+class IncidenceObjective:
+    """
+    Least-squares misfit between model incidence and a target series, with its
+    gradient with respect to the log parameters.
+    """
+
+    def __init__(self, target, period=365, observable='infections', fit_parameters=DEFAULT_FIT_PARAMETERS, **model_kwargs):
+        if not ENABLE_ENVIRONMENTAL_TRANSMISSION:
+            raise ValueError("Calibration needs the environmental transmission model")
+        if observable not in OBSERVABLES:
+            raise ValueError(f"Unknown observable '{observable}'. Choose from: {', '.join(OBSERVABLES)}")
+        unknown = set(fit_parameters) - set(CALIBRATION_PARAMETERS)
+        if unknown:
+            raise ValueError(f"Cannot calibrate: {', '.join(sorted(unknown))}")
+
+        self.target = np.asarray(target, dtype=float)
+        self.period = int(period)
+        self.observable = observable
+        self.fit_parameters = tuple(fit_parameters)
+        self.model_kwargs = model_kwargs
+        self.scale = max(float(np.mean(np.abs(self.target))), 1.0) # Residuals relative to the mean target
+        self.evaluations = 0
+
+    def model(self, log_values):
+        overrides = dict(self.model_kwargs)
+        overrides.update({name: float(np.exp(value)) for name, value in zip(self.fit_parameters, log_values)})
+        return CompartmentalModel(**overrides)
+
+    def incidence(self, log_values):
+        """
+        Model incidence per period and its (n_periods x n_fit) Jacobian w.r.t. the log parameters.
+        """
+        k = _load_ode_kernels()
+        model = self.model(log_values)
+        n_days = len(self.target) * self.period
+        params = model.parameter_vector()
+        y, sens = model.state_vector(), np.zeros((k.NUM_STATE, k.NUM_SENS))
+        states, sensitivities = [], []
+        for year, start_day in enumerate(range(0, n_days, 365), start=1):
+            _vaccinate_with_sensitivities(k, y, sens, year)
+            year_states, year_sensitivities = k.advance_with_sensitivities(y, sens, start_day, min(365, n_days - start_day), params)
+            y, sens = year_states[-1].copy(), year_sensitivities[-1].copy()
+            states.append(year_states)
+            sensitivities.append(year_sensitivities)
+        states, sensitivities = np.concatenate(states), np.concatenate(sensitivities)
+        index = k.Y_CUM_INF if self.observable == 'infections' else k.Y_CUM_ACUTE
+        boundaries = np.arange(self.period - 1, n_days, self.period)
+        cumulative = np.concatenate([[0.0], states[boundaries, index]])
+        cumulative_sens = np.vstack([np.zeros((1, k.NUM_SENS)), sensitivities[boundaries, index, :]])
+        columns = [CALIBRATION_PARAMETERS.index(name) for name in self.fit_parameters]
+        self.evaluations += 1
+        return np.diff(cumulative), np.diff(cumulative_sens, axis=0)[:, columns]
+
+    def residuals(self, log_values):
+        """Scaled residuals and their Jacobian."""
+        incidence, jacobian = self.incidence(log_values)
+        return (incidence - self.target) / self.scale, jacobian / self.scale
+
+    def __call__(self, log_values):
+        """Loss 0.5 * sum(residuals^2) and its gradient."""
+        residuals, jacobian = self.residuals(log_values)
+        return 0.5 * float(residuals @ residuals), jacobian.T @ residuals
+
+
+def _vaccinate_with_sensitivities(k, y, sens, year):
+    """
+    Applies the year's vaccination campaign to a state vector in place, as
+    CompartmentalModel.vaccinate does, and carries the sensitivities through the jump.
+    """
+    if not Vaccine.is_enabled or year < Vaccine.start_year:
+        return
+    fraction = vaccination_target_fraction() * Vaccine.coverage
+    num_to_vaccinate = fraction * y[:k.NUM_COMPARTMENTS].sum()
+    d_num = fraction * sens[:k.NUM_COMPARTMENTS].sum(axis=0)
+    if y[k.Y_S] > num_to_vaccinate:
+        y[k.Y_S] -= num_to_vaccinate
+        y[k.Y_V] += num_to_vaccinate
+        sens[k.Y_S] -= d_num
+        sens[k.Y_V] += d_num
+        return
+    # Every susceptible is vaccinated; the rest of the doses go to the recovered
+    remainder, d_remainder = num_to_vaccinate - y[k.Y_S], d_num - sens[k.Y_S]
+    y[k.Y_V] += y[k.Y_S]
+    sens[k.Y_V] += sens[k.Y_S]
+    y[k.Y_S] = 0.0
+    sens[k.Y_S] = 0.0
+    if y[k.Y_R] > remainder:
+        y[k.Y_R] -= remainder
+        y[k.Y_V] += remainder
+        sens[k.Y_R] -= d_remainder
+        sens[k.Y_V] += d_remainder
+    else:
+        y[k.Y_V] += y[k.Y_R]
+        sens[k.Y_V] += sens[k.Y_R]
+        y[k.Y_R] = 0.0
+        sens[k.Y_R] = 0.0
+
+
+def _bfgs(objective, x0, gtol=1e-6, max_iter=200, max_step=2.0):
+    """
+    BFGS with a backtracking (Armijo) line search. Steps are capped at max_step in
+    log space (a factor of e^2 per parameter).
+
+    Returns:
+        Tuple: (x, loss, gradient, iterations, converged)
+    """
+    x = np.asarray(x0, dtype=float)
+    loss, gradient = objective(x)
+    inverse_hessian = np.eye(len(x))
+    for iteration in range(1, max_iter + 1):
+        if np.max(np.abs(gradient)) < gtol:
+            return x, loss, gradient, iteration - 1, True
+        direction = -inverse_hessian @ gradient
+        if direction @ gradient >= 0: # Not a descent direction: restart from steepest descent
+            inverse_hessian = np.eye(len(x))
+            direction = -gradient
+        longest = np.max(np.abs(direction))
+        if longest > max_step:
+            direction *= max_step / longest
+
+        step = 1.0
+        while True:
+            x_new = x + step * direction
+            loss_new, gradient_new = objective(x_new)
+            if loss_new <= loss + 1e-4 * step * (gradient @ direction) or step < 1e-8:
+                break
+            step *= 0.5
+        if step < 1e-8:
+            return x, loss, gradient, iteration, False
+
+        s = x_new - x
+        y = gradient_new - gradient
+        if s @ y > 1e-12: # Curvature condition; skip the update otherwise
+            rho = 1.0 / (s @ y)
+            identity = np.eye(len(x))
+            inverse_hessian = (identity - rho * np.outer(s, y)) @ inverse_hessian @ (identity - rho * np.outer(y, s)) + rho * np.outer(s, s)
+        x, loss, gradient = x_new, loss_new, gradient_new
+        if abs(s).max() < 1e-10:
+            return x, loss, gradient, iteration, True
+    return x, loss, gradient, max_iter, False
+
+
+def calibrate(target, period=365, observable='infections', fit_parameters=DEFAULT_FIT_PARAMETERS,
+              initial_values=None, gtol=1e-6, max_iter=200, **model_kwargs):
+    """
+    Fits the transmission parameters to a target incidence series.
+
+    Args:
+        target (array): Incidence per period, starting at day 1.
+        period (int): Days per target value (365 for yearly totals, 1 for daily).
+        observable (str): 'infections' (new infections) or 'acute_cases'.
+        fit_parameters (tuple): Subset of CALIBRATION_PARAMETERS to fit (default
+            DEFAULT_FIT_PARAMETERS); the rest stay fixed.
+        initial_values (dict): Starting values; defaults to the model defaults.
+        gtol (float): Convergence tolerance on the gradient.
+        max_iter (int): Maximum number of BFGS iterations.
+        **model_kwargs: Other CompartmentalModel arguments (initial_population, ...).
+
+    Returns:
+        dict: Fitted 'parameters', fit quality ('loss', 'rmse', 'nrmse', 'r_squared'),
+        'standard_errors' (log scale), 'condition_number' of the Gauss-Newton
+        matrix, 'fitted' and 'target' series, 'iterations', 'evaluations',
+        'converged' and 'wall_time'.
+    """
+    start_time = time.perf_counter()
+    objective = IncidenceObjective(target, period, observable, fit_parameters, **model_kwargs)
+    defaults = CompartmentalModel(**model_kwargs)
+    initial_values = initial_values or {}
+    x0 = np.log([initial_values.get(name, getattr(defaults, name)) for name in objective.fit_parameters])
+
+    x, loss, gradient, iterations, converged = _bfgs(objective, x0, gtol=gtol, max_iter=max_iter)
+
+    # --- Fit quality ---
+    fitted, jacobian = objective.incidence(x)
+    errors = fitted - objective.target
+    rmse = float(np.sqrt(np.mean(errors ** 2)))
+    total_variance = float(np.sum((objective.target - objective.target.mean()) ** 2))
+    gauss_newton = jacobian.T @ jacobian
+    dof = max(len(errors) - len(x), 1)
+    try:
+        covariance = np.linalg.inv(gauss_newton) * (errors @ errors) / dof
+        standard_errors = np.sqrt(np.abs(np.diag(covariance)))
+    except np.linalg.LinAlgError:
+        standard_errors = np.full(len(x), np.inf)
+    singular_values = np.linalg.svd(jacobian, compute_uv=False)
+
+    report = {
+        'parameters': {name: float(np.exp(value)) for name, value in zip(objective.fit_parameters, x)},
+        'loss': loss,
+        'gradient_norm': float(np.max(np.abs(gradient))),
+        'rmse': rmse,
+        'nrmse': rmse / objective.scale,
+        'r_squared': 1.0 - float(errors @ errors) / total_variance if total_variance > 0 else float('nan'),
+        'standard_errors': {name: float(se) for name, se in zip(objective.fit_parameters, standard_errors)},
+        'condition_number': float(singular_values[0] / singular_values[-1]) if singular_values[-1] > 0 else float('inf'),
+        'fitted': fitted,
+        'target': objective.target,
+        'iterations': iterations,
+        'evaluations': objective.evaluations,
+        'converged': converged,
+        'wall_time': time.perf_counter() - start_time,
+    }
+    print(f"Calibration {'converged' if converged else 'stopped'} after {iterations} iterations "
+          f"({objective.evaluations} model runs, {report['wall_time']:.2f} s): "
+          f"R^2={report['r_squared']:.4f}, NRMSE={report['nrmse']:.4f}")
+    for name, value in report['parameters'].items():
+        print(f"  {name} = {value:.4e} (log-scale SE {report['standard_errors'][name]:.3f})")
+    return report
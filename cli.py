@@ -0,0 +1,288 @@
+"""
+Command-line entry point for the typhoid simulations.
+
+    python cli.py run --engine ode --years 10 --population 100000
+    python cli.py sweep --param k_half --values 1e7 1e8 1e9
+    python cli.py ensemble --runs 20 --seed 1
+    python cli.py visualize sir
+    python cli.py convert
+    python cli.py runs --engine abm --where k_half=1e6:1e8
+    python cli.py estimate --engine abm --population 10000000 --years 20
+
+Heavy dependencies (numba, tqdm, plotly) are only imported by the subcommand
+that needs them, so `python cli.py --help` and the light subcommands start
+immediately.
+"""
+import time
+START_TIME = time.perf_counter() # Taken before any other import for the time-to-first-step metric
+import argparse
+import sys
+
+from initialparaandconst import INITIAL_POPULATION, SIMULATION_YEARS, SIMULATION_ENGINE
+
+# Model parameters that can be overridden from the command line (see Model / CompartmentalModel)
+INTEGER_PARAMETERS = ('initial_population', 'initial_infected_count')
+FLOAT_PARAMETERS = ('base_transmission_risk', 'k_half', 'environmental_shedding_rate', 'environmental_decay_rate')
+
+VISUALIZATIONS = ('summary', 'pyramid', 'sir', 'environment', 'vaccination', 'comparison')
+
+
+def _add_model_arguments(parser):
+    parser.add_argument("--engine", default=SIMULATION_ENGINE, help="Engine to run (abm, ode, ode_age or stochastic)")
+    parser.add_argument("--years", type=int, default=SIMULATION_YEARS, help="Number of years to simulate")
+    parser.add_argument("--population", type=int, default=INITIAL_POPULATION, help="Initial population size")
+    parser.add_argument("--infected", type=int,
+                        help="Initial infected count (default: INITIAL_INFECTED_COUNT scaled to the population)")
+    parser.add_argument("--risk", type=float, help="Base transmission risk")
+    parser.add_argument("--k-half", type=float, help="Half-saturation constant of the dose-response curve")
+    parser.add_argument("--shedding", type=float, help="Environmental shedding rate")
+    parser.add_argument("--decay", type=float, help="Environmental contagion decay rate")
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument("--equilibrium", action="store_true",
+                        help="Start from the endemic equilibrium instead of seeded infections (abm and ode)")
+
+
+def _engine_params(args):
+    """Collects the model parameter overrides given on the command line."""
+    params = {
+        'initial_population': args.population,
+        'initial_infected_count': args.infected,
+        'base_transmission_risk': args.risk,
+        'k_half': args.k_half,
+        'environmental_shedding_rate': args.shedding,
+        'environmental_decay_rate': args.decay,
+    }
+    params = {key: value for key, value in params.items() if value is not None}
+    if args.equilibrium:
+        params['start_at_equilibrium'] = True
+    return params
+
+
+def _parse_parameter_value(name, value):
+    if name in INTEGER_PARAMETERS:
+        return int(float(value))
+    if name in FLOAT_PARAMETERS:
+        return float(value)
+    raise ValueError(f"Unknown parameter '{name}'. Choose from: {', '.join(INTEGER_PARAMETERS + FLOAT_PARAMETERS)}")
+
+
+def _memory_size(text):
+    """argparse type of --memory-budget (see memory_budget.parse_size)."""
+    from memory_budget import parse_size
+    try:
+        return parse_size(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _simulate(engine_name, params, years, save, seed=None, name_suffix="", started_at=None, profile=False,
+              memory_budget=None, track_memory=False):
+    """Builds an engine, runs it and (optionally) saves the result under a suffixed name."""
+    from engine import make_engine
+    from simulation import Simulation
+    from model import set_seed
+
+    if seed is not None:
+        set_seed(seed)
+    engine = make_engine(engine_name, **params)
+    result = Simulation(engine).run(duration_years=years, save=False, started_at=started_at, profile=profile,
+                                    memory_budget=memory_budget, track_memory=track_memory)
+    result.name += name_suffix
+    result.metadata['seed'] = seed
+    if save:
+        result.save()
+    return result
+
+
+def _print_summary(label, result):
+    summary = result.summary()
+    print(f"{label}: " + ", ".join(f"{key}={value:,.0f}" for key, value in summary.items()))
+
+
+def cmd_run(args):
+    result = _simulate(args.engine, _engine_params(args), args.years, save=not args.no_save,
+                       seed=args.seed, started_at=START_TIME, profile=args.profile,
+                       memory_budget=args.memory_budget, track_memory=args.track_memory)
+    _print_summary(result.name, result)
+    if args.profile:
+        from instrumentation import print_profile
+        print_profile(result.profile_history)
+
+
+def cmd_sweep(args):
+    params = _engine_params(args)
+    results = []
+    for raw_value in args.values:
+        value = _parse_parameter_value(args.param, raw_value)
+        run_params = dict(params, **{args.param: value})
+        print(f"--- {args.param} = {value} ---")
+        result = _simulate(args.engine, run_params, args.years, save=args.save, seed=args.seed,
+                           name_suffix=f"_{args.param}_{raw_value}")
+        results.append((value, result))
+
+    print(f"\nSweep over {args.param}:")
+    for value, result in results:
+        _print_summary(f"  {args.param}={value}", result)
+
+
+def cmd_ensemble(args):
+    import numpy as np
+
+    params = _engine_params(args)
+    summaries = []
+    for replicate in range(args.runs):
+        seed = None if args.seed is None else args.seed + replicate
+        print(f"--- Replicate {replicate + 1}/{args.runs} ---")
+        result = _simulate(args.engine, params, args.years, save=args.save, seed=seed,
+                           name_suffix=f"_rep{replicate}")
+        summaries.append(result.summary())
+
+    print(f"\nEnsemble of {args.runs} runs ({args.engine}):")
+    for key in summaries[0]:
+        values = np.array([summary[key] for summary in summaries], dtype=float)
+        print(f"  {key}: mean={values.mean():,.1f}, std={values.std():,.1f}, min={values.min():,.0f}, max={values.max():,.0f}")
+
+
+def cmd_visualize(args):
+    from results import history_path
+
+    if args.kind == 'comparison':
+        if len(args.files) != 2:
+            sys.exit("comparison needs exactly two SIR history files")
+        import visualize_comparison
+        visualize_comparison.visualize_comparison(args.files[0], args.files[1], normalize=args.normalize)
+        return
+
+    modules = {
+        'summary': ('visualize_summary', 'population'),
+        'pyramid': ('visualize', 'population'),
+        'sir': ('visualize_sir', 'sir'),
+        'environment': ('visualize_environment', 'environment'),
+        'vaccination': ('visualize_vaccination', 'population'),
+    }
+    module_name, kind = modules[args.kind]
+    history_file = args.files[0] if args.files else history_path(kind, args.name)
+    module = __import__(module_name)
+    fig = module.get_figure(history_file)
+    if fig is not None:
+        fig.show()
+
+
+def cmd_convert(args):
+    import glob
+    from json_to_csv import json_to_csv
+
+    files = args.files or glob.glob("*.json")
+    if not files:
+        print("No JSON files found in the current directory.")
+    for json_file in files:
+        json_to_csv(json_file)
+
+
+def _parse_filter(text):
+    """Parses a --where filter: column=value or column=low:high (either bound may be empty)."""
+    name, _, value = text.partition('=')
+    if ':' not in value:
+        return name, float(value)
+    low, high = value.split(':', 1)
+    return name, (float(low) if low else None, float(high) if high else None)
+
+
+def cmd_runs(args):
+    from run_catalog import find_runs, import_runs
+
+    if args.import_dir:
+        import_runs(args.import_dir)
+    filters = dict(_parse_filter(text) for text in args.where)
+    if args.engine:
+        filters['engine'] = args.engine
+    runs = find_runs(limit=args.limit, **filters)
+    print(f"{'id':>5}  {'engine':<10} {'years':>5} {'population':>11} {'risk':>9} {'k_half':>9} {'seed':>6} {'wall s':>8} {'infections':>12}  location")
+    for run in runs:
+        print(f"{run['id']:>5}  {run['engine'] or '':<10} {run['duration_years'] or 0:>5} {run['initial_population'] or 0:>11,} "
+              f"{run['base_transmission_risk'] or 0:>9.2e} {run['k_half'] or 0:>9.2e} {str(run['seed']):>6} "
+              f"{run['wall_time'] or 0:>8.2f} {run['cumulative_infections'] or 0:>12,}  {run['directory']}/{run['name']}")
+    print(f"{len(runs)} run(s)")
+
+
+def cmd_estimate(args):
+    from cost_model import load_calibration, estimate_cost, describe
+
+    calibration = load_calibration(recalibrate=args.recalibrate)
+    estimate = estimate_cost(args.engine, args.population, args.years, concurrent_runs=args.concurrent,
+                             save=not args.no_save, calibration=calibration)
+    print(f"{args.engine}, N={args.population:,}, {args.years} years: {describe(estimate)}")
+    for phase, seconds in estimate['time_breakdown'].items():
+        print(f"  {phase:<12} {seconds:>10.1f} s")
+    for part, size in estimate['memory_breakdown'].items():
+        print(f"  {part:<12} {size / 2**20:>10.1f} MB")
+    print(f"  output files {estimate['output_bytes'] / 2**20:>10.1f} MB")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Typhoid transmission simulations.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run a single simulation")
+    _add_model_arguments(run_parser)
+    run_parser.add_argument("--no-save", action="store_true", help="Do not write the history files")
+    run_parser.add_argument("--profile", action="store_true",
+                            help="Time each phase of the daily step and count events per year (saved as the profile history)")
+    run_parser.add_argument("--memory-budget", type=_memory_size, metavar="SIZE",
+                            help="Memory limit of the run (e.g. 8GB): stream the histories, narrow the agent arrays "
+                                 "and compact sooner as needed to stay under it")
+    run_parser.add_argument("--track-memory", action="store_true",
+                            help="Report the memory held by the agent arrays, histories and buffers every year")
+    run_parser.set_defaults(func=cmd_run)
+
+    sweep_parser = subparsers.add_parser("sweep", help="Run one simulation per value of a parameter")
+    _add_model_arguments(sweep_parser)
+    sweep_parser.add_argument("--param", required=True, help="Parameter to sweep, e.g. k_half")
+    sweep_parser.add_argument("--values", nargs="+", required=True, help="Values to run")
+    sweep_parser.add_argument("--save", action="store_true", help="Write the history files of every run")
+    sweep_parser.set_defaults(func=cmd_sweep)
+
+    ensemble_parser = subparsers.add_parser("ensemble", help="Run replicate simulations and summarize them")
+    _add_model_arguments(ensemble_parser)
+    ensemble_parser.add_argument("--runs", type=int, default=10, help="Number of replicates")
+    ensemble_parser.add_argument("--save", action="store_true", help="Write the history files of every run")
+    ensemble_parser.set_defaults(func=cmd_ensemble)
+
+    visualize_parser = subparsers.add_parser("visualize", help="Plot the results of a run")
+    visualize_parser.add_argument("kind", choices=VISUALIZATIONS)
+    visualize_parser.add_argument("files", nargs="*", help="History file(s); defaults to the latest run")
+    visualize_parser.add_argument("--name", help="Run name to plot instead of the latest run")
+    visualize_parser.add_argument("--normalize", action="store_true", help="Normalize counts (comparison only)")
+    visualize_parser.set_defaults(func=cmd_visualize)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert history JSON files to CSV")
+    convert_parser.add_argument("files", nargs="*", help="JSON files to convert; defaults to all in the current directory")
+    convert_parser.set_defaults(func=cmd_convert)
+
+    runs_parser = subparsers.add_parser("runs", help="List catalogued runs")
+    runs_parser.add_argument("--engine", help="Only runs of this engine")
+    runs_parser.add_argument("--where", nargs="*", default=[], metavar="COLUMN=VALUE|LOW:HIGH",
+                             help="Filters on catalog columns, e.g. k_half=1e6:1e8 seed=1")
+    runs_parser.add_argument("--limit", type=int, default=50, help="Maximum number of runs to list")
+    runs_parser.add_argument("--import-dir", help="Catalog the runs already saved in this directory first")
+    runs_parser.set_defaults(func=cmd_runs)
+
+    estimate_parser = subparsers.add_parser("estimate", help="Predict the wall time and peak memory of a run")
+    estimate_parser.add_argument("--engine", default=SIMULATION_ENGINE, help="Engine to run (abm, ode, ode_age or stochastic)")
+    estimate_parser.add_argument("--years", type=int, default=SIMULATION_YEARS, help="Number of years to simulate")
+    estimate_parser.add_argument("--population", type=int, default=INITIAL_POPULATION, help="Initial population size")
+    estimate_parser.add_argument("--concurrent", type=int, default=1, help="Runs sharing the host at the same time")
+    estimate_parser.add_argument("--no-save", action="store_true", help="The run does not write history files")
+    estimate_parser.add_argument("--recalibrate", action="store_true", help="Re-run the host micro-benchmark first")
+    estimate_parser.set_defaults(func=cmd_estimate)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import time
 import numpy as np
 import json
 import math
@@ -17,6 +18,7 @@ from initialparaandconst import (
     INITIAL_POPULATION, SIMULATION_YEARS, MALE_BIRTH_RATE, FEMALE_BIRTH_RATE,
     PYRAMID_AGE_BINS
 )
+from model import initial_infected_count_for
 
 # --- Helper Functions for Parameter Aggregation ---
 
@@ -136,25 +138,97 @@ PROB_A_TO_R = 1.0 - PROB_A_TO_C
 PROB_U_TO_C = AVG_CHRONIC_PROB_BASE * PROB_CHRONIC_AFTER_SUBCLINICAL
 PROB_U_TO_R = 1.0 - PROB_U_TO_C
 
+# Order of the compartments in the state vector used by the compiled solvers (see ode_kernels.py).
+# The environmental contagion follows them as the last entry.
+STATE_KEYS = ['S', 'M', 'P', 'A', 'U', 'C', 'R', 'V', 'CumInf', 'CumAcute']
+SOLVERS = ('rk4', 'rk45', 'python')
+# Longest step allowed with a coupled environment. Against a tight reference (N=100k,
+# 20 years) weekly RK4 steps stay within 0.01% of the population on every day and
+# two-week steps within 0.2%; near four weeks RK4 goes unstable (prepatent exit rate
+# 0.1/day). Long steps do flatten the sharp acute peak of the first weeks, as the
+# seeded infections turn acute: 310 vs 312 with weekly steps, 268 with two-week steps.
+MAX_STEP_DAYS = 14
+
+def _load_ode_kernels():
+    """Imports the numba ODE kernels on first use so importing this module stays lightweight."""
+    import ode_kernels
+    return ode_kernels
+
+def vaccination_target_fraction():
+    """Approximate fraction of the population inside the vaccination target age group."""
+    target_prob = 0
+    target_min_years = Vaccine.target_group_min_age / 12.0
+    target_max_years = Vaccine.target_group_max_age / 12.0
+    
+    for age_range, prob in AGE_DISTRIBUTION.items():
+        min_age, max_age = age_range
+        # Simple overlap
+        overlap_min = max(min_age, target_min_years)
+        overlap_max = min(max_age, target_max_years)
+        
+        if overlap_max > overlap_min:
+            range_len = max_age - min_age + 1
+            overlap_len = overlap_max - overlap_min
+            target_prob += prob * (overlap_len / range_len)
+    return target_prob
+
 # --- Compartmental Model Class ---
 
 class CompartmentalModel:
-    def __init__(self, base_transmission_risk=None, k_half=None):
-        self.population = INITIAL_POPULATION
+    def __init__(self, base_transmission_risk=None, k_half=None, initial_population=None,
+                 initial_infected_count=None, environmental_shedding_rate=None,
+                 environmental_decay_rate=None, solver='rk4', rtol=1e-6, atol=1e-3,
+                 coupled_environment=True, step_days=1):
+        self.population = initial_population if initial_population is not None else INITIAL_POPULATION
         self.time_step = 1.0 # 1 day
         
+        # Integration method: 'rk4' (compiled fixed daily step), 'rk45' (compiled adaptive
+        # Dormand-Prince with rtol/atol; with a coupled environment its steps span days and
+        # the daily values come from its dense output) or 'python' (the reference dict-based RK4 below).
+        if solver not in SOLVERS:
+            raise ValueError(f"Unknown solver '{solver}'. Choose from: {', '.join(SOLVERS)}")
+        self.solver = solver
+        self.rtol = rtol
+        self.atol = atol
+
+        # With a coupled environment the contagion is integrated together with the
+        # compartments, which allows multi-day steps (e.g. step_days=7 for sweeps); the
+        # days inside a step are interpolated with the step's end derivatives.
+        # Uncoupled, it is updated once a day as in the ABM and the 'python' solver.
+        step_days = int(step_days)
+        if not 1 <= step_days <= MAX_STEP_DAYS:
+            raise ValueError(f"step_days must be between 1 and {MAX_STEP_DAYS}")
+        if step_days > 1 and (solver == 'python' or not coupled_environment):
+            raise ValueError("Multi-day steps need a compiled solver and a coupled environment")
+        self.coupled_environment = coupled_environment
+        self.step_days = step_days
+        
         # Allow overriding transmission risk for tuning
         self.base_transmission_risk = base_transmission_risk if base_transmission_risk is not None else BASE_TRANSMISSION_RISK
         self.k_half = k_half if k_half is not None else K_HALF
+        self.initial_infected_count = initial_infected_count_for(self.population, initial_infected_count)
+        self.environmental_shedding_rate = environmental_shedding_rate if environmental_shedding_rate is not None else ENVIRONMENTAL_SHEDDING_RATE
+        self.environmental_decay_rate = environmental_decay_rate if environmental_decay_rate is not None else ENVIRONMENTAL_CONTAGION_DECAY_RATE
         
         # State Variables (Number of people)
         # S: Susceptible, M: Maternally Immune, P: Prepatent, A: Acute, U: Subclinical, C: Chronic, R: Recovered, V: Vaccinated
+        self.initialize_state()
+        
+        # History
+        self.sir_history = []
+        self.environment_history = []
+        self.population_history = [] # Will store dummy/aggregate data to match format
         
-        # Initialize based on standard start
+        self.vaccine_campaign_name = VAX_CAMPAIGN_NAME
+        if Vaccine.is_enabled:
+             self.vaccine_campaign_name=f"VAX_{Vaccine.target_group_min_age}_{Vaccine.target_group_max_age}"
+
+    def initialize_state(self):
+        """Resets the compartments to the standard start (seeded prepatent infections, clean environment)."""
         self.state = {
-            'S': self.population - INITIAL_INFECTED_COUNT,
+            'S': self.population - self.initial_infected_count,
             'M': 0.0,
-            'P': float(INITIAL_INFECTED_COUNT), # Seed infection here
+            'P': float(self.initial_infected_count), # Seed infection here
             'A': 0.0,
             'U': 0.0,
             'C': 0.0,
@@ -166,15 +240,61 @@ class CompartmentalModel:
         
         # Environmental Variable
         self.environmental_contagion = 0.0
-        
-        # History
-        self.sir_history = []
-        self.environment_history = []
-        self.population_history = [] # Will store dummy/aggregate data to match format
-        
-        self.vaccine_campaign_name = VAX_CAMPAIGN_NAME
-        if Vaccine.is_enabled:
-             self.vaccine_campaign_name=f"VAX_{Vaccine.target_group_min_age}_{Vaccine.target_group_max_age}"
+
+    def state_vector(self):
+        """Returns the state as a float64 vector ordered by STATE_KEYS, followed by the environmental contagion."""
+        return np.array([self.state[key] for key in STATE_KEYS] + [self.environmental_contagion], dtype=np.float64)
+
+    def set_state_vector(self, y):
+        """Sets the state and environmental contagion from a vector laid out as in state_vector()."""
+        self.state = {key: float(value) for key, value in zip(STATE_KEYS, y)}
+        self.environmental_contagion = float(y[len(STATE_KEYS)])
+
+    def parameter_vector(self):
+        """Packs the rates and switches into the parameter vector used by ode_kernels."""
+        k = _load_ode_kernels()
+        params = np.zeros(k.NUM_PARAMS)
+        params[k.PAR_BASE_RISK] = self.base_transmission_risk
+        params[k.PAR_K_HALF] = self.k_half
+        params[k.PAR_SHEDDING_RATE] = self.environmental_shedding_rate
+        params[k.PAR_DECAY_RATE] = self.environmental_decay_rate
+        params[k.PAR_ENABLE_ENV] = 1.0 if ENABLE_ENVIRONMENTAL_TRANSMISSION else 0.0
+        params[k.PAR_TRANSMISSION_RATE] = TRANSMISSION_RATE
+        params[k.PAR_BIRTH_RATE] = FEMALE_BIRTH_RATE
+        params[k.PAR_DEATH_RATE] = AVG_DEATH_RATE_DAILY
+        params[k.PAR_ACUTE_MORTALITY] = ACUTE_MORTALITY_RATE / 365.0
+        params[k.PAR_MATERNAL_LOSS] = RATE_MATERNAL_LOSS
+        params[k.PAR_PREPATENT_EXIT] = RATE_PREPATENT_EXIT
+        params[k.PAR_ACUTE_EXIT] = RATE_ACUTE_EXIT
+        params[k.PAR_SUBCLINICAL_EXIT] = RATE_SUBCLINICAL_EXIT
+        params[k.PAR_RECOVERY_LOSS] = RATE_RECOVERY_LOSS
+        params[k.PAR_VACCINE_LOSS] = RATE_VACCINE_LOSS
+        params[k.PAR_P_TO_A] = PROB_P_TO_A
+        params[k.PAR_A_TO_C] = PROB_A_TO_C
+        params[k.PAR_U_TO_C] = PROB_U_TO_C
+        params[k.PAR_SEASON_MIN] = SEASONALITY_MIN_MULTIPLIER
+        params[k.PAR_SEASON_PEAK] = 0.98 # Mean of 0.97 and 0.99
+        params[k.PAR_SEASON_MAX_DAY] = SEASONALITY_MAX_DAY
+        params[k.PAR_SEASON_RAMP] = SEASONALITY_RAMP_DURATION
+        params[k.PAR_COUPLED_ENV] = 1.0 if self.coupled_environment else 0.0
+        return params
+
+    def advance_days(self, start_day, n_days):
+        """
+        Advances the model n_days days after start_day with the compiled solver.
+
+        Returns:
+            Tuple: (n_days x ode_kernels.NUM_STATE) end-of-day state vectors and
+            (n_days x ode_kernels.NUM_OUTPUTS) daily environment outputs.
+        """
+        k = _load_ode_kernels()
+        solver_id = k.SOLVER_RK45 if self.solver == 'rk45' else k.SOLVER_RK4
+        states, outputs = k.advance_days(
+            self.state_vector(), int(start_day), int(n_days), self.parameter_vector(),
+            solver_id, float(self.rtol), float(self.atol), int(self.step_days)
+        )
+        self.set_state_vector(states[-1])
+        return states, outputs
 
     def get_seasonality_multiplier(self, day):
         """Calculates the seasonality multiplier for the given day."""
@@ -317,6 +437,63 @@ class CompartmentalModel:
             if self.state[k] < 0: self.state[k] = 0 # Clamp to 0
             
     def step(self, day):
+        """Advances one day and returns the day's state counts and environment variables."""
+        if self.solver == 'python':
+            return self._step_python(day)
+        return self.advance(day - 1, 1)[0]
+
+    def advance(self, start_day, n_days):
+        """
+        Advances n_days days after start_day in a single compiled call.
+
+        Returns:
+            list: One record per day in the same format as step().
+        """
+        if self.solver == 'python':
+            return [self._step_python(start_day + d + 1) for d in range(n_days)]
+
+        k = _load_ode_kernels()
+        states, outputs = self.advance_days(start_day, n_days)
+        records = []
+        for d in range(n_days):
+            out = outputs[d]
+            record = {'day': start_day + d + 1}
+            record.update(self._state_counts_record(states[d]))
+            record.update({
+                'contagion': float(out[k.OUT_CONTAGION]),
+                'infection_pressure': float(out[k.OUT_INFECTION_PRESSURE]),
+                'seasonality_multiplier': float(out[k.OUT_SEASONALITY]),
+                'hazard_factor': float(out[k.OUT_HAZARD]),
+                'new_contagion_inc': float(out[k.OUT_NEW_CONTAGION_INC]),
+                'num_environmentally_shedding': float(out[k.OUT_ENV_SHEDDING]),
+                'num_shedding_agents': float(out[k.OUT_NUM_SHEDDING]),
+                'yearly_new_infections': float(out[k.OUT_NEW_INFECTIONS]),
+                'num_acute_cases_yearly': float(out[k.OUT_ACUTE_CASES])
+            })
+            records.append(record)
+        return records
+
+    def _state_counts_record(self, y=None):
+        """
+        State counts keyed by disease state name, from a state vector (default: current state).
+        The compartments are fractional and kept so: truncating them would bias every total
+        (and any result scaled up from them) downwards.
+        """
+        if y is None:
+            y = self.state_vector()
+        return {
+            'SUSCEPTIBLE': float(y[0]),
+            'MATERNALLY_IMMUNE': float(y[1]),
+            'PREPATENT': float(y[2]),
+            'ACUTE': float(y[3]),
+            'SUBCLINICAL': float(y[4]),
+            'CHRONIC': float(y[5]),
+            'RECOVERED': float(y[6]),
+            'VACCINATED': float(y[7]),
+        }
+
+    def _step_python(self, day):
+        """Reference implementation of step() using the dict-based RK4 and Euler environment update."""
         # Store old cumulative values to calculate daily flows
         old_cum_inf = self.state['CumInf']
         old_cum_acute = self.state['CumAcute']
@@ -346,8 +523,8 @@ class CompartmentalModel:
         seasonality_multiplier = 1.0
         
         if ENABLE_ENVIRONMENTAL_TRANSMISSION:
-            new_contagion_inc = self.environmental_contagion * np.exp(-1.0 * ENVIRONMENTAL_CONTAGION_DECAY_RATE)
-            num_environmentally_shedding = num_shedding * ENVIRONMENTAL_SHEDDING_RATE
+            new_contagion_inc = self.environmental_contagion * np.exp(-1.0 * self.environmental_decay_rate)
+            num_environmentally_shedding = num_shedding * self.environmental_shedding_rate
             
             # Update Environment
             self.environmental_contagion = new_contagion_inc + num_environmentally_shedding
@@ -362,16 +539,9 @@ class CompartmentalModel:
              if active_pop > 0:
                 infection_pressure = (num_shedding / active_pop) * TRANSMISSION_RATE
             
-        return {
-            'day': day,
-            'SUSCEPTIBLE': int(self.state['S']),
-            'MATERNALLY_IMMUNE': int(self.state['M']),
-            'PREPATENT': int(self.state['P']),
-            'ACUTE': int(self.state['A']),
-            'SUBCLINICAL': int(self.state['U']),
-            'CHRONIC': int(self.state['C']),
-            'RECOVERED': int(self.state['R']),
-            'VACCINATED': int(self.state['V']),
+        record = {'day': day}
+        record.update(self._state_counts_record())
+        record.update({
             'contagion': self.environmental_contagion,
             'infection_pressure': infection_pressure,
             'seasonality_multiplier': seasonality_multiplier,
@@ -381,7 +551,8 @@ class CompartmentalModel:
             'num_shedding_agents': num_shedding,
             'yearly_new_infections': daily_new_infections,
             'num_acute_cases_yearly': daily_acute_cases
-        }
+        })
+        return record
 
     def vaccinate(self, year):
         """Vaccination logic."""
@@ -394,20 +565,7 @@ class CompartmentalModel:
         # And assume they are S, R, or P (but mostly S).
         
         # Calculate fraction of population in target age
-        target_prob = 0
-        target_min_years = Vaccine.target_group_min_age / 12.0
-        target_max_years = Vaccine.target_group_max_age / 12.0
-        
-        for age_range, prob in AGE_DISTRIBUTION.items():
-            min_age, max_age = age_range
-            # Simple overlap
-            overlap_min = max(min_age, target_min_years)
-            overlap_max = min(max_age, target_max_years)
-            
-            if overlap_max > overlap_min:
-                range_len = max_age - min_age + 1
-                overlap_len = overlap_max - overlap_min
-                target_prob += prob * (overlap_len / range_len)
+        target_prob = vaccination_target_fraction()
                 
         # Total eligible population (approximate)
         # Exclude cumulative counters
@@ -439,85 +597,36 @@ class CompartmentalModel:
                 self.state['V'] += self.state['R']
                 self.state['R'] = 0
 
-    def run(self):
-        print(f"Running Compartmental Model for {SIMULATION_YEARS} years...")
-        
-        current_day = 0
-        
-        # Initial snapshot
-        self.population_history.append({
-            'year': 0,
-            'male_age_counts': [0]*len(PYRAMID_AGE_BINS), # Dummy
-            'female_age_counts': [0]*len(PYRAMID_AGE_BINS), # Dummy
-            'vaccinated_count': 0
-        })
-        
-        for year in range(1, SIMULATION_YEARS + 1):
-            self.vaccinate(year)
-            
-            yearly_new_infections = 0
-            yearly_acute_cases = 0
-            
-            for day in range(365):
-                current_day += 1
-                res = self.step(current_day)
-                
-                # Record SIR
-                self.sir_history.append({
-                    'day': current_day,
-                    'SUSCEPTIBLE': res['SUSCEPTIBLE'],
-                    'MATERNALLY_IMMUNE': res['MATERNALLY_IMMUNE'],
-                    'PREPATENT': res['PREPATENT'],
-                    'ACUTE': res['ACUTE'],
-                    'SUBCLINICAL': res['SUBCLINICAL'],
-                    'CHRONIC': res['CHRONIC'],
-                    'RECOVERED': res['RECOVERED'],
-                    'VACCINATED': res['VACCINATED']
-                })
-                
-                # Record Environment
-                self.environment_history.append({
-                    'day': current_day,
-                    'contagion': res['contagion'],
-                    'infection_pressure': res['infection_pressure'],
-                    'seasonality_multiplier': res['seasonality_multiplier'],
-                    'hazard_factor': res['hazard_factor'],
-                    'new_contagion_inc': res['new_contagion_inc'],
-                    'num_environmentally_shedding': res['num_environmentally_shedding'],
-                    'num_shedding_agents': res['num_shedding_agents'],
-                    'yearly_new_infections': res['yearly_new_infections'], # Daily value
-                    'num_acute_cases_yearly': res['num_acute_cases_yearly'] # Daily value
-                })
-                
-                yearly_new_infections += res['yearly_new_infections']
-                yearly_acute_cases += res['num_acute_cases_yearly']
-                
-            total_pop_current = self.state['S'] + self.state['M'] + self.state['P'] + self.state['A'] + self.state['U'] + self.state['C'] + self.state['R'] + self.state['V']
-            print(f"Year {year}: Total Pop: {int(total_pop_current)}, New Infections: {int(yearly_new_infections)}")
-            
-            # Record Population Snapshot (Dummy for compatibility)
-            self.population_history.append({
-                'year': year,
-                'male_age_counts': [0]*len(PYRAMID_AGE_BINS),
-                'female_age_counts': [0]*len(PYRAMID_AGE_BINS),
-                'vaccinated_count': int(self.state['V']),
-                'yearly_new_infections': int(yearly_new_infections),
-                'num_acute_cases_yearly': int(yearly_acute_cases)
-            })
+    def run(self, duration_years=None, save=True):
+        """
+        Runs the compartmental model through the shared Simulation loop so the
+        output files follow the same schema as the agent-based model.
+        """
+        # Imported here because simulation -> engine -> compartmental_model.
+        from engine import as_engine
+        from simulation import Simulation
 
-        # Save Files
-        fname = f"{SIMULATION_YEARS}_{INITIAL_POPULATION}_{self.vaccine_campaign_name}_ODE"
-        print(fname)
-        with open(f'{fname}_population_history.json', 'w') as f:
-            json.dump(self.population_history, f, indent=4)
-            
-        with open(f'{fname}_sir_history.json', 'w') as f:
-            json.dump(self.sir_history, f, indent=4)
-            
-        with open(f'{fname}_environment_history.json', 'w') as f:
-            json.dump(self.environment_history, f, indent=4)
-            
-        print("Simulation Complete. Files saved.")
+        duration_years = duration_years if duration_years is not None else SIMULATION_YEARS
+        print(f"Running Compartmental Model for {duration_years} years...")
+
+        result = Simulation(as_engine(self)).run(duration_years=duration_years, save=save)
+        self.population_history = result.population_history
+        self.sir_history = result.sir_history
+        self.environment_history = result.environment_history
+        return result
+
+def compile_ode_kernels():
+    """
+    Compiles the ODE kernels (or loads them from the on-disk cache) for both compiled
+    solvers on a one-day dummy run.
+
+    Returns:
+        float: Seconds spent compiling (or loading) the kernels.
+    """
+    start_time = time.perf_counter()
+    for solver in ('rk4', 'rk45'):
+        CompartmentalModel(initial_population=1000, initial_infected_count=10, solver=solver).advance_days(0, 1)
+    return time.perf_counter() - start_time
 
 if __name__ == "__main__":
     model = CompartmentalModel()
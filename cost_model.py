@@ -0,0 +1,292 @@
+"""
+Wall-time and peak-memory estimates for a run, before launching it.
+
+The cost of a run is modelled per phase from a short micro-benchmark of this
+host (calibrate()), cached in CALIBRATION_FILE for later processes:
+
+    estimate = estimate_cost('abm', initial_population=10000000, years=20)
+    estimate['wall_time'], estimate['peak_memory']   # seconds, bytes
+    describe(estimate)                               # '~2 h 05 min, 3.1 GB peak'
+
+- Simulation time per day is linear in the population (a + b * N), fitted
+  from two benchmark populations per engine, and applied to the population
+  expected over the run (it grows with births).
+- Initialization is linear in the population too; kernel compilation (or
+  loading from the cache) is measured once.
+- Model state memory is linear in the population, times TRANSIENT_FACTOR for
+  the agent engine, whose add_agents() copies every array when births arrive.
+- Histories cost a fixed number of bytes per simulated day, in memory and on disk,
+  plus the JSON write (and, for web jobs, the figure cache) at the end.
+
+The kernels are single-threaded: concurrent runs share the CPUs, so with
+more concurrent_runs than CPUs each run slows down proportionally.
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+
+CALIBRATION_FILE = 'cost_calibration.json'
+BENCHMARK_POPULATIONS = (20000, 200000)
+BENCHMARK_DAYS = 30
+# add_agents() concatenates, so each agent array briefly exists twice
+TRANSIENT_FACTOR = {'abm': 2.0}
+# Annual growth bound used to size the population over a run (births only, ignoring deaths)
+ANNUAL_GROWTH = 0.014
+
+_calibration = None
+_calibration_lock = threading.Lock() # Concurrent web requests share one calibration
+
+
+def host_id():
+    """Identifies the hardware and software a calibration was measured on."""
+    return f"{platform.node()}|{os.cpu_count()}|{platform.python_version()}|numpy {np.__version__}"
+
+
+def total_memory():
+    """Physical memory of the host in bytes (None if unknown)."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _fit_line(xs, ys):
+    """Intercept and slope of the line through the benchmark points (slope clipped at 0)."""
+    slope = max((ys[-1] - ys[0]) / (xs[-1] - xs[0]), 0.0)
+    return max(ys[0] - slope * xs[0], 0.0), slope
+
+
+def _model_bytes(model):
+    return sum(value.nbytes for value in vars(model).values() if isinstance(value, np.ndarray))
+
+
+def _benchmark_engine(engine_name, population, days):
+    """Times initialization and days of simulation of one engine, and measures its state size."""
+    from engine import make_engine
+    from model import set_seed
+
+    set_seed(0)
+    engine = make_engine(engine_name, initial_population=population,
+                         initial_infected_count=max(1, population * 3 // 100))
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        engine.initialize()
+        initialize_time = time.perf_counter() - start
+        engine.vaccinate(1)
+        for _ in engine.advance(0, 1): # The first day may still touch lazily loaded code
+            pass
+        start = time.perf_counter()
+        for _ in engine.advance(1, days):
+            pass
+        day_time = (time.perf_counter() - start) / days
+    return initialize_time, day_time, _model_bytes(engine.model)
+
+
+def _benchmark_outputs(directory):
+    """
+    Measures the per-day memory, disk size and write time of the histories, and
+    the time to build the figure cache, from a one-year ODE run.
+    """
+    from engine import make_engine
+    from simulation import Simulation
+    from figure_cache import build_figure_cache
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = Simulation(make_engine('ode', initial_population=100000, initial_infected_count=3000)).run(1, save=False)
+    history_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    days = len(result.sir_history)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result.save(directory, update_latest=False, catalog=False)
+        save_time = time.perf_counter() - start
+        disk_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        start = time.perf_counter()
+        build_figure_cache(result.name, directory)
+        figure_time = time.perf_counter() - start
+    return {
+        'history_bytes_per_day': history_bytes / days,
+        'disk_bytes_per_day': disk_bytes / days,
+        'save_time_per_day': save_time / days,
+        'figure_time_per_day': figure_time / days,
+    }
+
+
+def calibrate(engines=None, save=True):
+    """
+    Runs the micro-benchmark (a few tens of seconds) and stores the fitted coefficients.
+
+    Args:
+        engines (list): Engine names to benchmark (default: all of engine.ENGINES).
+        save (bool): Whether to write CALIBRATION_FILE.
+
+    Returns:
+        dict: The calibration: per-engine coefficients, output costs and the base process memory.
+    """
+    global _calibration
+    from engine import ENGINES
+
+    engines = list(engines or ENGINES)
+    calibration = {'host': host_id(), 'created_at': time.time(), 'cpu_count': os.cpu_count() or 1, 'engines': {}}
+    for engine_name in engines:
+        engine = ENGINES[engine_name]()
+        with contextlib.redirect_stdout(io.StringIO()):
+            compile_time = engine.warm_up()
+        measurements = [_benchmark_engine(engine_name, population, BENCHMARK_DAYS) for population in BENCHMARK_POPULATIONS]
+        initialize, day, state = (list(values) for values in zip(*measurements))
+        calibration['engines'][engine_name] = {
+            'compile_time': compile_time,
+            'initialize': _fit_line(BENCHMARK_POPULATIONS, initialize),
+            'day': _fit_line(BENCHMARK_POPULATIONS, day),
+            'state_bytes': _fit_line(BENCHMARK_POPULATIONS, state),
+        }
+        print(f"Calibrated '{engine_name}': {day[-1] * 1e3:.3f} ms/day at N={BENCHMARK_POPULATIONS[-1]:,}")
+
+    # Peak resident size so far: interpreter, numba, numpy, the kernels and the (small) benchmark models
+    calibration['base_memory'] = _peak_rss()
+    directory = tempfile.mkdtemp(prefix='typhoid_cost_')
+    try:
+        calibration['outputs'] = _benchmark_outputs(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    # Mostly plotly, loaded only to build the figure cache
+    calibration['outputs']['figure_memory'] = max(_peak_rss() - calibration['base_memory'], 0)
+
+    if save:
+        with open(CALIBRATION_FILE, 'w') as f:
+            json.dump(calibration, f, indent=4)
+    _calibration = calibration
+    return calibration
+
+
+def load_calibration(recalibrate=False):
+    """
+    Returns this host's calibration: from memory, from CALIBRATION_FILE, or by
+    running calibrate() when neither matches the host.
+    """
+    global _calibration
+    with _calibration_lock:
+        if _calibration is not None and not recalibrate:
+            return _calibration
+        if not recalibrate and os.path.exists(CALIBRATION_FILE):
+            with open(CALIBRATION_FILE, 'r') as f:
+                stored = json.load(f)
+            if stored.get('host') == host_id():
+                _calibration = stored
+                return stored
+        return calibrate()
+
+
+def estimate_cost(engine, initial_population, years, concurrent_runs=1, save=True, figure_cache=False,
+                  include_compile=True, calibration=None):
+    """
+    Predicts the wall time and peak memory of a run.
+
+    Args:
+        engine (str): Engine name (see engine.ENGINES).
+        initial_population (int): Initial population.
+        years (int): Length of the run.
+        concurrent_runs (int): Runs sharing the host at the same time (e.g. the job workers).
+        save (bool): Whether the histories are written to disk.
+        figure_cache (bool): Whether the web app's figure cache is built afterwards.
+        include_compile (bool): Whether the run compiles (or loads) the kernels itself; warm
+            job workers already have.
+        calibration (dict): Coefficients from calibrate() (default: load_calibration()).
+
+    Returns:
+        dict: 'wall_time' (seconds) and 'peak_memory' (bytes) with their per-phase
+        'time_breakdown' and 'memory_breakdown', 'output_bytes' on disk, and the
+        host's 'total_memory'.
+
+    Raises:
+        ValueError: If years or initial_population is not positive, or the engine is not calibrated.
+    """
+    if years <= 0 or initial_population <= 0:
+        raise ValueError(f"A run needs a positive duration and population, got {years} years and N={initial_population}")
+    calibration = calibration or load_calibration()
+    if engine not in calibration['engines']:
+        raise ValueError(f"No calibration for engine '{engine}'. Choose from: {', '.join(calibration['engines'])}")
+    coefficients = calibration['engines'][engine]
+    outputs = calibration['outputs']
+    days = int(years) * 365
+    final_population = initial_population * (1 + ANNUAL_GROWTH) ** years
+    mean_population = (initial_population + final_population) / 2
+    slowdown = max(1.0, concurrent_runs / calibration['cpu_count'])
+
+    def line(name, population):
+        intercept, slope = coefficients[name]
+        return intercept + slope * population
+
+    time_breakdown = {
+        'compile': coefficients['compile_time'] if include_compile else 0.0,
+        'initialize': line('initialize', initial_population) * slowdown,
+        'simulate': line('day', mean_population) * days * slowdown,
+        'save': outputs['save_time_per_day'] * days if save else 0.0,
+        'figures': outputs['figure_time_per_day'] * days if figure_cache else 0.0,
+    }
+    history_bytes = outputs['history_bytes_per_day'] * days
+    memory_breakdown = {
+        'base': calibration['base_memory'],
+        'model_state': line('state_bytes', final_population) * TRANSIENT_FACTOR.get(engine, 1.0),
+        'histories': history_bytes,
+        # The figure cache loads plotly and reads the histories back while they are still held
+        'figures': outputs['figure_memory'] + history_bytes if figure_cache else 0.0,
+    }
+    return {
+        'engine': engine,
+        'initial_population': int(initial_population),
+        'years': int(years),
+        'concurrent_runs': concurrent_runs,
+        'wall_time': sum(time_breakdown.values()),
+        'time_breakdown': time_breakdown,
+        'peak_memory': sum(memory_breakdown.values()),
+        'memory_breakdown': memory_breakdown,
+        'output_bytes': outputs['disk_bytes_per_day'] * days if save else 0.0,
+        'total_memory': total_memory(),
+    }
+
+
+def _format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds // 60:.0f} min {seconds % 60:02.0f} s"
+    return f"{seconds // 3600:.0f} h {seconds % 3600 // 60:02.0f} min"
+
+
+def _format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def describe(estimate):
+    """One-line summary of an estimate, e.g. '~2 h 05 min, 3.1 GB peak'."""
+    return f"~{_format_duration(estimate['wall_time'])}, {_format_bytes(estimate['peak_memory'])} peak"
+
+
+if __name__ == "__main__":
+    calibration = load_calibration(recalibrate=True)
+    for engine_name in calibration['engines']:
+        for population in (100000, 1000000, 10000000):
+            estimate = estimate_cost(engine_name, population, 20, calibration=calibration)
+            print(f"{engine_name:<10} N={population:>10,} 20 years: {describe(estimate)}")
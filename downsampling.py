@@ -0,0 +1,130 @@
+"""
+Decimation of long daily time series for plotting.
+
+A 20-year run has 7,300 daily points per series, far more than a plot is
+wide. These helpers cut a series down to a pixel budget while keeping its
+visual shape:
+
+- lttb: Largest-Triangle-Three-Buckets, keeping in each bucket the point that
+  forms the largest triangle with its neighbours (peaks and turns survive).
+- minmax: the minimum and maximum of each bucket (every extreme survives).
+
+history_columns() turns a history file into columns for a day range, cached
+by file modification time so panning and zooming do not re-parse the JSON.
+"""
+import json
+import os
+from functools import lru_cache
+import numpy as np
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets decimation.
+
+    Returns:
+        np.ndarray: Indices of the n_out kept points (always including the first and
+        last). Points whose value is NaN are never kept.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if np.isnan(y).any():
+        finite = np.flatnonzero(~np.isnan(y))
+        return finite[lttb(x[finite], y[finite], n_out)]
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int) # n_out - 2 buckets between the end points
+    kept = np.empty(n_out, dtype=int)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = edges[b + 2] if b + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[b + 1] = previous
+    return kept
+
+
+def minmax(x, y, n_out):
+    """
+    Min/max decimation: the lowest and highest point of each of n_out / 2 buckets, in order.
+
+    Returns:
+        np.ndarray: Indices of the kept points. Points whose value is NaN are never kept.
+    """
+    y = np.asarray(y, dtype=float)
+    if np.isnan(y).any():
+        finite = np.flatnonzero(~np.isnan(y))
+        return finite[minmax(np.asarray(x)[finite], y[finite], n_out)]
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(int)
+    kept = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        low = start + int(np.argmin(y[start:end]))
+        high = start + int(np.argmax(y[start:end]))
+        kept.extend(sorted({low, high}))
+    return np.array(kept, dtype=int)
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """Returns the decimated (x, y) as lists."""
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}'. Choose from: {', '.join(METHODS)}")
+    kept = lttb(x, y, n_out) if method == 'lttb' else minmax(x, y, n_out)
+    return np.asarray(x)[kept].tolist(), np.asarray(y)[kept].tolist()
+
+
+@lru_cache(maxsize=32)
+def _load_columns(path, mtime):
+    """All columns of a daily history file (mtime is part of the cache key)."""
+    with open(path, 'r') as f:
+        records = json.load(f)
+    keys = [key for key in records[0] if not isinstance(records[0][key], (list, dict))] if records else []
+    return {key: np.array([record.get(key, np.nan) for record in records], dtype=float) for key in keys}
+
+
+def history_columns(path, variables=None, start_day=None, end_day=None):
+    """
+    Columns of a daily history file ('sir' or 'environment') over a day range.
+
+    Returns:
+        dict: 'day' and one array per requested variable (all variables by default).
+    """
+    columns = _load_columns(path, os.path.getmtime(path))
+    days = columns['day']
+    mask = np.ones(len(days), dtype=bool)
+    if start_day is not None:
+        mask &= days >= start_day
+    if end_day is not None:
+        mask &= days <= end_day
+    variables = variables or [key for key in columns if key != 'day']
+    unknown = [name for name in variables if name not in columns]
+    if unknown:
+        raise KeyError(f"Unknown variables: {', '.join(unknown)}")
+    return {'day': days[mask], **{name: columns[name][mask] for name in variables}}
+
+
+def downsample_columns(columns, n_points, method='lttb'):
+    """
+    Decimates every variable of history_columns() output to about n_points points.
+
+    Returns:
+        dict: {variable: {'day': [...], 'value': [...]}}; each variable keeps its own days.
+    """
+    return {
+        name: dict(zip(('day', 'value'), downsample(columns['day'], values, n_points, method)))
+        for name, values in columns.items() if name != 'day'
+    }
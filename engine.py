@@ -0,0 +1,405 @@
+"""
+Common engine interface shared by the typhoid models.
+
+Each engine wraps one model implementation (the agent-based Model or the
+CompartmentalModel) behind the same small set of calls, so that Simulation,
+the tuning scripts, the web app and the visualizers can switch between a fast
+and a detailed model without special-casing either one:
+
+    engine = make_engine("ode", initial_population=100000)
+    result = Simulation(engine).run(duration_years=10)
+
+Every engine returns its daily results in the dictionary format produced by
+Model.step, which is what gives all runs a single result schema.
+"""
+import numpy as np
+from model import Model, compile_kernels, AGGRESSIVE_COMPACTION_THRESHOLD
+from compartmental_model import CompartmentalModel, compile_ode_kernels
+from age_structured_model import AgeStructuredModel
+from stochastic_model import StochasticCompartmentalModel, compile_stochastic_kernels
+from initialparaandconst import (
+    DISEASE_STATES, VACCINATED, MALE, FEMALE, PYRAMID_AGE_BINS,
+    INITIAL_POPULATION, MALE_BIRTH_RATE, FEMALE_BIRTH_RATE
+)
+from reporting_config import DAILY_ENVIRONMENT_VARIABLES
+
+# CompartmentalModel state keys for each disease state name
+ODE_STATE_KEYS = {
+    'SUSCEPTIBLE': 'S', 'MATERNALLY_IMMUNE': 'M', 'PREPATENT': 'P', 'ACUTE': 'A',
+    'SUBCLINICAL': 'U', 'CHRONIC': 'C', 'RECOVERED': 'R', 'VACCINATED': 'V'
+}
+
+
+class Engine:
+    """
+    Base class describing the interface every simulation engine provides.
+
+    Subclasses wrap a model instance in `self.model` and must implement
+    initialize, vaccinate, step, state_counts, population_snapshot,
+    checkpoint and restore. Everything else is shared.
+    """
+    name = None
+    output_suffix = ""
+    _last_results = None
+    # Start from the endemic equilibrium (see equilibrium.py); engines that support it take it as an argument
+    start_at_equilibrium = False
+
+    def initialize(self):
+        """Sets up the initial population state."""
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Performs any one-time setup (e.g. JIT compilation). Returns the time taken in seconds."""
+        return 0.0
+
+    def vaccinate(self, year):
+        """Runs the yearly vaccination campaign."""
+        raise NotImplementedError
+
+    def memory_usage(self):
+        """
+        Bytes held by the model state, with the keys of Model.memory_usage ('agents',
+        'bytes_per_agent', 'agent_arrays', 'free_capacity', 'transient',
+        'compaction_threshold'). The compartmental engines' state does not grow
+        with the population.
+        """
+        state_bytes = sum(value.nbytes for value in vars(self.model).values() if isinstance(value, np.ndarray))
+        return {'agents': self.total_population(), 'bytes_per_agent': 0, 'agent_arrays': state_bytes,
+                'free_capacity': 0, 'transient': 0, 'compaction_threshold': 0.0}
+
+    def use_compact_dtypes(self):
+        """Switches the model state to narrower dtypes. Returns whether the engine supports it."""
+        return False
+
+    def use_aggressive_compaction(self):
+        """Makes the model release dead agents' memory sooner. Returns whether the engine supports it."""
+        return False
+
+    def set_profiler(self, profiler):
+        """
+        Attaches an instrumentation.Profiler (None detaches it) to the model's own phases.
+
+        Returns:
+            bool: Whether the model times the phases of its step itself; otherwise the
+            caller times the whole step.
+        """
+        return False
+
+    def step(self, current_day):
+        """Advances the model by one day and returns the daily results dictionary."""
+        raise NotImplementedError
+
+    def advance(self, start_day, n_days):
+        """
+        Advances the model by n_days days, starting after start_day.
+
+        Yields:
+            dict: The daily results dictionary for each simulated day, as it is produced.
+        """
+        for i in range(n_days):
+            yield self.step(start_day + i + 1)
+
+    def state_counts(self):
+        """Returns the current number of people in each disease state, keyed by state name."""
+        raise NotImplementedError
+
+    def total_population(self):
+        """Returns the current number of living people."""
+        return int(sum(self.state_counts().values()))
+
+    def environment(self):
+        """Returns the latest values of the daily environment variables."""
+        if self._last_results is None:
+            return {'contagion': self.model.environmental_contagion}
+        return {var: self._last_results[var] for var in DAILY_ENVIRONMENT_VARIABLES if var in self._last_results}
+
+    def population_snapshot(self):
+        """Returns the male/female age pyramid counts and the vaccinated count."""
+        raise NotImplementedError
+
+    def checkpoint(self):
+        """Returns a self-contained copy of the model state that restore() can resume from."""
+        raise NotImplementedError
+
+    def restore(self, checkpoint):
+        """Restores a state previously returned by checkpoint()."""
+        raise NotImplementedError
+
+    @property
+    def initial_population(self):
+        return self.model.initial_population
+
+    @property
+    def campaign_name(self):
+        return self.model.vaccine_campaign_name
+
+    def output_name(self, duration_years):
+        """Returns the base filename used for this run's history files."""
+        return f"{duration_years}_{self.initial_population}_{self.campaign_name}{self.output_suffix}"
+
+    def parameters(self):
+        """Returns the transmission parameters the wrapped model is running with."""
+        return {
+            'initial_population': int(self.initial_population),
+            'initial_infected_count': int(self.model.initial_infected_count),
+            'base_transmission_risk': float(self.model.base_transmission_risk),
+            'k_half': float(self.model.k_half),
+            'environmental_shedding_rate': float(self.model.environmental_shedding_rate),
+            'environmental_decay_rate': float(self.model.environmental_decay_rate),
+        }
+
+
+class ABMEngine(Engine):
+    """Engine backed by the agent-based Model."""
+    name = "abm"
+
+    def __init__(self, model=None, initial_population=None, male_birth_rate=None,
+                 female_birth_rate=None, start_at_equilibrium=False, **overrides):
+        if model is None:
+            model = Model(
+                initial_population=initial_population if initial_population is not None else INITIAL_POPULATION,
+                male_birth_rate=male_birth_rate if male_birth_rate is not None else MALE_BIRTH_RATE,
+                female_birth_rate=female_birth_rate if female_birth_rate is not None else FEMALE_BIRTH_RATE,
+                **overrides
+            )
+        self.model = model
+        # Start from the endemic equilibrium instead of the seeded prepatent infections
+        self.start_at_equilibrium = start_at_equilibrium
+        self._last_results = None
+
+    def initialize(self):
+        self.model.initialize_population()
+        if self.start_at_equilibrium:
+            from equilibrium import seed_model_at_equilibrium
+            seed_model_at_equilibrium(self.model)
+        self._last_results = None
+
+    def warm_up(self):
+        # Builds the kernels against a throwaway population so the real one is untouched.
+        return compile_kernels(compact_dtypes=self.model.compact_dtypes)
+
+    def vaccinate(self, year):
+        self.model.vaccinate(year)
+
+    def set_profiler(self, profiler):
+        self.model.profiler = profiler
+        return True
+
+    def memory_usage(self):
+        return self.model.memory_usage()
+
+    def use_compact_dtypes(self):
+        self.model.use_compact_dtypes()
+        return True
+
+    def use_aggressive_compaction(self):
+        self.model.compaction_threshold = AGGRESSIVE_COMPACTION_THRESHOLD
+        self.model.compact()
+        return True
+
+    def step(self, current_day):
+        self._last_results = self.model.step(current_day)
+        return self._last_results
+
+    def state_counts(self):
+        alive_states = self.model.disease_state[self.model.is_alive]
+        counts = np.bincount(alive_states, minlength=len(DISEASE_STATES))
+        return {name: int(counts[i]) for i, name in DISEASE_STATES.items()}
+
+    def total_population(self):
+        return int(np.sum(self.model.is_alive))
+
+    def population_snapshot(self):
+        alive_mask = self.model.is_alive
+        alive_ages_years = self.model.age_days[alive_mask] // 365
+        alive_genders = self.model.gender[alive_mask]
+
+        # Use np.histogram to bin ages for each gender
+        male_hist, _ = np.histogram(alive_ages_years[alive_genders == MALE], bins=PYRAMID_AGE_BINS)
+        female_hist, _ = np.histogram(alive_ages_years[alive_genders == FEMALE], bins=PYRAMID_AGE_BINS)
+        vaccinated_count = np.sum(self.model.disease_state[alive_mask] == VACCINATED)
+        return {
+            'male_age_counts': male_hist.tolist(),
+            'female_age_counts': female_hist.tolist(),
+            'vaccinated_count': int(vaccinated_count)
+        }
+
+    def checkpoint(self):
+        return {
+            'is_alive': self.model.is_alive.copy(),
+            'age_days': self.model.age_days.copy(),
+            'gender': self.model.gender.copy(),
+            'disease_state': self.model.disease_state.copy(),
+            'days_in_state': self.model.days_in_state.copy(),
+            'state_duration': self.model.state_duration.copy(),
+            'environmental_contagion': self.model.environmental_contagion,
+            'vaccine_campaign_name': self.model.vaccine_campaign_name,
+        }
+
+    def restore(self, checkpoint):
+        for key, value in checkpoint.items():
+            setattr(self.model, key, value.copy() if isinstance(value, np.ndarray) else value)
+        self._last_results = None
+
+
+class ODEEngine(Engine):
+    """Engine backed by the deterministic CompartmentalModel."""
+    name = "ode"
+    output_suffix = "_ODE"
+
+    def __init__(self, model=None, start_at_equilibrium=False, **overrides):
+        self.model = model if model is not None else CompartmentalModel(**overrides)
+        self.start_at_equilibrium = start_at_equilibrium
+        self._last_results = None
+
+    @property
+    def initial_population(self):
+        return self.model.population
+
+    def initialize(self):
+        self.model.initialize_state()
+        if self.start_at_equilibrium:
+            from equilibrium import apply_equilibrium
+            apply_equilibrium(self.model)
+        self._last_results = None
+
+    def warm_up(self):
+        if self.model.solver == 'python':
+            return 0.0
+        return compile_ode_kernels()
+
+    def vaccinate(self, year):
+        self.model.vaccinate(year)
+
+    def step(self, current_day):
+        return self._package(self.model.step(current_day))
+
+    def advance(self, start_day, n_days):
+        # The compiled solvers integrate the whole block in one call
+        for res in self.model.advance(start_day, n_days):
+            yield self._package(res)
+
+    def _package(self, res):
+        # Repackage into the Model.step format: state counts ordered by state index
+        # plus the environment and yearly aggregate variables.
+        results = {key: value for key, value in res.items() if key not in DISEASE_STATES.values()}
+        results['state_counts'] = np.array([res[name] for name in ODE_STATE_KEYS], dtype=float)
+        self._last_results = results
+        return results
+
+    def state_counts(self):
+        return {name: int(round(self.model.state[key])) for name, key in ODE_STATE_KEYS.items()}
+
+    def population_snapshot(self):
+        # The compartmental model has no age structure; the pyramid is left empty.
+        num_bins = len(PYRAMID_AGE_BINS) - 1
+        return {
+            'male_age_counts': [0] * num_bins,
+            'female_age_counts': [0] * num_bins,
+            'vaccinated_count': int(round(self.model.state['V']))
+        }
+
+    def checkpoint(self):
+        return {
+            'state': dict(self.model.state),
+            'environmental_contagion': self.model.environmental_contagion,
+        }
+
+    def restore(self, checkpoint):
+        self.model.state = dict(checkpoint['state'])
+        self.model.environmental_contagion = checkpoint['environmental_contagion']
+        self._last_results = None
+
+
+class AgeStructuredEngine(ODEEngine):
+    """Engine backed by the age- and gender-structured AgeStructuredModel."""
+    name = "ode_age"
+    output_suffix = "_ODE_AGE"
+
+    def __init__(self, model=None, start_at_equilibrium=False, **overrides):
+        if start_at_equilibrium:
+            raise ValueError("The equilibrium start is not available for the age-structured engine")
+        self.model = model if model is not None else AgeStructuredModel(**overrides)
+        self._last_results = None
+
+    def warm_up(self):
+        return 0.0
+
+    def population_snapshot(self):
+        male_counts, female_counts = self.model.age_pyramid()
+        return {
+            'male_age_counts': np.rint(male_counts).astype(int).tolist(),
+            'female_age_counts': np.rint(female_counts).astype(int).tolist(),
+            'vaccinated_count': int(round(self.model.state['V']))
+        }
+
+    def checkpoint(self):
+        return {
+            'groups': self.model.groups.copy(),
+            'cumulative': self.model.cumulative.copy(),
+            'environmental_contagion': self.model.environmental_contagion,
+        }
+
+    def restore(self, checkpoint):
+        self.model.groups = checkpoint['groups'].copy()
+        self.model.cumulative = checkpoint['cumulative'].copy()
+        self.model.environmental_contagion = checkpoint['environmental_contagion']
+        self.model._sync_state()
+        self._last_results = None
+
+
+class StochasticEngine(ODEEngine):
+    """Engine backed by the StochasticCompartmentalModel (Gillespie or tau-leap)."""
+    name = "stochastic"
+    output_suffix = "_STOCH"
+
+    def __init__(self, model=None, start_at_equilibrium=False, **overrides):
+        self.model = model if model is not None else StochasticCompartmentalModel(**overrides)
+        self.start_at_equilibrium = start_at_equilibrium
+        self._last_results = None
+
+    def initialize(self):
+        super().initialize()
+        if self.start_at_equilibrium:
+            # Whole people only
+            for key in ('S', 'M', 'P', 'A', 'U', 'C', 'R', 'V'):
+                self.model.state[key] = float(round(self.model.state[key]))
+
+    def warm_up(self):
+        return compile_stochastic_kernels()
+
+    def _package(self, res):
+        results = super()._package(res)
+        results['state_counts'] = np.rint(results['state_counts']).astype(np.int64) # Whole people
+        return results
+
+
+# Registry of available engines, keyed by the name used in configs, forms and file metadata.
+ENGINES = {
+    ABMEngine.name: ABMEngine,
+    ODEEngine.name: ODEEngine,
+    AgeStructuredEngine.name: AgeStructuredEngine,
+    StochasticEngine.name: StochasticEngine,
+}
+
+
+def make_engine(name, **params):
+    """Creates an engine by name, passing any parameter overrides to the underlying model."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine '{name}'. Available engines: {', '.join(ENGINES)}")
+    return ENGINES[name](**params)
+
+
+def as_engine(model):
+    """Wraps a bare Model or CompartmentalModel in its engine; engines are returned unchanged."""
+    if isinstance(model, Engine):
+        return model
+    if isinstance(model, Model):
+        return ABMEngine(model)
+    if isinstance(model, AgeStructuredModel):
+        return AgeStructuredEngine(model)
+    if isinstance(model, StochasticCompartmentalModel):
+        return StochasticEngine(model)
+    if isinstance(model, CompartmentalModel):
+        return ODEEngine(model)
+    raise TypeError(f"Cannot build an engine from {type(model).__name__}")
@@ -0,0 +1,237 @@
+"""
+Endemic equilibrium of the compartmental model, used to start runs at steady state.
+
+Runs normally start from INITIAL_INFECTED_COUNT prepatent seeds and a clean
+environment, and spend years in the transient before reaching endemic
+behaviour. endemic_equilibrium() computes the steady-state composition of the
+population (and the environmental contagion level) directly, and
+seed_model_at_equilibrium() places the agents of a Model into those states:
+
+    model.initialize_population()
+    seed_model_at_equilibrium(model)
+
+The population keeps growing through births, so the equilibrium is that of
+the composition at the model's population size, with the seasonality
+replaced by its yearly mean.
+"""
+import numpy as np
+from compartmental_model import CompartmentalModel, STATE_KEYS, _load_ode_kernels
+from initialparaandconst import (
+    SUSCEPTIBLE, MATERNALLY_IMMUNE, PREPATENT, ACUTE, SUBCLINICAL, RECOVERED, VACCINATED,
+    MATERNAL_IMMUNITY_DURATION, PREPATENT_DURATION, ACUTE_DURATION_UNDER_30, ACUTE_DURATION_OVER_30,
+    SUBCLINICAL_DURATION_UNDER_30, SUBCLINICAL_DURATION_OVER_30, RECOVERY_DURATION, Vaccine
+)
+
+NUM_COMPARTMENTS = 8
+
+
+def _equilibrium_parameters(model):
+    """The model's parameter vector with a coupled environment and constant (mean) seasonality."""
+    k = _load_ode_kernels()
+    params = model.parameter_vector()
+    params[k.PAR_COUPLED_ENV] = 1.0
+    mean_seasonality = np.mean([k.seasonality_multiplier(float(day), params) for day in range(1, 366)])
+    params[k.PAR_SEASON_MIN] = mean_seasonality
+    params[k.PAR_SEASON_PEAK] = mean_seasonality
+    return params
+
+
+def _residual(z, population, environment_scale, params):
+    """
+    Steady-state residual of the population composition z[:8] (fractions) and the
+    scaled environment z[8]. The first equation is replaced by the constraint that
+    the fractions sum to 1, since the composition equations are linearly dependent.
+    """
+    k = _load_ode_kernels()
+    fractions = z[:NUM_COMPARTMENTS]
+    y = np.zeros(k.NUM_STATE)
+    y[:NUM_COMPARTMENTS] = population * fractions
+    y[k.Y_E] = z[NUM_COMPARTMENTS] * environment_scale
+    dy = k.ode_rhs(0.0, y, params)
+
+    growth = dy[:NUM_COMPARTMENTS].sum() / population
+    residual = np.empty(NUM_COMPARTMENTS + 1)
+    residual[:NUM_COMPARTMENTS] = dy[:NUM_COMPARTMENTS] / population - fractions * growth
+    residual[0] = fractions.sum() - 1.0
+    residual[NUM_COMPARTMENTS] = dy[k.Y_E] / environment_scale
+    return residual
+
+
+def endemic_equilibrium(model=None, burn_in_years=50, tol=1e-10, max_iter=50):
+    """
+    Computes the endemic equilibrium of a CompartmentalModel's parameter set.
+
+    A fixed-point stage (daily RK4 steps with the population renormalized to its
+    size) brings the state near the endemic branch, then Newton's method with a
+    finite-difference Jacobian converges to the equilibrium.
+
+    Args:
+        model (CompartmentalModel): Parameter set and population size (defaults to CompartmentalModel()).
+        burn_in_years (int): Maximum length of the fixed-point stage.
+        tol (float): Convergence tolerance on the residual (fractions per day).
+        max_iter (int): Maximum number of Newton iterations.
+
+    Returns:
+        dict: 'state' (people per compartment, keyed like CompartmentalModel.state),
+        'fractions', 'environmental_contagion', 'infection_pressure', 'residual'
+        (max abs), 'newton_iterations' and 'converged'.
+    """
+    k = _load_ode_kernels()
+    model = model if model is not None else CompartmentalModel()
+    population = float(model.population)
+    params = _equilibrium_parameters(model)
+    decay_rate = params[k.PAR_DECAY_RATE]
+    # Contagion level if everyone shed; keeps the environment unknown of order 1
+    environment_scale = max(params[k.PAR_SHEDDING_RATE] * population / decay_rate, 1.0)
+
+    # --- Fixed-point stage ---
+    y = np.zeros(k.NUM_STATE)
+    y[k.Y_S] = population - model.initial_infected_count
+    y[k.Y_P] = model.initial_infected_count
+    for _ in range(burn_in_years):
+        previous = y[:NUM_COMPARTMENTS] / y[:NUM_COMPARTMENTS].sum()
+        for day in range(365):
+            y = np.maximum(k.rk4_step(0.0, y, 1.0, params), 0.0)
+            y[:NUM_COMPARTMENTS] *= population / y[:NUM_COMPARTMENTS].sum()
+        if np.max(np.abs(y[:NUM_COMPARTMENTS] / population - previous)) < 1e-6:
+            break
+
+    # --- Newton stage ---
+    z = np.append(y[:NUM_COMPARTMENTS] / population, y[k.Y_E] / environment_scale)
+    residual = _residual(z, population, environment_scale, params)
+    iterations = 0
+    while np.max(np.abs(residual)) > tol and iterations < max_iter:
+        jacobian = np.empty((len(z), len(z)))
+        for j in range(len(z)):
+            h = 1e-7 * max(abs(z[j]), 1e-3)
+            z_step = z.copy()
+            z_step[j] += h
+            jacobian[:, j] = (_residual(z_step, population, environment_scale, params) - residual) / h
+        try:
+            z = np.maximum(z - np.linalg.solve(jacobian, residual), 0.0)
+        except np.linalg.LinAlgError:
+            break
+        residual = _residual(z, population, environment_scale, params)
+        iterations += 1
+
+    fractions = z[:NUM_COMPARTMENTS]
+    environmental_contagion = z[NUM_COMPARTMENTS] * environment_scale
+    hazard_factor = environmental_contagion / (params[k.PAR_K_HALF] + environmental_contagion) if environmental_contagion > 0 else 0.0
+    return {
+        'state': {key: float(population * fractions[i]) for i, key in enumerate(STATE_KEYS[:NUM_COMPARTMENTS])},
+        'fractions': fractions,
+        'environmental_contagion': float(environmental_contagion),
+        'infection_pressure': float(params[k.PAR_BASE_RISK] * hazard_factor * params[k.PAR_SEASON_MIN]),
+        'residual': float(np.max(np.abs(residual))),
+        'newton_iterations': iterations,
+        'converged': bool(np.max(np.abs(residual)) <= tol),
+    }
+
+
+def _warn_unless_converged(equilibrium):
+    if not equilibrium['converged']:
+        print(f"Warning: the endemic equilibrium did not converge (residual {equilibrium['residual']:.2e} after "
+              f"{equilibrium['newton_iterations']} Newton iterations); the run starts from an approximate state.")
+
+
+def apply_equilibrium(model, equilibrium=None):
+    """
+    Sets a CompartmentalModel's compartments and environment to the endemic
+    equilibrium, with a warning if it did not converge.
+    """
+    equilibrium = equilibrium if equilibrium is not None else endemic_equilibrium(model)
+    _warn_unless_converged(equilibrium)
+    model.state.update(equilibrium['state'])
+    model.state['CumInf'] = 0.0
+    model.state['CumAcute'] = 0.0
+    model.environmental_contagion = equilibrium['environmental_contagion']
+    return equilibrium
+
+
+def _stationary_time_in_state(mean, std, size):
+    """
+    Draws (state_duration, days_in_state) for people found in a state at a random
+    time: durations are length-biased (longer stays are more likely to be caught)
+    and the time already spent is uniform within the stay.
+    """
+    if size == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int32)
+    candidates = np.maximum(np.random.normal(mean, std, size=2 * size), 1.0)
+    durations = np.random.choice(candidates, size=size, p=candidates / candidates.sum())
+    days_in_state = np.floor(np.random.uniform(0.0, durations)).astype(np.int32)
+    return durations, days_in_state
+
+
+def seed_model_at_equilibrium(model, equilibrium=None):
+    """
+    Assigns the agents of an initialized Model to disease states in the endemic
+    equilibrium proportions, with the time already spent in each state drawn from
+    its stationary distribution, and sets the environment to its equilibrium level.
+    Maternal immunity is only assigned to infants (younger than
+    MATERNAL_IMMUNITY_DURATION); ages are left as initialized.
+    Warns if the equilibrium did not converge.
+
+    Args:
+        model (Model): A Model whose population has been initialized.
+        equilibrium (dict): Result of endemic_equilibrium(); computed for the model's
+            parameters and population size when omitted.
+
+    Returns:
+        dict: The equilibrium that was applied.
+    """
+    if equilibrium is None:
+        equilibrium = endemic_equilibrium(CompartmentalModel(
+            initial_population=model.initial_population,
+            initial_infected_count=model.initial_infected_count,
+            base_transmission_risk=model.base_transmission_risk,
+            k_half=model.k_half,
+            environmental_shedding_rate=model.environmental_shedding_rate,
+            environmental_decay_rate=model.environmental_decay_rate,
+        ))
+
+    _warn_unless_converged(equilibrium)
+
+    alive_indices = np.where(model.is_alive)[0]
+    fractions = np.maximum(equilibrium['fractions'], 0.0)
+    fractions = fractions / fractions.sum()
+    # Maternal immunity first, among the infants; the other states over everyone else
+    infant_indices = np.where(model.age_days[alive_indices] < MATERNAL_IMMUNITY_DURATION)[0]
+    num_maternal = min(int(round(fractions[MATERNALLY_IMMUNE] * len(alive_indices))), len(infant_indices))
+    maternal = np.zeros(len(alive_indices), dtype=bool)
+    maternal[np.random.choice(infant_indices, size=num_maternal, replace=False)] = True
+    others = fractions.copy()
+    others[MATERNALLY_IMMUNE] = 0.0
+    states = np.full(len(alive_indices), MATERNALLY_IMMUNE)
+    states[~maternal] = np.random.choice(NUM_COMPARTMENTS, size=int(np.sum(~maternal)), p=others / others.sum())
+    model.disease_state[alive_indices] = states
+    model.days_in_state[alive_indices] = 0
+    model.state_duration[alive_indices] = 0.0
+
+    def assign(state, mean, std, mask=None):
+        selected = states == state
+        if mask is not None:
+            selected &= mask
+        indices = alive_indices[selected]
+        durations, days_in_state = _stationary_time_in_state(mean, std, len(indices))
+        model.state_duration[indices] = durations
+        model.days_in_state[indices] = days_in_state
+
+    over_30 = model.age_days[alive_indices] >= 30 * 365
+    assign(PREPATENT, *PREPATENT_DURATION)
+    assign(ACUTE, *ACUTE_DURATION_UNDER_30, mask=~over_30)
+    assign(ACUTE, *ACUTE_DURATION_OVER_30, mask=over_30)
+    assign(SUBCLINICAL, *SUBCLINICAL_DURATION_UNDER_30, mask=~over_30)
+    assign(SUBCLINICAL, *SUBCLINICAL_DURATION_OVER_30, mask=over_30)
+    assign(RECOVERED, *RECOVERY_DURATION)
+    assign(VACCINATED, *Vaccine.duration)
+
+    # Maternal immunity lasts a fixed period from birth. Initial ages are whole years
+    # (infants are age 0), so the time since birth is drawn within that period.
+    infants = alive_indices[maternal]
+    model.days_in_state[infants] = np.random.randint(0, MATERNAL_IMMUNITY_DURATION, size=len(infants))
+
+    # Chronic carriage is lifelong and susceptibility has no clock: both keep days_in_state = 0
+    model.environmental_contagion = equilibrium['environmental_contagion'] * len(alive_indices) / sum(equilibrium['state'].values())
+    print(f"Seeded {len(alive_indices)} agents at the endemic equilibrium "
+          f"({int(np.sum(states != SUSCEPTIBLE))} not susceptible).")
+    return equilibrium
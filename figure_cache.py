@@ -0,0 +1,103 @@
+"""
+Cache of the serialized Plotly figures shown on the web app's index page.
+
+Building the five figures means re-reading every history file and
+re-serializing large figures (the pyramid has one frame per year). The cache
+stores the serialized figures for a run, gzip-compressed, next to its history
+files (<name>_figures.json.gz), keyed by the modification times of the files
+they were built from. They are built once when a run finishes:
+
+    build_figure_cache(result.name, directory)
+    graphs = load_figures(result.name, directory)   # {'summary': '<json>', ...}
+
+load_figures() rebuilds a missing or stale cache, and keeps the latest
+payloads in memory so repeated page loads skip even the file read.
+"""
+import gzip
+import json
+import os
+import threading
+from results import history_path, latest_simulation_name
+
+# Figure name -> (visualizer module, history kind it plots)
+FIGURES = {
+    'summary': ('visualize_summary', 'population'),
+    'pyramid': ('visualize', 'population'),
+    'sir': ('visualize_sir', 'sir'),
+    'environment': ('visualize_environment', 'environment'),
+    'vaccination': ('visualize_vaccination', 'population'),
+}
+MEMORY_CACHE_SIZE = 8
+
+_memory_cache = {} # (directory, name) -> (key, graphs), least recently used first
+_memory_lock = threading.Lock()
+
+
+def cache_path(name, directory='.'):
+    return os.path.join(directory, f'{name}_figures.json.gz')
+
+
+def _cache_key(name, directory):
+    """Modification times of the history files a run's figures are built from."""
+    kinds = sorted({kind for _, kind in FIGURES.values()})
+    return {kind: os.path.getmtime(history_path(kind, name, directory)) for kind in kinds}
+
+
+def build_figure_cache(name=None, directory='.'):
+    """
+    Builds and serializes every figure of a run and writes the compressed cache.
+
+    Returns:
+        dict: The serialized figures, keyed by figure name.
+    """
+    import plotly
+
+    name = name if name is not None else latest_simulation_name(directory)
+    key = _cache_key(name, directory)
+    graphs = {}
+    for figure_name, (module_name, kind) in FIGURES.items():
+        module = __import__(module_name)
+        graphs[figure_name] = json.dumps(module.get_figure(history_path(kind, name, directory)),
+                                         cls=plotly.utils.PlotlyJSONEncoder)
+    # Write to a temporary file first so readers never see a partial cache
+    path = cache_path(name, directory)
+    with gzip.open(path + '.tmp', 'wt', compresslevel=6) as f:
+        json.dump({'key': key, 'figures': graphs}, f)
+    os.replace(path + '.tmp', path)
+    _remember((directory, name), key, graphs)
+    return graphs
+
+
+def _remember(cache_id, key, graphs):
+    with _memory_lock:
+        _memory_cache.pop(cache_id, None)
+        _memory_cache[cache_id] = (key, graphs)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.pop(next(iter(_memory_cache)))
+
+
+def load_figures(name=None, directory='.'):
+    """
+    Returns a run's serialized figures (default: the latest run), from memory or
+    the on-disk cache when they are up to date, rebuilding them otherwise.
+
+    Returns:
+        dict: JSON strings keyed by figure name.
+    """
+    name = name if name is not None else latest_simulation_name(directory)
+    key = _cache_key(name, directory)
+    cache_id = (directory, name)
+    with _memory_lock:
+        cached = _memory_cache.get(cache_id)
+        if cached is not None and cached[0] == key:
+            _memory_cache[cache_id] = _memory_cache.pop(cache_id) # Now the most recently used
+            return cached[1]
+
+    path = cache_path(name, directory)
+    if os.path.exists(path):
+        with gzip.open(path, 'rt') as f:
+            stored = json.load(f)
+        if stored['key'] == key:
+            _remember(cache_id, key, stored['figures'])
+            return stored['figures']
+    return build_figure_cache(name, directory)
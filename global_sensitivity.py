@@ -0,0 +1,301 @@
+"""
+Global sensitivity analysis (Sobol and Morris) of the simulation outputs.
+
+sensitivity_analysis.py varies one parameter at a time around the defaults,
+which cannot see interactions. This module samples the whole parameter space
+instead, runs every sample through any engine in a pool of worker processes
+and attributes the variance of each output to the parameters:
+
+    report = sobol_analysis(n=256, engine='ode', duration_years=10,
+                            initial_population=100000, initial_infected_count=3000)
+    report['indices']['cumulative_infections']['k_half']['ST']
+
+sobol_analysis() uses a Saltelli design (n * (d + 2) runs for d parameters) and
+returns first-order (S1) and total (ST) indices with bootstrap confidence
+intervals. morris_analysis() is the cheaper screening alternative
+(n_trajectories * (d + 1) runs): elementary effects mu, mu* and sigma.
+
+Ranges map each parameter to (low, high, scale), with scale 'log' or 'linear'.
+With a stochastic engine ('stochastic' or 'abm') every run gets its own seed,
+so run-to-run noise shows up as unexplained variance (ST well above S1).
+"""
+import time
+import warnings
+import numpy as np
+from parallel_runs import run_simulations
+from initialparaandconst import (
+    BASE_TRANSMISSION_RISK, K_HALF, ENVIRONMENTAL_SHEDDING_RATE, ENVIRONMENTAL_CONTAGION_DECAY_RATE
+)
+
+OUTPUTS = ('cumulative_infections', 'cumulative_acute_cases', 'peak_acute', 'dalys')
+
+# Default ranges: a factor of 10 either side of the transmission parameters and 2 for the decay rate
+DEFAULT_RANGES = {
+    'base_transmission_risk': (BASE_TRANSMISSION_RISK / 10, BASE_TRANSMISSION_RISK * 10, 'log'),
+    'k_half': (K_HALF / 10, K_HALF * 10, 'log'),
+    'environmental_shedding_rate': (ENVIRONMENTAL_SHEDDING_RATE / 10, ENVIRONMENTAL_SHEDDING_RATE * 10, 'log'),
+    'environmental_decay_rate': (ENVIRONMENTAL_CONTAGION_DECAY_RATE / 2, ENVIRONMENTAL_CONTAGION_DECAY_RATE * 2, 'log'),
+}
+INTEGER_PARAMETERS = ('initial_population', 'initial_infected_count')
+
+
+# --- Designs ---
+
+def unit_samples(n, dimensions, seed):
+    """n points in the unit hypercube: scrambled Sobol points when scipy is available, uniform otherwise."""
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        return np.random.default_rng(seed).random((n, dimensions))
+    with warnings.catch_warnings(): # Sizes that are not powers of 2 lose some balance, not validity
+        warnings.simplefilter('ignore', UserWarning)
+        return qmc.Sobol(dimensions, scramble=True, seed=seed).random(n)
+
+
+def scale_samples(unit, ranges):
+    """
+    Maps unit-hypercube points to parameter values.
+
+    Returns:
+        list: One dict of parameter values per row of unit.
+    """
+    names = list(ranges)
+    columns = []
+    for j, name in enumerate(names):
+        low, high, scale = ranges[name]
+        if scale == 'log':
+            values = np.exp(np.log(low) + unit[:, j] * (np.log(high) - np.log(low)))
+        elif scale == 'linear':
+            values = low + unit[:, j] * (high - low)
+        else:
+            raise ValueError(f"Unknown scale '{scale}' for {name}. Use 'log' or 'linear'")
+        columns.append(np.rint(values).astype(int) if name in INTEGER_PARAMETERS else values)
+    return [{name: column[i].item() for name, column in zip(names, columns)} for i in range(len(unit))]
+
+
+def saltelli_design(ranges, n, seed=None):
+    """
+    Saltelli design: the base matrices A and B and, for each parameter i, A with
+    column i taken from B (AB_i).
+
+    Returns:
+        np.ndarray: (n * (d + 2)) x d unit points, stacked as A, B, AB_1, ..., AB_d.
+    """
+    d = len(ranges)
+    base = unit_samples(n, 2 * d, seed)
+    A, B = base[:, :d], base[:, d:]
+    blocks = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    return np.vstack(blocks)
+
+
+def morris_design(ranges, n_trajectories, levels=4, seed=None):
+    """
+    Morris one-at-a-time trajectories on a levels-point grid. Each trajectory
+    starts at a random grid point and moves every parameter once, in random
+    order, by delta = levels / (2 * (levels - 1)).
+
+    Returns:
+        Tuple: ((n_trajectories * (d + 1)) x d unit points, (n_trajectories x d)
+        order of the moved parameters, (n_trajectories x d) signed steps).
+    """
+    rng = np.random.default_rng(seed)
+    d = len(ranges)
+    delta = levels / (2.0 * (levels - 1))
+    grid = np.arange(levels) / (levels - 1)
+    points = np.empty((n_trajectories * (d + 1), d))
+    orders = np.empty((n_trajectories, d), dtype=int)
+    steps = np.empty((n_trajectories, d))
+    for t in range(n_trajectories):
+        x = rng.choice(grid, size=d)
+        orders[t] = rng.permutation(d)
+        points[t * (d + 1)] = x
+        for k, i in enumerate(orders[t]):
+            step = delta if x[i] + delta <= 1.0 + 1e-12 else -delta
+            x = x.copy()
+            x[i] += step
+            steps[t, k] = step
+            points[t * (d + 1) + k + 1] = x
+    return points, orders, steps
+
+
+# --- Model runs ---
+
+def evaluate(samples, engine='ode', duration_years=None, workers=None, seed=0, dalys_from_day=0, **engine_kwargs):
+    """
+    Runs every parameter set in parallel (see parallel_runs.run_simulations) and
+    extracts the OUTPUTS.
+
+    Args:
+        dalys_from_day (int): DALYs are counted after this day (to skip the initial transient).
+        Other arguments as for parallel_runs.run_simulations().
+
+    Returns:
+        np.ndarray: (len(samples) x len(OUTPUTS)) outputs.
+    """
+    runs = run_simulations(samples, engine, duration_years, workers, seed, outputs=OUTPUTS,
+                           dalys_from_day=dalys_from_day, **engine_kwargs)
+    return np.array([[run[output] for output in OUTPUTS] for run in runs])
+
+
+# --- Indices ---
+
+def sobol_indices(f_A, f_B, f_AB):
+    """
+    First-order (Saltelli 2010) and total (Jansen) Sobol indices of one output.
+
+    Args:
+        f_A, f_B (np.ndarray): Outputs on the base matrices (n).
+        f_AB (np.ndarray): Outputs on the AB_i matrices (d x n).
+
+    Returns:
+        Tuple: (S1, ST), arrays of length d (NaN if the output does not vary).
+    """
+    variance = np.var(np.concatenate([f_A, f_B]))
+    if variance <= 0.0:
+        return np.full(len(f_AB), np.nan), np.full(len(f_AB), np.nan)
+    first_order = np.mean(f_B * (f_AB - f_A), axis=1) / variance
+    total = 0.5 * np.mean((f_A - f_AB) ** 2, axis=1) / variance
+    return first_order, total
+
+
+def _interval(samples, confidence):
+    """Half-width of the central bootstrap interval."""
+    low, high = np.nanpercentile(samples, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+    return (high - low) / 2.0
+
+
+def sobol_analysis(ranges=None, n=256, engine='ode', duration_years=None, outputs=OUTPUTS, workers=None,
+                   n_bootstrap=500, confidence=0.95, seed=None, dalys_from_day=0, **engine_kwargs):
+    """
+    Sobol variance decomposition of the outputs over the parameter ranges.
+
+    Args:
+        ranges (dict): {parameter: (low, high, 'log' | 'linear')}; defaults to DEFAULT_RANGES.
+        n (int): Base sample size (a power of 2 keeps the Sobol points balanced).
+        engine (str): Engine name ('ode', 'stochastic', 'abm', ...).
+        duration_years (int): Length of every run.
+        outputs (tuple): Subset of OUTPUTS to analyse.
+        workers (int): Worker processes (see evaluate()).
+        n_bootstrap (int): Bootstrap resamples for the confidence intervals.
+        confidence (float): Confidence level of the intervals.
+        seed (int): Seeds the design, the runs and the bootstrap.
+        dalys_from_day (int): DALYs are counted after this day.
+        **engine_kwargs: Fixed parameters shared by every run.
+
+    Returns:
+        dict: 'indices' ({output: {parameter: {'S1', 'S1_conf', 'ST', 'ST_conf'}}}),
+        'samples' (the parameter sets), 'outputs' (runs x OUTPUTS array),
+        'runs' and 'wall_time'. The *_conf values are interval half-widths.
+    """
+    start_time = time.perf_counter()
+    ranges = ranges if ranges is not None else DEFAULT_RANGES
+    unknown = set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown))}. Choose from: {', '.join(OUTPUTS)}")
+    names = list(ranges)
+    d = len(names)
+
+    samples = scale_samples(saltelli_design(ranges, n, seed), ranges)
+    values = evaluate(samples, engine, duration_years, workers, seed=seed or 0,
+                      dalys_from_day=dalys_from_day, **engine_kwargs)
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, n, size=(n_bootstrap, n))
+    indices = {}
+    for output in outputs:
+        column = values[:, OUTPUTS.index(output)]
+        f_A, f_B, f_AB = column[:n], column[n:2 * n], column[2 * n:].reshape(d, n)
+        first_order, total = sobol_indices(f_A, f_B, f_AB)
+        boot_first = np.empty((n_bootstrap, d))
+        boot_total = np.empty((n_bootstrap, d))
+        for b, rows in enumerate(resamples):
+            boot_first[b], boot_total[b] = sobol_indices(f_A[rows], f_B[rows], f_AB[:, rows])
+        first_conf, total_conf = _interval(boot_first, confidence), _interval(boot_total, confidence)
+        indices[output] = {
+            name: {'S1': float(first_order[i]), 'S1_conf': float(first_conf[i]),
+                   'ST': float(total[i]), 'ST_conf': float(total_conf[i])}
+            for i, name in enumerate(names)
+        }
+
+    report = {
+        'indices': indices,
+        'samples': samples,
+        'outputs': values,
+        'runs': len(samples),
+        'wall_time': time.perf_counter() - start_time,
+    }
+    print(f"Sobol analysis: {report['runs']} {engine} runs in {report['wall_time']:.2f} s")
+    for output, by_parameter in indices.items():
+        print(f"  {output}:")
+        for name, index in by_parameter.items():
+            print(f"    {name:<30} S1={index['S1']:6.3f} +/- {index['S1_conf']:.3f}   "
+                  f"ST={index['ST']:6.3f} +/- {index['ST_conf']:.3f}")
+    return report
+
+
+def morris_analysis(ranges=None, n_trajectories=20, levels=4, engine='ode', duration_years=None, outputs=OUTPUTS,
+                    workers=None, n_bootstrap=500, confidence=0.95, seed=None, dalys_from_day=0, **engine_kwargs):
+    """
+    Morris elementary-effects screening of the outputs over the parameter ranges.
+
+    Elementary effects are changes in the output per unit step in the
+    normalized parameter ([0, 1] across its range).
+
+    Args:
+        n_trajectories (int): Number of one-at-a-time trajectories.
+        levels (int): Number of grid levels per parameter.
+        Other arguments as for sobol_analysis().
+
+    Returns:
+        dict: 'indices' ({output: {parameter: {'mu', 'mu_star', 'mu_star_conf', 'sigma'}}}),
+        'samples', 'outputs', 'runs' and 'wall_time'.
+    """
+    start_time = time.perf_counter()
+    ranges = ranges if ranges is not None else DEFAULT_RANGES
+    unknown = set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown))}. Choose from: {', '.join(OUTPUTS)}")
+    names = list(ranges)
+    d = len(names)
+
+    points, orders, steps = morris_design(ranges, n_trajectories, levels, seed)
+    samples = scale_samples(points, ranges)
+    values = evaluate(samples, engine, duration_years, workers, seed=seed or 0,
+                      dalys_from_day=dalys_from_day, **engine_kwargs)
+
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, n_trajectories, size=(n_bootstrap, n_trajectories))
+    indices = {}
+    for output in outputs:
+        trajectories = values[:, OUTPUTS.index(output)].reshape(n_trajectories, d + 1)
+        effects = np.empty((n_trajectories, d))
+        for t in range(n_trajectories):
+            effects[t, orders[t]] = np.diff(trajectories[t]) / steps[t]
+        mu_star_conf = _interval(np.abs(effects)[resamples].mean(axis=1), confidence)
+        indices[output] = {
+            name: {'mu': float(effects[:, i].mean()), 'mu_star': float(np.abs(effects[:, i]).mean()),
+                   'mu_star_conf': float(mu_star_conf[i]), 'sigma': float(effects[:, i].std(ddof=1)) if n_trajectories > 1 else 0.0}
+            for i, name in enumerate(names)
+        }
+
+    report = {
+        'indices': indices,
+        'samples': samples,
+        'outputs': values,
+        'runs': len(samples),
+        'wall_time': time.perf_counter() - start_time,
+    }
+    print(f"Morris screening: {report['runs']} {engine} runs in {report['wall_time']:.2f} s")
+    for output, by_parameter in indices.items():
+        print(f"  {output}:")
+        for name, index in by_parameter.items():
+            print(f"    {name:<30} mu*={index['mu_star']:.4g} +/- {index['mu_star_conf']:.3g}   sigma={index['sigma']:.4g}")
+    return report
+
+
+if __name__ == "__main__":
+    sobol_analysis(n=128, engine='ode', duration_years=10, initial_population=100000, initial_infected_count=3000)
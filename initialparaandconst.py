@@ -30,6 +30,7 @@ DISEASE_STATES = {
 # --- SIMULATION PARAMETERS ---
 INITIAL_POPULATION = 10000000 # Default test population
 SIMULATION_YEARS = 20 # Default simulation duration
+SIMULATION_ENGINE = "abm" # Engine used by runmain.py: "abm" (agent-based), "ode" (compartmental), "ode_age" (age-structured compartmental) or "stochastic" (stochastic compartmental), see engine.py
 
 # --- DEMOGRAPHIC PARAMETERS ---
 
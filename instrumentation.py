@@ -0,0 +1,88 @@
+"""
+Per-phase timing and event counters for a run, aggregated per simulated year.
+
+Profiling is off unless a run asks for it, and then costs a clock read per
+phase per day:
+
+    result = Simulation(engine).run(20, profile=True)
+    result.profile_history[3]['phase_seconds']   # {'kernel': 12.1, 'births': 0.4, ...}
+    result.save()                                # also writes <name>_profile_history.json
+
+Simulation.run times vaccination, the engine step, history recording and the
+yearly snapshot; the agent-based Model splits its step into the kernel, death
+application, births (and the array concatenation) and compaction, and the
+kernel counts the state transitions. SimulationResult.save adds the time spent
+writing the JSON histories. Each year's record holds:
+
+    year, days, phase_seconds, counters (births, deaths, vaccinated, compactions, ...)
+    and transitions ('SUSCEPTIBLE->PREPATENT': count, ...)
+"""
+import time
+from collections import defaultdict
+import numpy as np
+from initialparaandconst import DISEASE_STATES
+
+
+class Profiler:
+    """Accumulates phase times, counters and kernel transitions for the current year."""
+
+    def __init__(self):
+        self.records = []
+        self.start_year(0)
+
+    def start_year(self, year):
+        self.year = year
+        self.days = 0
+        self.phase_seconds = defaultdict(float)
+        self.counters = defaultdict(int)
+        # Incremented in place by the agent kernel: transitions[from_state, to_state]
+        self.transitions = np.zeros((len(DISEASE_STATES), len(DISEASE_STATES)), dtype=np.int64)
+
+    def lap(self, phase, start):
+        """Adds the time since start to a phase and returns the current time (the next phase's start)."""
+        now = time.perf_counter()
+        self.phase_seconds[phase] += now - start
+        return now
+
+    def count(self, counter, amount=1):
+        self.counters[counter] += int(amount)
+
+    def end_year(self):
+        """Stores the current year's record and starts the next year."""
+        transitions = {
+            f"{DISEASE_STATES[source]}->{DISEASE_STATES[target]}": int(self.transitions[source, target])
+            for source, target in zip(*np.nonzero(self.transitions))
+        }
+        self.records.append({
+            'year': self.year,
+            'days': self.days,
+            'phase_seconds': dict(self.phase_seconds),
+            'counters': dict(self.counters),
+            'transitions': transitions,
+        })
+        self.start_year(self.year + 1)
+
+
+def totals(profile_history):
+    """Sums the phase times, counters and transitions of every year of a profile."""
+    summary = {'days': 0, 'phase_seconds': defaultdict(float), 'counters': defaultdict(int), 'transitions': defaultdict(int)}
+    for record in profile_history:
+        summary['days'] += record.get('days', 0)
+        for key in ('phase_seconds', 'counters', 'transitions'):
+            for name, value in record.get(key, {}).items():
+                summary[key][name] += value
+    return {key: dict(value) if isinstance(value, defaultdict) else value for key, value in summary.items()}
+
+
+def print_profile(profile_history):
+    """Prints where a profiled run spent its time, and its event counts."""
+    summary = totals(profile_history)
+    total_time = sum(summary['phase_seconds'].values())
+    print(f"Profile over {summary['days']} days ({total_time:.2f} s instrumented):")
+    for phase, seconds in sorted(summary['phase_seconds'].items(), key=lambda item: -item[1]):
+        share = seconds / total_time if total_time else 0.0
+        print(f"  {phase:<20} {seconds:>10.3f} s  {share:>6.1%}")
+    for counter, value in sorted(summary['counters'].items()):
+        print(f"  {counter:<20} {value:>12,}")
+    for transition, value in sorted(summary['transitions'].items(), key=lambda item: -item[1]):
+        print(f"  {transition:<30} {value:>12,}")
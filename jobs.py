@@ -0,0 +1,405 @@
+"""
+Simulation jobs for the web app: a bounded queue served by persistent workers.
+
+Each job carries its own engine name, model parameters and vaccine settings
+and writes its history files to its own directory (jobs/<job_id>/), so
+concurrent runs never share a configuration file or outputs:
+
+    manager = JobManager(num_workers=2)
+    job_id = manager.submit('abm', {'initial_population': 100000}, years=10)
+    manager.status(job_id)['state']   # 'queued', 'running', 'done' or 'error'
+
+The worker processes compile (or load) the numba kernels once at start-up and
+then take jobs from the queue until shut down. They report back through an
+event queue that a listener thread in the web process applies to the job table.
+While a job runs, its worker sends progress events (at most every
+PROGRESS_INTERVAL seconds) carrying the daily records added since the last
+one, so the partial SIR and environment histories can be streamed to clients.
+The listener also watches the workers: when one dies (e.g. killed for memory),
+its running job is marked as failed and a replacement worker is started.
+
+Before a job is queued its wall time and peak memory are estimated (see
+cost_model.py). A job that could not fit in a worker's share of the memory
+budget, or would run longer than max_job_time, is refused outright; one that
+would push the estimated backlog past max_backlog is refused until the queue drains.
+An admitted job runs in the memory-budget mode with that share as its limit.
+The cost model calibrates in a background thread when the manager starts;
+jobs submitted before it is ready are admitted without an estimate.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+
+JOBS_DIRECTORY = 'jobs'
+JOB_STATES = ('queued', 'running', 'done', 'error')
+PROGRESS_INTERVAL = 0.5 # Seconds between progress events of a running job
+WORKER_CHECK_INTERVAL = 1.0 # Seconds without events after which the listener checks the workers
+MEMORY_BUDGET_FRACTION = 0.8 # Share of the host's memory the job workers may use together
+MAX_JOB_TIME = 4 * 3600 # Longest estimated wall time (seconds) of a web job
+MAX_BACKLOG = 12 * 3600 # Longest estimated time (seconds) to clear the web job queue
+# Vaccine settings a job may override (attributes of initialparaandconst.Vaccine)
+VACCINE_SETTINGS = ('is_enabled', 'start_year', 'coverage', 'efficacy')
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class JobTooLargeError(Exception):
+    """Raised when a job's estimated cost exceeds what the job manager admits."""
+
+
+class Job:
+    """One simulation request and its progress."""
+
+    def __init__(self, engine, params, years, vaccine=None, directory=None, memory_budget=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.engine = engine
+        self.params = dict(params)
+        self.years = int(years)
+        self.vaccine = dict(vaccine or {})
+        self.directory = directory or os.path.join(JOBS_DIRECTORY, self.id)
+        self.memory_budget = memory_budget # Bytes the worker's run may use (see memory_budget.py)
+        self.state = 'queued'
+        self.error = None
+        self.result_name = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.worker_pid = None # Process id of the worker running the job
+        self.progress = None
+        self.estimate = None
+        # Daily records received so far; dropped once the histories are on disk
+        self.partial_sir = []
+        self.partial_environment = []
+
+    def task(self):
+        """The picklable description sent to a worker."""
+        return {
+            'id': self.id, 'engine': self.engine, 'params': self.params, 'years': self.years,
+            'vaccine': self.vaccine, 'directory': self.directory, 'memory_budget': self.memory_budget,
+        }
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'engine': self.engine,
+            'params': self.params,
+            'years': self.years,
+            'vaccine': self.vaccine,
+            'directory': self.directory,
+            'result_name': self.result_name,
+            'error': self.error,
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'progress': self.progress,
+            'estimate': self.estimate,
+        }
+
+
+def _warm_up():
+    """Compiles (or loads from the cache) every engine's kernels once per worker."""
+    from model import compile_kernels
+    from compartmental_model import compile_ode_kernels
+    from stochastic_model import compile_stochastic_kernels
+    compile_kernels()
+    compile_ode_kernels()
+    compile_stochastic_kernels()
+
+
+class _ProgressReporter:
+    """Simulation.run progress callback that sends throttled progress events from a worker."""
+
+    def __init__(self, job_id, events, total_days, interval=PROGRESS_INTERVAL):
+        self.job_id = job_id
+        self.events = events
+        self.total_days = total_days
+        self.interval = interval
+        self.sent = 0
+        self.started = time.perf_counter()
+        self.last_sent = 0.0
+
+    def __call__(self, day, year, simulation):
+        now = time.perf_counter()
+        if now - self.last_sent < self.interval and day < self.total_days:
+            return
+        self.last_sent = now
+        sir = simulation.sir_history[self.sent:]
+        # Plain floats so the records can go straight to JSON
+        environment = [{key: float(value) for key, value in record.items()} for record in simulation.environment_history[self.sent:]]
+        self.sent = len(simulation.sir_history)
+        self.events.put((self.job_id, 'progress', {
+            'day': day,
+            'year': year,
+            'total_days': self.total_days,
+            'days_per_second': day / max(now - self.started, 1e-9),
+            'state_counts': {key: value for key, value in sir[-1].items() if key not in ('day', 'yll')},
+            'environment': {key: value for key, value in environment[-1].items() if key != 'day'},
+            'sir': sir,
+            'environment_records': environment,
+        }))
+
+
+def _run_job(task, events):
+    """Runs one job in a worker and saves its histories to the job directory."""
+    import initialparaandconst
+    from engine import make_engine
+    from simulation import Simulation
+
+    # Vaccine settings are process-wide; restore the defaults after the job
+    defaults = {name: getattr(initialparaandconst.Vaccine, name) for name in VACCINE_SETTINGS}
+    try:
+        for name, value in task['vaccine'].items():
+            if name in VACCINE_SETTINGS:
+                setattr(initialparaandconst.Vaccine, name, value)
+        engine = make_engine(task['engine'], **task['params'])
+        reporter = _ProgressReporter(task['id'], events, task['years'] * 365)
+        result = Simulation(engine).run(task['years'], save=False, progress=reporter, memory_budget=task['memory_budget'])
+        os.makedirs(task['directory'], exist_ok=True)
+        result.save(directory=task['directory'])
+        try: # Page loads then read the ready-made figures
+            from figure_cache import build_figure_cache
+            build_figure_cache(result.name, task['directory'])
+        except Exception as e:
+            print(f"Could not build the figure cache: {e}")
+        return result.name
+    finally:
+        for name, value in defaults.items():
+            setattr(initialparaandconst.Vaccine, name, value)
+
+
+def _worker_loop(tasks, events):
+    """Body of a persistent worker process: warm up, then serve jobs until a None task arrives."""
+    try:
+        _warm_up()
+    except Exception as e: # A job will report the same failure with its own id
+        print(f"Worker warm-up failed: {e}")
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        events.put((task['id'], 'started', {'time': time.time(), 'pid': os.getpid()}))
+        try:
+            name = _run_job(task, events)
+            events.put((task['id'], 'done', {'time': time.time(), 'result_name': name}))
+        except Exception as e:
+            events.put((task['id'], 'error', {'time': time.time(), 'error': f"{type(e).__name__}: {e}"}))
+
+
+class JobManager:
+    """
+    Job table, bounded task queue and pool of persistent worker processes.
+
+    Args:
+        num_workers (int): Worker processes (default: CPUs minus one, at least 1).
+        max_queued (int): Jobs that may wait for a worker before submit() is refused.
+        memory_budget (float): Bytes the running jobs may use together (default:
+            MEMORY_BUDGET_FRACTION of the host's memory); each job gets an equal share,
+            checked at admission and kept to while it runs.
+        max_job_time (float): Longest estimated wall time (seconds) of a single job, or None.
+        max_backlog (float): Longest estimated time (seconds) to finish the queued and
+            running jobs before submit() is refused, or None.
+        admission (bool): Whether submit() estimates and checks the cost of each job.
+    """
+
+    def __init__(self, num_workers=None, max_queued=16, memory_budget=None, max_job_time=None,
+                 max_backlog=None, admission=True):
+        from cost_model import total_memory
+
+        self.num_workers = num_workers if num_workers is not None else max(1, (os.cpu_count() or 2) - 1)
+        host_memory = total_memory()
+        self.memory_budget = memory_budget if memory_budget is not None else (
+            host_memory * MEMORY_BUDGET_FRACTION if host_memory else None)
+        self.max_job_time = max_job_time
+        self.max_backlog = max_backlog
+        self.admission = admission
+        self.context = multiprocessing.get_context('spawn') # Workers must not inherit the web server's threads
+        self.tasks = self.context.Queue(maxsize=max_queued)
+        self.events = self.context.Queue()
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock) # Notified on every job event
+        self.stopping = False
+        self.workers = [self._start_worker() for _ in range(self.num_workers)]
+        self.listener = threading.Thread(target=self._listen, daemon=True)
+        self.listener.start()
+        self.calibration = None
+        if admission: # Off the request threads: the first calibration on a host takes tens of seconds
+            from cost_model import load_calibration
+            self.calibration = threading.Thread(target=load_calibration, daemon=True)
+            self.calibration.start()
+
+    def _start_worker(self):
+        worker = self.context.Process(target=_worker_loop, args=(self.tasks, self.events), daemon=True)
+        worker.start()
+        return worker
+
+    def estimate(self, engine, params, years):
+        """
+        Estimated cost of a job run by one of the workers (see cost_model.estimate_cost),
+        or None while the cost model is still calibrating.
+        """
+        from cost_model import estimate_cost, describe
+        from initialparaandconst import INITIAL_POPULATION
+
+        if self.calibration is not None and self.calibration.is_alive():
+            return None
+
+        estimate = estimate_cost(engine, params.get('initial_population', INITIAL_POPULATION), years,
+                                 concurrent_runs=self.num_workers, save=True, figure_cache=True, include_compile=False)
+        estimate['description'] = describe(estimate)
+        return estimate
+
+    def admission_error(self, estimate):
+        """
+        Checks an estimate against the admission limits.
+
+        Returns:
+            Exception: The JobTooLargeError or QueueFullError submit() would raise, or None.
+        """
+        from cost_model import describe
+        if self.memory_budget is not None and estimate['peak_memory'] > self.memory_budget / self.num_workers:
+            return JobTooLargeError(f"The job needs {describe(estimate)}, more than a worker's share of "
+                                    f"the memory budget ({self.memory_budget / self.num_workers / 2**30:.1f} GB)")
+        if self.max_job_time is not None and estimate['wall_time'] > self.max_job_time:
+            return JobTooLargeError(f"The job would take {describe(estimate)}; the limit is {self.max_job_time:.0f} s")
+        if self.max_backlog is not None:
+            with self.lock:
+                pending = sum(job.estimate['wall_time'] for job in self.jobs.values()
+                              if job.state in ('queued', 'running') and job.estimate)
+            if (pending + estimate['wall_time']) / self.num_workers > self.max_backlog:
+                return QueueFullError("The queued jobs would take too long to finish; try again later")
+        return None
+
+    def submit(self, engine, params, years, vaccine=None):
+        """
+        Queues a job, after estimating its cost when admission control is on.
+
+        Returns:
+            str: The job id.
+
+        Raises:
+            JobTooLargeError: If the job's estimated memory or wall time is over the limits.
+            QueueFullError: If max_queued jobs are already waiting, or the backlog is too long.
+        """
+        # Each running job keeps to its worker's share of the budget
+        share = self.memory_budget / self.num_workers if self.memory_budget is not None else None
+        job = Job(engine, params, years, vaccine, memory_budget=share)
+        if self.admission:
+            job.estimate = self.estimate(engine, params, years)
+            error = self.admission_error(job.estimate) if job.estimate is not None else None
+            if error is not None:
+                raise error
+        with self.lock:
+            self.jobs[job.id] = job
+        try:
+            self.tasks.put_nowait(job.task())
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job.id]
+            raise QueueFullError("The job queue is full; try again later")
+        return job.id
+
+    def _listen(self):
+        while True:
+            try:
+                job_id, kind, payload = self.events.get(timeout=WORKER_CHECK_INTERVAL)
+            except queue.Empty: # Every event sent so far has been applied
+                self._check_workers()
+                continue
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if job is not None:
+                    self._apply_event(job, kind, payload)
+                    self.changed.notify_all()
+
+    def _check_workers(self):
+        """Fails the job of each worker that has died and starts a replacement."""
+        if self.stopping:
+            return
+        for index, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            with self.lock:
+                for job in self.jobs.values():
+                    if job.state == 'running' and job.worker_pid == worker.pid:
+                        self._apply_event(job, 'error', {
+                            'time': time.time(), 'error': f"The worker running the job exited (exit code {worker.exitcode})"})
+                self.changed.notify_all()
+            print(f"Job worker {worker.pid} exited (exit code {worker.exitcode}); starting a replacement.")
+            self.workers[index] = self._start_worker()
+
+    def _apply_event(self, job, kind, payload):
+        if kind == 'started':
+            job.state = 'running'
+            job.started_at = payload['time']
+            job.worker_pid = payload['pid']
+        elif kind == 'progress':
+            job.partial_sir.extend(payload.pop('sir'))
+            job.partial_environment.extend(payload.pop('environment_records'))
+            job.progress = payload
+        elif kind == 'done':
+            job.state = 'done'
+            job.finished_at = payload['time']
+            job.result_name = payload['result_name']
+        elif kind == 'error':
+            job.state = 'error'
+            job.finished_at = payload['time']
+            job.error = payload['error']
+        if kind in ('done', 'error'):
+            job.partial_sir = []
+            job.partial_environment = []
+
+    def status(self, job_id):
+        """Returns the job's state as a dictionary, or None for an unknown id."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job is not None else None
+
+    def wait_for_update(self, job_id, since, timeout=15.0):
+        """
+        Waits until a job has daily records beyond index since, has finished, or timeout passes.
+
+        Returns:
+            Tuple: (job dictionary or None, new SIR records, new environment records).
+            Once the job has finished the record lists are empty (read the saved histories).
+        """
+        with self.changed:
+            self.changed.wait_for(
+                lambda: job_id not in self.jobs or self.jobs[job_id].state in ('done', 'error')
+                or len(self.jobs[job_id].partial_sir) > since,
+                timeout=timeout
+            )
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None, [], []
+            return job.to_dict(), job.partial_sir[since:], job.partial_environment[since:]
+
+    def summary(self):
+        """Counts of jobs per state."""
+        with self.lock:
+            counts = {state: 0 for state in JOB_STATES}
+            for job in self.jobs.values():
+                counts[job.state] += 1
+            return counts
+
+    def latest_finished(self):
+        """The most recently finished successful job (a dictionary), or None."""
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job.state == 'done']
+            if not finished:
+                return None
+            return max(finished, key=lambda job: job.finished_at).to_dict()
+
+    def shutdown(self):
+        """Stops the workers once the queued jobs are done."""
+        self.stopping = True
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,156 @@
+"""
+Memory accounting of a run, and the memory-budget mode.
+
+A MemoryBudget records once a year what the run holds: the living agents'
+arrays, their free capacity (slots of dead agents not compacted yet), the
+daily histories, the transient buffers of the daily step and the resident
+size of the process:
+
+    result = Simulation(engine).run(20, memory_budget=parse_size('8GB'))
+    result.memory_history[5]   # {'year': 5, 'agent_arrays': ..., 'projected_peak': ..., 'measures': [...]}
+
+With a budget, the peak of the rest of the run is projected before the kernels
+are warmed up and after every year: the agent arrays grow with births
+(cost_model.ANNUAL_GROWTH) and the histories by a record a day. While the
+projection is over the budget, the next of MEASURES is switched on:
+
+- stream_histories: daily records are appended to files as the run goes
+  (results.StreamedHistory) instead of accumulating in memory.
+- compact_dtypes: narrower agent arrays (model.COMPACT_DTYPES).
+- aggressive_compaction: dead agents are dropped once they are 1% of the
+  arrays instead of 10% (model.AGGRESSIVE_COMPACTION_THRESHOLD).
+
+None of them changes the simulated outcomes. A run that is still projected
+over budget with every measure on carries on, with a warning.
+"""
+import os
+import re
+import resource
+import sys
+from results import StreamedHistory, STREAM_BUFFER_RECORDS, record_bytes
+from initialparaandconst import DISEASE_STATES
+from reporting_config import DAILY_ENVIRONMENT_VARIABLES
+from cost_model import ANNUAL_GROWTH, _format_bytes
+
+MEASURES = ('stream_histories', 'compact_dtypes', 'aggressive_compaction')
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 2**10, 'KB': 2**10, 'M': 2**20, 'MB': 2**20, 'G': 2**30, 'GB': 2**30, 'T': 2**40, 'TB': 2**40}
+
+
+def parse_size(text):
+    """Parses a memory size such as '8GB', '512M' or '1073741824' into bytes."""
+    match = re.fullmatch(r'\s*([0-9.]+(?:e[0-9]+)?)\s*([A-Za-z]*)\s*', str(text))
+    if match is None or match.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Invalid memory size '{text}' (e.g. 8GB, 512MB)")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def current_rss():
+    """Resident set size of this process in bytes (the peak where the current size is unavailable)."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+def _day_bytes(simulation):
+    """Memory of one day of the daily histories, from the latest records (or a typical record before the first day)."""
+    sir = simulation.sir_history[-1] if len(simulation.sir_history) else {'day': 0, **{name: 0 for name in DISEASE_STATES.values()}, 'yll': 0.0}
+    environment = simulation.environment_history[-1] if len(simulation.environment_history) else {'day': 0, **{var: 0.0 for var in DAILY_ENVIRONMENT_VARIABLES}}
+    return record_bytes(sir) + record_bytes(environment)
+
+
+def history_bytes(simulation):
+    """Approximate memory held by a simulation's daily histories."""
+    if isinstance(simulation.sir_history, StreamedHistory):
+        return simulation.sir_history.nbytes_in_memory() + simulation.environment_history.nbytes_in_memory()
+    return len(simulation.sir_history) * _day_bytes(simulation)
+
+
+class MemoryBudget:
+    """
+    Yearly memory accounting of a run and, given a limit, the measures that keep it under it.
+
+    Args:
+        limit (int): Bytes the run may use (resident size of the whole process), or
+            None to only account.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.active = []
+        self.unavailable = [] # Measures the engine does not support
+        self.records = []
+        self._warned = False
+
+    def account(self, simulation, year, duration_years):
+        """Returns the memory record of a simulation at the end of year, with the projected peak of the rest of the run."""
+        usage = simulation.engine.memory_usage()
+        histories = history_bytes(simulation)
+        rss = current_rss()
+        # Interpreter, libraries, compiled kernels and anything else the run does not account for
+        base = max(rss - usage['agent_arrays'] - usage['free_capacity'] - histories, 0)
+        growth = (1 + ANNUAL_GROWTH) ** max(duration_years - year, 0)
+        if usage['bytes_per_agent']:
+            # Up to compaction_threshold of the slots may hold dead agents
+            held = usage['agents'] * growth * usage['bytes_per_agent'] / (1 - usage['compaction_threshold'])
+        else:
+            held = usage['agent_arrays'] + usage['free_capacity']
+        remaining_days = max(duration_years * 365 - len(simulation.sir_history), 0)
+        if isinstance(simulation.sir_history, StreamedHistory):
+            history_peak = STREAM_BUFFER_RECORDS * _day_bytes(simulation)
+        else:
+            history_peak = histories + remaining_days * _day_bytes(simulation)
+        return {
+            'year': year,
+            'agents': usage['agents'],
+            'agent_arrays': int(usage['agent_arrays']),
+            'free_capacity': int(usage['free_capacity']),
+            'histories': int(histories),
+            'transient': int(usage['transient']),
+            'rss': int(rss),
+            'projected_peak': int(base + held + usage['transient'] * growth + history_peak),
+            'measures': list(self.active),
+        }
+
+    def _apply(self, measure, simulation):
+        if measure == 'stream_histories':
+            simulation.stream_histories()
+            return True
+        if measure == 'compact_dtypes':
+            return simulation.engine.use_compact_dtypes()
+        return simulation.engine.use_aggressive_compaction()
+
+    def check(self, simulation, year, duration_years):
+        """
+        Records the simulation's memory at the end of year and, while the projected
+        peak is over the limit, switches on the next measure.
+
+        Returns:
+            list: The measures switched on by this check.
+        """
+        record = self.account(simulation, year, duration_years)
+        applied = []
+        if self.limit is not None:
+            for measure in MEASURES:
+                if record['projected_peak'] <= self.limit:
+                    break
+                if measure in self.active or measure in self.unavailable:
+                    continue
+                if not self._apply(measure, simulation):
+                    self.unavailable.append(measure)
+                    continue
+                print(f"Year {year}: projected peak memory {_format_bytes(record['projected_peak'])} is over the "
+                      f"budget of {_format_bytes(self.limit)}; switched on {measure}.")
+                self.active.append(measure)
+                applied.append(measure)
+                record = self.account(simulation, year, duration_years)
+            if record['projected_peak'] > self.limit and not self._warned:
+                print(f"Warning: the run is projected to need {_format_bytes(record['projected_peak'])}, over its "
+                      f"{_format_bytes(self.limit)} budget, with every applicable measure on.")
+                self._warned = True
+        self.records.append(record)
+        print(f"Year {year} memory: agent arrays {_format_bytes(record['agent_arrays'])}, "
+              f"free capacity {_format_bytes(record['free_capacity'])}, histories {_format_bytes(record['histories'])}, "
+              f"transient {_format_bytes(record['transient'])}, RSS {_format_bytes(record['rss'])}")
+        return applied
@@ -0,0 +1,178 @@
+"""
+Multi-fidelity experiments: screen a design with a cheap engine, confirm with the ABM.
+
+CompartmentalModel and Model share their flows, so the ODE (or tau-leap)
+engine predicts the ABM well but not exactly. run_multi_fidelity() runs the
+whole design with the cheap engine, learns the ABM-minus-cheap discrepancy from
+a few paired runs and then spends ABM runs only where the corrected prediction
+is still uncertain, or could fall on either side of a decision threshold:
+
+    design = [{'base_transmission_risk': r} for r in np.logspace(-4, -2, 50)]
+    report = run_multi_fidelity(design, output='cumulative_infections', threshold=1e5,
+                                duration_years=10, initial_population=10000, initial_infected_count=300)
+    report['estimates'], report['compute']['saved_fraction']
+
+The correction model is a Gaussian process (bayesian_tuning.GaussianProcess)
+on the normalized parameters and the cheap prediction, on top of a linear
+fit of the ABM output on the cheap one.
+"""
+import os
+import time
+from math import erf
+import numpy as np
+from bayesian_tuning import GaussianProcess
+from global_sensitivity import OUTPUTS
+from parallel_runs import run_simulations
+
+
+def _features(design, low_fidelity):
+    """Parameters (log-scaled where positive) and the cheap prediction, each normalized to [0, 1] over the design."""
+    names = sorted({name for point in design for name in point})
+    columns = []
+    for name in names:
+        values = np.array([point.get(name, np.nan) for point in design], dtype=float)
+        if np.all(values > 0):
+            values = np.log(values)
+        columns.append(values)
+    columns.append(low_fidelity)
+    features = np.column_stack(columns)
+    low, high = np.nanmin(features, axis=0), np.nanmax(features, axis=0)
+    span = np.where(high > low, high - low, 1.0)
+    return np.nan_to_num((features - low) / span, nan=0.5)
+
+
+def _misclassification(mean, std, threshold):
+    """Probability that the true value lies on the other side of threshold from the prediction."""
+    z = np.abs(mean - threshold) / np.maximum(std, 1e-12)
+    return 0.5 * (1.0 - np.vectorize(erf)(z / np.sqrt(2.0)))
+
+
+class _Correction:
+    """ABM output as a linear function of the cheap output plus a GP on the residual."""
+
+    def __init__(self, seed=None):
+        self.gp = GaussianProcess(seed=seed)
+
+    def fit(self, features, low_fidelity, high_fidelity):
+        slope, intercept = np.polyfit(low_fidelity, high_fidelity, 1) if len(set(low_fidelity)) > 1 else (1.0, 0.0)
+        self.slope, self.intercept = slope, intercept
+        self.gp.fit(features, high_fidelity - (intercept + slope * low_fidelity))
+        return self
+
+    def predict(self, features, low_fidelity):
+        residual, std = self.gp.predict(features)
+        return self.intercept + self.slope * low_fidelity + residual, std
+
+
+def run_multi_fidelity(design, output='cumulative_infections', low_fidelity_engine='ode', high_fidelity_engine='abm',
+                       n_pilot=None, max_high_fidelity=None, threshold=None, rel_tol=0.05, max_misclassification=0.05,
+                       duration_years=None, dalys_from_day=0, workers=None, seed=None, **engine_kwargs):
+    """
+    Estimates an ABM output over a design with as few ABM runs as possible.
+
+    Args:
+        design (list): Parameter dicts, one per design point.
+        output (str): One of global_sensitivity.OUTPUTS.
+        low_fidelity_engine (str): Cheap engine ('ode' or 'stochastic').
+        high_fidelity_engine (str): Expensive engine (normally 'abm').
+        n_pilot (int): Paired runs used to fit the first correction model (default max(5, 10% of the design)).
+        max_high_fidelity (int): Budget of high-fidelity runs (default half the design).
+        threshold (float): Decision boundary; when given, ABM runs go to the points most
+            likely to be classified on the wrong side of it.
+        rel_tol (float): Without a threshold, stop once every prediction's standard
+            deviation is below rel_tol times the spread of the corrected estimates.
+        max_misclassification (float): With a threshold, stop once no point is
+            misclassified with a higher probability.
+        duration_years (int): Length of every run.
+        dalys_from_day (int): DALYs are counted after this day.
+        workers (int): Worker processes (see parallel_runs.run_simulations).
+        seed (int): Seeds the runs and the correction model.
+        **engine_kwargs: Fixed parameters shared by every run (initial_population, ...).
+
+    Returns:
+        dict: Per design point, the combined 'estimates' (the ABM value where it was
+        run), their 'std' (0 where the ABM was run), the 'low_fidelity' outputs and the
+        'high_fidelity' mask; 'above_threshold' when a threshold is given; 'compute'
+        (wall times, the estimated cost of running the whole design with the ABM and
+        the 'saved_fraction') and 'wall_time'.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(f"Unknown output '{output}'. Choose from: {', '.join(OUTPUTS)}")
+    start_time = time.perf_counter()
+    n = len(design)
+    workers = workers if workers is not None else os.cpu_count() or 1
+    n_pilot = min(n, n_pilot if n_pilot is not None else max(5, n // 10))
+    max_high_fidelity = min(n, max_high_fidelity if max_high_fidelity is not None else max(n_pilot, n // 2))
+    seed = seed or 0
+
+    # --- Low fidelity: the whole design ---
+    # Run costs are simulation wall times: compilation is paid once per worker, not per run
+    requested = (output, 'wall_time')
+    low_runs = run_simulations(design, low_fidelity_engine, duration_years, workers, seed, outputs=requested,
+                               dalys_from_day=dalys_from_day, **engine_kwargs)
+    low_fidelity = np.array([run[output] for run in low_runs])
+    low_time = sum(run['wall_time'] for run in low_runs)
+    features = _features(design, low_fidelity)
+
+    high_fidelity = np.full(n, np.nan)
+    high_times = []
+
+    def run_high(indices):
+        runs = run_simulations([design[i] for i in indices], high_fidelity_engine, duration_years, workers,
+                               seed + n + int(np.sum(~np.isnan(high_fidelity))), outputs=requested,
+                               dalys_from_day=dalys_from_day, **engine_kwargs)
+        for i, run in zip(indices, runs):
+            high_fidelity[i] = run[output]
+            high_times.append(run['wall_time'])
+
+    # --- Pilot: paired runs spread over the range of the cheap prediction ---
+    order = np.argsort(low_fidelity)
+    run_high(list(order[np.unique(np.linspace(0, n - 1, n_pilot).round().astype(int))]))
+
+    # --- Adaptive refinement ---
+    correction = _Correction(seed)
+    while True:
+        done = ~np.isnan(high_fidelity)
+        correction.fit(features[done], low_fidelity[done], high_fidelity[done])
+        mean, std = correction.predict(features, low_fidelity)
+        # The tolerance is relative to the spread of the output itself, not of the cheap engine's
+        spread = max(float(np.ptp(np.where(done, high_fidelity, mean))), 1e-12)
+        if threshold is not None:
+            score = _misclassification(mean, std, threshold)
+            converged = np.all(score[~done] <= max_misclassification)
+        else:
+            score = std
+            converged = np.all(std[~done] <= rel_tol * spread)
+        remaining = max_high_fidelity - int(done.sum())
+        if converged or remaining <= 0 or done.all():
+            break
+        score[done] = -np.inf
+        batch = list(np.argsort(score)[::-1][:min(max(workers, 1), remaining, int((~done).sum()))])
+        print(f"Running {high_fidelity_engine} at {len(batch)} more points ({int(done.sum())} so far)")
+        run_high(batch)
+
+    done = ~np.isnan(high_fidelity)
+    estimates = np.where(done, high_fidelity, mean)
+    std = np.where(done, 0.0, std)
+    mean_high_time = float(np.mean(high_times))
+    compute = {
+        'low_fidelity_time': low_time,
+        'high_fidelity_time': float(np.sum(high_times)),
+        'high_fidelity_runs': int(done.sum()),
+        'full_high_fidelity_time': mean_high_time * n, # Estimated from the runs made
+    }
+    compute['saved_fraction'] = 1.0 - (compute['low_fidelity_time'] + compute['high_fidelity_time']) / compute['full_high_fidelity_time']
+    report = {
+        'estimates': estimates,
+        'std': std,
+        'low_fidelity': low_fidelity,
+        'high_fidelity': done,
+        'correction': {'slope': float(correction.slope), 'intercept': float(correction.intercept)},
+        'compute': compute,
+        'wall_time': time.perf_counter() - start_time,
+    }
+    if threshold is not None:
+        report['above_threshold'] = estimates > threshold
+    print(f"Multi-fidelity estimate of {output} at {n} points: {compute['high_fidelity_runs']} {high_fidelity_engine} runs, "
+          f"{compute['saved_fraction']:.0%} of the all-{high_fidelity_engine} compute saved")
+    return report
@@ -0,0 +1,164 @@
+"""
+Parameter-batched integration of the compartmental model.
+
+Integrates many parameter sets at once for sweeps and tuning, keeping the
+trajectories in memory instead of writing history files:
+
+    grid = parameter_grid(base_transmission_risk=np.logspace(-5, -2, 100),
+                          k_half=np.logspace(6, 9, 100))
+    batch = integrate_batch(grid, duration_years=20, step_days=7)
+    batch.summary()['cumulative_infections']   # one value per parameter set
+
+The batch state is an (n_params x n_state) array advanced by the compiled
+kernels in ode_kernels.py, with the environment coupled as a state variable.
+"""
+import numpy as np
+from compartmental_model import CompartmentalModel, STATE_KEYS, vaccination_target_fraction, _load_ode_kernels
+from model import initial_infected_count_for
+from initialparaandconst import SIMULATION_YEARS, Vaccine
+
+# Parameters that can vary across the batch (all CompartmentalModel keyword arguments)
+BATCH_PARAMETERS = ('base_transmission_risk', 'k_half', 'environmental_shedding_rate',
+                    'environmental_decay_rate', 'initial_population', 'initial_infected_count')
+
+
+def parameter_grid(**values):
+    """
+    Builds the full factorial grid of the given parameter values.
+
+    Returns:
+        dict: Flat arrays of equal length, one per parameter.
+    """
+    names = list(values)
+    mesh = np.meshgrid(*[np.asarray(values[name], dtype=float) for name in names], indexing='ij')
+    return {name: grid.ravel() for name, grid in zip(names, mesh)}
+
+
+class BatchResult:
+    """In-memory trajectories of a batched run; row i belongs to the i-th parameter set."""
+
+    def __init__(self, parameters, days, states, peak_acute):
+        self.parameters = parameters
+        self.days = days
+        self.states = states # (n_params x n_records x n_state)
+        self.peak_acute = peak_acute
+
+    def __len__(self):
+        return self.states.shape[0]
+
+    def compartment(self, key):
+        """Returns the (n_params x n_records) trajectories of a STATE_KEYS entry, or 'E' for the environment."""
+        index = len(STATE_KEYS) if key == 'E' else STATE_KEYS.index(key)
+        return self.states[:, :, index]
+
+    def infected(self):
+        """Acute plus subclinical infections."""
+        return self.compartment('A') + self.compartment('U')
+
+    def infection_pressure(self):
+        """Daily force of infection on the recorded days (environmental transmission)."""
+        k = _load_ode_kernels()
+        contagion = self.compartment('E')
+        k_half = self.parameters['k_half'][:, None]
+        hazard = np.where(contagion > 0, contagion / (k_half + contagion), 0.0)
+        params = CompartmentalModel().parameter_vector()
+        seasonality = np.array([k.seasonality_multiplier(float(day), params) for day in self.days])
+        return self.parameters['base_transmission_risk'][:, None] * hazard * seasonality[None, :]
+
+    def summary(self):
+        """Headline totals per parameter set, with the same keys as SimulationResult.summary()."""
+        final = self.states[:, -1, :]
+        return {
+            'cumulative_infections': final[:, STATE_KEYS.index('CumInf')],
+            'cumulative_acute_cases': final[:, STATE_KEYS.index('CumAcute')],
+            'peak_acute': self.peak_acute,
+            'final_population': final[:, :STATE_KEYS.index('CumInf')].sum(axis=1),
+        }
+
+
+def _vaccinate_batch(Y, target_fraction):
+    """Vectorized CompartmentalModel.vaccinate: moves S (then R) to V."""
+    k = _load_ode_kernels()
+    total_pop = Y[:, :k.NUM_COMPARTMENTS].sum(axis=1)
+    num_to_vaccinate = total_pop * target_fraction * Vaccine.coverage
+    from_S = np.minimum(Y[:, k.Y_S], num_to_vaccinate)
+    from_R = np.minimum(Y[:, k.Y_R], num_to_vaccinate - from_S)
+    Y[:, k.Y_S] -= from_S
+    Y[:, k.Y_R] -= from_R
+    Y[:, k.Y_V] += from_S + from_R
+
+
+def integrate_batch(parameters, duration_years=None, step_days=1, record_every=1):
+    """
+    Integrates the compartmental model for every parameter set in one batch.
+
+    Args:
+        parameters (dict): Arrays (or scalars) keyed by BATCH_PARAMETERS names; missing
+            parameters use the CompartmentalModel defaults (the infected count scaled to
+            each row's population). Arrays must share one length.
+        duration_years (int): Number of years to simulate.
+        step_days (int): RK4 step in days (see CompartmentalModel.step_days).
+        record_every (int): Keep the state every this many days. Large grids should
+            record sparsely: the records take n_params * n_records * 88 bytes.
+
+    Returns:
+        BatchResult: The recorded trajectories.
+
+    Raises:
+        ValueError: If a parameter is unknown or a row's infected count is not in [0, population).
+    """
+    k = _load_ode_kernels()
+    unknown = set(parameters) - set(BATCH_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown batch parameter(s): {', '.join(sorted(unknown))}")
+    duration_years = duration_years if duration_years is not None else SIMULATION_YEARS
+
+    arrays = {name: np.atleast_1d(np.asarray(value, dtype=float)) for name, value in parameters.items()}
+    n_batch = max((len(value) for value in arrays.values()), default=1)
+
+    # Defaults and the fixed rates come from a template model (validates step_days too)
+    template = CompartmentalModel(step_days=step_days)
+    defaults = {
+        'base_transmission_risk': template.base_transmission_risk,
+        'k_half': template.k_half,
+        'environmental_shedding_rate': template.environmental_shedding_rate,
+        'environmental_decay_rate': template.environmental_decay_rate,
+        'initial_population': template.population,
+    }
+    columns = {name: np.broadcast_to(arrays.get(name, defaults[name]), (n_batch,)).astype(float)
+               for name in defaults}
+    # Checked (or defaulted) row by row, against each row's own population
+    counts = np.broadcast_to(arrays['initial_infected_count'], (n_batch,)) if 'initial_infected_count' in arrays else [None] * n_batch
+    columns['initial_infected_count'] = np.array([
+        initial_infected_count_for(population, None if count is None else int(count))
+        for population, count in zip(columns['initial_population'], counts)
+    ], dtype=float)
+
+    params = np.tile(template.parameter_vector(), (n_batch, 1))
+    params[:, k.PAR_BASE_RISK] = columns['base_transmission_risk']
+    params[:, k.PAR_K_HALF] = columns['k_half']
+    params[:, k.PAR_SHEDDING_RATE] = columns['environmental_shedding_rate']
+    params[:, k.PAR_DECAY_RATE] = columns['environmental_decay_rate']
+    params[:, k.PAR_COUPLED_ENV] = 1.0
+
+    Y = np.zeros((n_batch, k.NUM_STATE))
+    Y[:, k.Y_S] = columns['initial_population'] - columns['initial_infected_count']
+    Y[:, k.Y_P] = columns['initial_infected_count'] # Seed infection here
+    peak_acute = np.zeros(n_batch)
+
+    if Vaccine.is_enabled:
+        # Yearly campaigns: advance one year at a time and vaccinate in between
+        target_fraction = vaccination_target_fraction()
+        all_days, all_records = [], []
+        for year in range(1, duration_years + 1):
+            if year >= Vaccine.start_year:
+                _vaccinate_batch(Y, target_fraction)
+            days, records = k.advance_batch(Y, (year - 1) * 365, 365, params, int(step_days), int(record_every), peak_acute)
+            all_days.append(days)
+            all_records.append(records)
+        days = np.concatenate(all_days)
+        records = np.concatenate(all_records, axis=1)
+    else:
+        days, records = k.advance_batch(Y, 0, duration_years * 365, params, int(step_days), int(record_every), peak_acute)
+
+    return BatchResult(columns, days, records, peak_acute)
@@ -0,0 +1,589 @@
+"""
+Numba-compiled kernels for the CompartmentalModel.
+
+The model state is a flat float64 vector (see the Y_* indices) and all rates
+and switches are passed as a parameter vector (see the PAR_* indices), so the
+same compiled code serves every parameter set. Environmental contagion is the
+last entry of the state vector: with PAR_COUPLED_ENV set it is integrated with
+the compartments (dE/dt = shedding - decay * E), otherwise it is held fixed
+during each day and updated with the ABM's daily decay/shedding rule. compartmental_model.py imports
+this module on first use, keeping `import compartmental_model` free of numba.
+"""
+import numpy as np
+from numba import jit, prange
+
+# --- State vector layout ---
+Y_S, Y_M, Y_P, Y_A, Y_U, Y_C, Y_R, Y_V, Y_CUM_INF, Y_CUM_ACUTE, Y_E = range(11)
+NUM_STATE = 11
+NUM_COMPARTMENTS = 8 # S..V; the cumulative counters are not people
+
+# --- Parameter vector layout ---
+(PAR_BASE_RISK, PAR_K_HALF, PAR_SHEDDING_RATE, PAR_DECAY_RATE, PAR_ENABLE_ENV,
+ PAR_TRANSMISSION_RATE, PAR_BIRTH_RATE, PAR_DEATH_RATE, PAR_ACUTE_MORTALITY,
+ PAR_MATERNAL_LOSS, PAR_PREPATENT_EXIT, PAR_ACUTE_EXIT, PAR_SUBCLINICAL_EXIT,
+ PAR_RECOVERY_LOSS, PAR_VACCINE_LOSS, PAR_P_TO_A, PAR_A_TO_C, PAR_U_TO_C,
+ PAR_SEASON_MIN, PAR_SEASON_PEAK, PAR_SEASON_MAX_DAY, PAR_SEASON_RAMP,
+ PAR_COUPLED_ENV) = range(23)
+NUM_PARAMS = 23
+
+# --- Daily output layout (environment variables recorded for each day) ---
+(OUT_CONTAGION, OUT_INFECTION_PRESSURE, OUT_SEASONALITY, OUT_HAZARD,
+ OUT_NEW_CONTAGION_INC, OUT_ENV_SHEDDING, OUT_NUM_SHEDDING,
+ OUT_NEW_INFECTIONS, OUT_ACUTE_CASES) = range(9)
+NUM_OUTPUTS = 9
+
+# --- Solvers ---
+SOLVER_RK4 = 0
+SOLVER_RK45 = 1
+
+# Dormand-Prince 5(4) tableau
+DP_C = np.array([0.0, 1.0 / 5.0, 3.0 / 10.0, 4.0 / 5.0, 8.0 / 9.0, 1.0, 1.0])
+DP_A = np.array([
+    [0.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+    [1.0 / 5.0, 0.0, 0.0, 0.0, 0.0, 0.0],
+    [3.0 / 40.0, 9.0 / 40.0, 0.0, 0.0, 0.0, 0.0],
+    [44.0 / 45.0, -56.0 / 15.0, 32.0 / 9.0, 0.0, 0.0, 0.0],
+    [19372.0 / 6561.0, -25360.0 / 2187.0, 64448.0 / 6561.0, -212.0 / 729.0, 0.0, 0.0],
+    [9017.0 / 3168.0, -355.0 / 33.0, 46732.0 / 5247.0, 49.0 / 176.0, -5103.0 / 18656.0, 0.0],
+    [35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0],
+])
+DP_B = np.array([35.0 / 384.0, 0.0, 500.0 / 1113.0, 125.0 / 192.0, -2187.0 / 6784.0, 11.0 / 84.0, 0.0])
+DP_B_HAT = np.array([5179.0 / 57600.0, 0.0, 7571.0 / 16695.0, 393.0 / 640.0,
+                     -92097.0 / 339200.0, 187.0 / 2100.0, 1.0 / 40.0])
+# Continuous extension of the pair (Hairer, Norsett & Wanner), for the states inside a step
+DP_DENSE = np.array([-12715105075.0 / 11282082432.0, 0.0, 87487479700.0 / 32700410799.0,
+                     -10690763975.0 / 1880347072.0, 701980252875.0 / 199316789632.0,
+                     -1453857185.0 / 822651844.0, 69997945.0 / 29380423.0])
+RK45_MIN_STEP = 1e-8 # Days; a step rejected below this means the integration cannot proceed
+RK45_MAX_STEPS = 1000000 # Attempted steps per call
+
+
+@jit(nopython=True, cache=True)
+def seasonality_multiplier(day, params):
+    """Trapezoidal seasonality multiplier (mean min/peak values) for a possibly fractional day."""
+    day_of_year = (day - 1.0) % 365.0
+    ramp = params[PAR_SEASON_RAMP]
+    ramp_up_start = params[PAR_SEASON_MAX_DAY] - ramp
+    ramp_up_end = params[PAR_SEASON_MAX_DAY]
+    ramp_down_start = params[PAR_SEASON_MAX_DAY] + 45.0
+    ramp_down_end = ramp_down_start + ramp
+    season_min = params[PAR_SEASON_MIN]
+    season_peak = params[PAR_SEASON_PEAK]
+
+    if ramp_up_start <= day_of_year < ramp_up_end:
+        return season_min + (season_peak - season_min) * ((day_of_year - ramp_up_start) / ramp)
+    elif ramp_up_end <= day_of_year < ramp_down_start:
+        return season_peak
+    elif ramp_down_start <= day_of_year < ramp_down_end:
+        return season_peak - (season_peak - season_min) * ((day_of_year - ramp_down_start) / ramp)
+    return season_min
+
+
+@jit(nopython=True, cache=True)
+def ode_rhs(t, y, params):
+    """
+    Time derivatives of the state vector. Vector form of
+    CompartmentalModel.compute_derivatives, plus the environmental contagion
+    when it is coupled (otherwise its derivative is 0).
+    """
+    dy = np.empty(NUM_STATE)
+    ode_rhs_into(t, y, params, dy)
+    return dy
+
+
+@jit(nopython=True, cache=True)
+def ode_rhs_into(t, y, params, dy):
+    """ode_rhs writing into a preallocated dy, for the batched solver."""
+    S = y[Y_S]
+    M = y[Y_M]
+    P = y[Y_P]
+    A = y[Y_A]
+    U = y[Y_U]
+    C = y[Y_C]
+    R = y[Y_R]
+    V = y[Y_V]
+    environmental_contagion = y[Y_E]
+    total_pop = S + M + P + A + U + C + R + V
+
+    # --- Infection Pressure ---
+    num_shedding = (P + A + U + C) * 0.8 # ABM shedding factor
+    infection_pressure = 0.0
+    if params[PAR_ENABLE_ENV] > 0.0:
+        hazard_factor = 0.0
+        if environmental_contagion > 0.0:
+            hazard_factor = environmental_contagion / (params[PAR_K_HALF] + environmental_contagion)
+        infection_pressure = params[PAR_BASE_RISK] * hazard_factor * seasonality_multiplier(t, params)
+    elif total_pop > 0.0:
+        infection_pressure = (num_shedding / total_pop) * params[PAR_TRANSMISSION_RATE]
+
+    # --- Flows ---
+    death_rate = params[PAR_DEATH_RATE]
+    daily_births = (total_pop * 0.5) * params[PAR_BIRTH_RATE]
+    disease_deaths_A = A * params[PAR_ACUTE_MORTALITY]
+
+    flow_M_to_S = M * params[PAR_MATERNAL_LOSS]
+    flow_S_to_P = S * infection_pressure
+    flow_V_to_P = V * (0.05 * infection_pressure * 0.1)
+
+    flow_P_out = P * params[PAR_PREPATENT_EXIT]
+    flow_P_to_A = flow_P_out * params[PAR_P_TO_A]
+    flow_P_to_U = flow_P_out - flow_P_to_A
+
+    flow_A_out = A * params[PAR_ACUTE_EXIT]
+    flow_A_to_C = flow_A_out * params[PAR_A_TO_C]
+    flow_A_to_R = flow_A_out - flow_A_to_C
+
+    flow_U_out = U * params[PAR_SUBCLINICAL_EXIT]
+    flow_U_to_C = flow_U_out * params[PAR_U_TO_C]
+    flow_U_to_R = flow_U_out - flow_U_to_C
+
+    flow_R_to_S = R * params[PAR_RECOVERY_LOSS]
+    flow_V_to_S = V * params[PAR_VACCINE_LOSS]
+
+    dy[Y_S] = flow_M_to_S + flow_R_to_S + flow_V_to_S - flow_S_to_P - S * death_rate
+    dy[Y_M] = daily_births - flow_M_to_S - M * death_rate
+    dy[Y_P] = flow_S_to_P + flow_V_to_P - flow_P_out - P * death_rate
+    dy[Y_A] = flow_P_to_A - flow_A_out - A * death_rate - disease_deaths_A
+    dy[Y_U] = flow_P_to_U - flow_U_out - U * death_rate
+    dy[Y_C] = flow_A_to_C + flow_U_to_C - C * death_rate
+    dy[Y_R] = flow_A_to_R + flow_U_to_R - flow_R_to_S - R * death_rate
+    dy[Y_V] = -flow_V_to_S - flow_V_to_P - V * death_rate
+    dy[Y_CUM_INF] = flow_S_to_P + flow_V_to_P
+    dy[Y_CUM_ACUTE] = flow_P_to_A
+
+    # --- Environment ---
+    # Continuous form of the daily update E' = E * exp(-decay) + shedding. Its solution
+    # is the day-average of the ABM's sawtooth, so the two agree on the mean level.
+    dy[Y_E] = 0.0
+    if params[PAR_COUPLED_ENV] > 0.0:
+        dy[Y_E] = num_shedding * params[PAR_SHEDDING_RATE] - params[PAR_DECAY_RATE] * environmental_contagion
+
+
+@jit(nopython=True, cache=True)
+def rk4_step(t, y, dt, params):
+    """One classical RK4 step of size dt."""
+    k1 = ode_rhs(t, y, params)
+    k2 = ode_rhs(t + 0.5 * dt, y + 0.5 * dt * k1, params)
+    k3 = ode_rhs(t + 0.5 * dt, y + 0.5 * dt * k2, params)
+    k4 = ode_rhs(t + dt, y + dt * k3, params)
+    return y + (dt / 6.0) * (k1 + 2.0 * k2 + 2.0 * k3 + k4)
+
+
+@jit(nopython=True, cache=True)
+def _dp_step(t, y, h, params, rtol, atol, k):
+    """
+    One Dormand-Prince 5(4) step of size h; fills the stages k (k[6] is the
+    derivative at the new state).
+
+    Returns:
+        Tuple: The new state and the scaled error norm (accept the step if <= 1).
+    """
+    k[0] = ode_rhs(t, y, params)
+    for stage in range(1, 7):
+        y_stage = y.copy()
+        for j in range(stage):
+            y_stage += h * DP_A[stage, j] * k[j]
+        k[stage] = ode_rhs(t + DP_C[stage] * h, y_stage, params)
+
+    y_new = y.copy()
+    y_err = np.zeros(NUM_STATE)
+    for stage in range(7):
+        y_new += h * DP_B[stage] * k[stage]
+        y_err += h * (DP_B[stage] - DP_B_HAT[stage]) * k[stage]
+
+    err_sq = 0.0
+    for i in range(NUM_STATE):
+        scale = atol + rtol * max(abs(y[i]), abs(y_new[i]))
+        err_sq += (y_err[i] / scale) ** 2
+    err = np.sqrt(err_sq / NUM_STATE)
+    if not np.isfinite(err):
+        raise ValueError("RK45: the state or its derivatives are not finite")
+    return y_new, err
+
+
+@jit(nopython=True, cache=True)
+def _next_step_size(h, err):
+    """Standard step-size controller with safety factor and growth limits."""
+    factor = 5.0 if err == 0.0 else min(5.0, max(0.2, 0.9 * err ** -0.2))
+    h_new = h * factor
+    if err > 1.0 and h_new < RK45_MIN_STEP:
+        raise ValueError("RK45: the step size fell below RK45_MIN_STEP")
+    return h_new
+
+
+@jit(nopython=True, cache=True)
+def rk45_integrate(t0, t1, y, params, rtol, atol, h):
+    """
+    Integrates from t0 to t1 with the adaptive Dormand-Prince 5(4) pair.
+
+    Returns:
+        Tuple: The state at t1 and the step size to try next.
+
+    Raises:
+        ValueError: If the state stops being finite, the step size falls below
+            RK45_MIN_STEP or more than RK45_MAX_STEPS steps are attempted.
+    """
+    t = t0
+    k = np.empty((7, NUM_STATE))
+    steps = 0
+    while t < t1:
+        if h > t1 - t:
+            h = t1 - t
+        steps += 1
+        if steps > RK45_MAX_STEPS:
+            raise ValueError("RK45: more than RK45_MAX_STEPS steps")
+        y_new, err = _dp_step(t, y, h, params, rtol, atol, k)
+        if err <= 1.0:
+            t += h
+            y = y_new
+        h = _next_step_size(h, err)
+    return y, h
+
+
+@jit(nopython=True, cache=True)
+def rk45_dense(t0, n_days, y, params, rtol, atol, h, states):
+    """
+    Integrates n_days days from t0 with the adaptive Dormand-Prince 5(4) pair,
+    with steps free to span day boundaries, and fills states[d] with the state
+    at t0 + d + 1 from the pair's continuous extension.
+
+    Returns:
+        Tuple: The state at t0 + n_days and the step size to try next.
+
+    Raises:
+        ValueError: As rk45_integrate.
+    """
+    t = t0
+    t_end = t0 + n_days
+    k = np.empty((7, NUM_STATE))
+    next_day = 0
+    steps = 0
+    while next_day < n_days:
+        if h > t_end - t:
+            h = t_end - t
+        steps += 1
+        if steps > RK45_MAX_STEPS:
+            raise ValueError("RK45: more than RK45_MAX_STEPS steps")
+        y_new, err = _dp_step(t, y, h, params, rtol, atol, k)
+        if err <= 1.0:
+            # Every day ending inside this step (the tolerance absorbs rounding at the end)
+            while next_day < n_days and t0 + next_day + 1 <= t + h + 1e-9:
+                theta = min((t0 + next_day + 1 - t) / h, 1.0)
+                difference = y_new - y
+                bspl = h * k[0] - difference
+                dense = h * (DP_DENSE[0] * k[0] + DP_DENSE[2] * k[2] + DP_DENSE[3] * k[3]
+                             + DP_DENSE[4] * k[4] + DP_DENSE[5] * k[5] + DP_DENSE[6] * k[6])
+                states[next_day] = y + theta * (difference + (1.0 - theta) * (
+                    bspl + theta * (difference - h * k[6] - bspl + (1.0 - theta) * dense)))
+                next_day += 1
+            t += h
+            y = y_new
+        h = _next_step_size(h, err)
+    return y, h
+
+
+@jit(nopython=True, cache=True)
+def hermite(y0, f0, y1, f1, h, theta):
+    """
+    Cubic Hermite interpolant at fraction theta of a step of h days, from the
+    values y0, y1 and derivatives f0, f1 at its ends (scalars or arrays).
+    Unlike a straight line it follows the curvature, so peaks inside a
+    multi-day step are not cut off.
+    """
+    theta2 = theta * theta
+    theta3 = theta2 * theta
+    return ((2.0 * theta3 - 3.0 * theta2 + 1.0) * y0 + (theta3 - 2.0 * theta2 + theta) * h * f0
+            + (3.0 * theta2 - 2.0 * theta3) * y1 + (theta3 - theta2) * h * f1)
+
+
+@jit(nopython=True, cache=True)
+def daily_outputs(day, y, previous, params, out):
+    """Fills one row of daily environment outputs from the end-of-day state and the previous day's state."""
+    num_shedding = (y[Y_P] + y[Y_A] + y[Y_U] + y[Y_C]) * 0.8
+    out[OUT_NUM_SHEDDING] = num_shedding
+    out[OUT_SEASONALITY] = 1.0
+    if params[PAR_ENABLE_ENV] > 0.0:
+        environmental_contagion = y[Y_E]
+        seasonality = seasonality_multiplier(float(day), params)
+        hazard_factor = 0.0
+        if environmental_contagion > 0.0:
+            hazard_factor = environmental_contagion / (params[PAR_K_HALF] + environmental_contagion)
+        out[OUT_NEW_CONTAGION_INC] = previous[Y_E] * np.exp(-1.0 * params[PAR_DECAY_RATE])
+        out[OUT_ENV_SHEDDING] = num_shedding * params[PAR_SHEDDING_RATE]
+        out[OUT_SEASONALITY] = seasonality
+        out[OUT_HAZARD] = hazard_factor
+        out[OUT_INFECTION_PRESSURE] = params[PAR_BASE_RISK] * hazard_factor * seasonality
+    else:
+        active_pop = 0.0
+        for i in range(NUM_COMPARTMENTS):
+            active_pop += y[i]
+        if active_pop > 0.0:
+            out[OUT_INFECTION_PRESSURE] = (num_shedding / active_pop) * params[PAR_TRANSMISSION_RATE]
+    out[OUT_CONTAGION] = y[Y_E]
+    out[OUT_NEW_INFECTIONS] = y[Y_CUM_INF] - previous[Y_CUM_INF]
+    out[OUT_ACUTE_CASES] = y[Y_CUM_ACUTE] - previous[Y_CUM_ACUTE]
+
+
+@jit(nopython=True, cache=True)
+def advance_days(y, start_day, n_days, params, solver, rtol, atol, step_days):
+    """
+    Advances the model n_days days after start_day in steps of step_days days.
+
+    With a coupled environment, RK45 integrates the whole span with adaptive
+    steps and takes the days from its dense output (step_days does not apply);
+    RK4 integrates over each step and the days inside a multi-day step come
+    from the cubic Hermite interpolant of its end states and derivatives. Otherwise step_days must be 1: the population is
+    integrated over each day with the environment fixed, then the environment
+    gets the daily decay/shedding update.
+
+    Returns:
+        Tuple: (n_days x NUM_STATE) states at the end of each day and
+        (n_days x NUM_OUTPUTS) daily environment outputs.
+    """
+    states = np.empty((n_days, NUM_STATE))
+    outputs = np.zeros((n_days, NUM_OUTPUTS))
+    h = 1.0
+    if solver == SOLVER_RK45 and params[PAR_COUPLED_ENV] > 0.0:
+        y_start = y.copy()
+        rk45_dense(float(start_day + 1), n_days, y, params, rtol, atol, h, states)
+        for d in range(n_days):
+            for i in range(NUM_STATE):
+                if states[d, i] < 0.0:
+                    states[d, i] = 0.0 # Clamp to 0
+            daily_outputs(start_day + d + 1, states[d], y_start if d == 0 else states[d - 1], params, outputs[d])
+        return states, outputs
+    d = 0
+    while d < n_days:
+        n = min(step_days, n_days - d) # The last step is shortened to end on n_days
+        t0 = float(start_day + d + 1)
+        previous = y.copy()
+        if n > 1:
+            f_start = ode_rhs(t0, previous, params)
+        if solver == SOLVER_RK45:
+            y, h = rk45_integrate(t0, t0 + n, y, params, rtol, atol, h)
+        else:
+            y = rk4_step(t0, y, float(n), params)
+        for i in range(NUM_STATE):
+            if y[i] < 0.0:
+                y[i] = 0.0 # Clamp to 0
+
+        if params[PAR_COUPLED_ENV] == 0.0 and params[PAR_ENABLE_ENV] > 0.0:
+            # --- Update Environment (separate daily step) ---
+            num_shedding = (y[Y_P] + y[Y_A] + y[Y_U] + y[Y_C]) * 0.8
+            y[Y_E] = previous[Y_E] * np.exp(-1.0 * params[PAR_DECAY_RATE]) + num_shedding * params[PAR_SHEDDING_RATE]
+
+        if n > 1:
+            f_end = ode_rhs(t0 + n, y, params)
+            for j in range(n - 1):
+                states[d + j] = np.maximum(hermite(previous, f_start, y, f_end, float(n), (j + 1.0) / n), 0.0)
+        states[d + n - 1] = y
+        for j in range(n):
+            day_start = previous if j == 0 else states[d + j - 1]
+            daily_outputs(start_day + d + j + 1, states[d + j], day_start, params, outputs[d + j])
+        d += n
+    return states, outputs
+
+
+# --- Parameter-batched solver ---
+# The batch state is an (n_batch x NUM_STATE) array with one row per parameter
+# set (rows of an (n_batch x NUM_PARAMS) parameter array). Derivatives for the
+# whole batch are computed in one call, in parallel over rows.
+
+@jit(nopython=True, cache=True, parallel=True)
+def ode_rhs_batch(t, Y, params, dY):
+    """Time derivatives of every row of the batch state, written into dY."""
+    for b in prange(Y.shape[0]):
+        ode_rhs_into(t, Y[b], params[b], dY[b])
+
+
+@jit(nopython=True, cache=True, parallel=True)
+def _batch_axpy(out, Y, a, K):
+    """out = Y + a * K over the whole batch."""
+    for b in prange(Y.shape[0]):
+        for i in range(NUM_STATE):
+            out[b, i] = Y[b, i] + a * K[b, i]
+
+
+@jit(nopython=True, cache=True, parallel=True)
+def _batch_rk4_update(Y, dt, k1, k2, k3, k4):
+    for b in prange(Y.shape[0]):
+        for i in range(NUM_STATE):
+            value = Y[b, i] + (dt / 6.0) * (k1[b, i] + 2.0 * k2[b, i] + 2.0 * k3[b, i] + k4[b, i])
+            Y[b, i] = value if value > 0.0 else 0.0 # Clamp to 0
+
+
+@jit(nopython=True, cache=True)
+def advance_batch(Y, start_day, n_days, params, step_days, record_every, peak_acute):
+    """
+    Advances every row of the batch n_days days after start_day with RK4 steps of
+    step_days days. The environment must be coupled (PAR_COUPLED_ENV set).
+    Y is updated in place and peak_acute holds the running maximum of A at the end
+    of every day.
+
+    Returns:
+        Tuple: The recorded days (absolute day numbers divisible by record_every) and
+        the (n_batch x n_records x NUM_STATE) states at the end of those days, with
+        days inside a multi-day step taken from the cubic Hermite interpolant (see hermite).
+    """
+    n_batch = Y.shape[0]
+    n_records = 0
+    for d in range(n_days):
+        if (start_day + d + 1) % record_every == 0:
+            n_records += 1
+    days = np.empty(n_records, dtype=np.int64)
+    records = np.empty((n_batch, n_records, NUM_STATE))
+
+    k1 = np.empty_like(Y)
+    k2 = np.empty_like(Y)
+    k3 = np.empty_like(Y)
+    k4 = np.empty_like(Y)
+    Y_stage = np.empty_like(Y)
+    previous = np.empty_like(Y)
+    f_start = np.empty_like(Y)
+    r = 0
+    d = 0
+    ode_rhs_batch(float(start_day + 1), Y, params, k1)
+    while d < n_days:
+        n = min(step_days, n_days - d)
+        t = float(start_day + d + 1)
+        dt = float(n)
+        previous[:] = Y
+        f_start[:] = k1
+        _batch_axpy(Y_stage, Y, 0.5 * dt, k1)
+        ode_rhs_batch(t + 0.5 * dt, Y_stage, params, k2)
+        _batch_axpy(Y_stage, Y, 0.5 * dt, k2)
+        ode_rhs_batch(t + 0.5 * dt, Y_stage, params, k3)
+        _batch_axpy(Y_stage, Y, dt, k3)
+        ode_rhs_batch(t + dt, Y_stage, params, k4)
+        _batch_rk4_update(Y, dt, k1, k2, k3, k4)
+        # The derivative at the end of the step is also the next step's first stage
+        ode_rhs_batch(t + dt, Y, params, k1)
+
+        for j in range(n):
+            day = start_day + d + j + 1
+            theta = (j + 1.0) / n
+            is_recorded = day % record_every == 0
+            for b in range(n_batch):
+                acute = Y[b, Y_A]
+                if j < n - 1:
+                    acute = max(hermite(previous[b, Y_A], f_start[b, Y_A], Y[b, Y_A], k1[b, Y_A], dt, theta), 0.0)
+                if acute > peak_acute[b]:
+                    peak_acute[b] = acute
+                if is_recorded:
+                    for i in range(NUM_STATE):
+                        value = Y[b, i]
+                        if j < n - 1:
+                            value = max(hermite(previous[b, i], f_start[b, i], Y[b, i], k1[b, i], dt, theta), 0.0)
+                        records[b, r, i] = value
+            if is_recorded:
+                days[r] = day
+                r += 1
+        d += n
+    return days, records
+
+
+# --- Forward sensitivities ---
+# Sensitivities S = dy/dtheta of the state with respect to the log of the base
+# transmission risk, k_half and the shedding rate, integrated alongside the state
+# with dS/dt = J_y S + J_theta. Environmental transmission with a coupled environment only.
+SENS_BASE_RISK, SENS_K_HALF, SENS_SHEDDING_RATE = range(3)
+NUM_SENS = 3
+
+
+@jit(nopython=True, cache=True)
+def sensitivity_rhs(t, y, sens, params):
+    """
+    Time derivatives of the state and of its sensitivities.
+
+    Returns:
+        Tuple: dy (NUM_STATE) and dsens (NUM_STATE x NUM_SENS).
+    """
+    dy = ode_rhs(t, y, params)
+    environmental_contagion = y[Y_E]
+    k_half = params[PAR_K_HALF]
+    seasonality = seasonality_multiplier(t, params)
+    pressure = 0.0
+    d_pressure_d_env = 0.0
+    if environmental_contagion > 0.0:
+        pressure = params[PAR_BASE_RISK] * environmental_contagion / (k_half + environmental_contagion) * seasonality
+        d_pressure_d_env = params[PAR_BASE_RISK] * seasonality * k_half / (k_half + environmental_contagion) ** 2
+    death_rate = params[PAR_DEATH_RATE]
+    prepatent_exit = params[PAR_PREPATENT_EXIT]
+    acute_exit = params[PAR_ACUTE_EXIT]
+    subclinical_exit = params[PAR_SUBCLINICAL_EXIT]
+    S = y[Y_S]
+    V = y[Y_V]
+
+    # --- State Jacobian J_y ---
+    jac = np.zeros((NUM_STATE, NUM_STATE))
+    jac[Y_S, Y_S] = -death_rate - pressure
+    jac[Y_S, Y_M] = params[PAR_MATERNAL_LOSS]
+    jac[Y_S, Y_R] = params[PAR_RECOVERY_LOSS]
+    jac[Y_S, Y_V] = params[PAR_VACCINE_LOSS]
+    jac[Y_S, Y_E] = -S * d_pressure_d_env
+    for i in range(NUM_COMPARTMENTS):
+        jac[Y_M, i] = 0.5 * params[PAR_BIRTH_RATE]
+    jac[Y_M, Y_M] -= params[PAR_MATERNAL_LOSS] + death_rate
+    jac[Y_P, Y_S] = pressure
+    jac[Y_P, Y_V] = 0.005 * pressure
+    jac[Y_P, Y_P] = -prepatent_exit - death_rate
+    jac[Y_P, Y_E] = (S + 0.005 * V) * d_pressure_d_env
+    jac[Y_A, Y_P] = prepatent_exit * params[PAR_P_TO_A]
+    jac[Y_A, Y_A] = -acute_exit - death_rate - params[PAR_ACUTE_MORTALITY]
+    jac[Y_U, Y_P] = prepatent_exit * (1.0 - params[PAR_P_TO_A])
+    jac[Y_U, Y_U] = -subclinical_exit - death_rate
+    jac[Y_C, Y_A] = acute_exit * params[PAR_A_TO_C]
+    jac[Y_C, Y_U] = subclinical_exit * params[PAR_U_TO_C]
+    jac[Y_C, Y_C] = -death_rate
+    jac[Y_R, Y_A] = acute_exit * (1.0 - params[PAR_A_TO_C])
+    jac[Y_R, Y_U] = subclinical_exit * (1.0 - params[PAR_U_TO_C])
+    jac[Y_R, Y_R] = -params[PAR_RECOVERY_LOSS] - death_rate
+    jac[Y_V, Y_V] = -params[PAR_VACCINE_LOSS] - death_rate - 0.005 * pressure
+    jac[Y_V, Y_E] = -0.005 * V * d_pressure_d_env
+    jac[Y_CUM_INF, Y_S] = pressure
+    jac[Y_CUM_INF, Y_V] = 0.005 * pressure
+    jac[Y_CUM_INF, Y_E] = (S + 0.005 * V) * d_pressure_d_env
+    jac[Y_CUM_ACUTE, Y_P] = prepatent_exit * params[PAR_P_TO_A]
+    for i in (Y_P, Y_A, Y_U, Y_C):
+        jac[Y_E, i] = 0.8 * params[PAR_SHEDDING_RATE]
+    jac[Y_E, Y_E] = -params[PAR_DECAY_RATE]
+
+    # --- Parameter Jacobian J_theta (log parameters) ---
+    jac_theta = np.zeros((NUM_STATE, NUM_SENS))
+    d_pressure = np.zeros(NUM_SENS)
+    d_pressure[SENS_BASE_RISK] = pressure
+    if environmental_contagion > 0.0:
+        d_pressure[SENS_K_HALF] = -pressure * k_half / (k_half + environmental_contagion)
+    for j in range(2):
+        jac_theta[Y_S, j] = -S * d_pressure[j]
+        jac_theta[Y_P, j] = (S + 0.005 * V) * d_pressure[j]
+        jac_theta[Y_V, j] = -0.005 * V * d_pressure[j]
+        jac_theta[Y_CUM_INF, j] = (S + 0.005 * V) * d_pressure[j]
+    jac_theta[Y_E, SENS_SHEDDING_RATE] = 0.8 * params[PAR_SHEDDING_RATE] * (y[Y_P] + y[Y_A] + y[Y_U] + y[Y_C])
+
+    return dy, jac @ sens + jac_theta
+
+
+@jit(nopython=True, cache=True)
+def advance_with_sensitivities(y, sens, start_day, n_days, params):
+    """
+    Daily RK4 integration of the state and its forward sensitivities, starting
+    from the sensitivities sens (NUM_STATE x NUM_SENS; zeros at the start of a run).
+
+    Returns:
+        Tuple: (n_days x NUM_STATE) end-of-day states and
+        (n_days x NUM_STATE x NUM_SENS) end-of-day sensitivities.
+    """
+    states = np.empty((n_days, NUM_STATE))
+    sensitivities = np.empty((n_days, NUM_STATE, NUM_SENS))
+    for d in range(n_days):
+        t = float(start_day + d + 1)
+        k1, l1 = sensitivity_rhs(t, y, sens, params)
+        k2, l2 = sensitivity_rhs(t + 0.5, y + 0.5 * k1, sens + 0.5 * l1, params)
+        k3, l3 = sensitivity_rhs(t + 0.5, y + 0.5 * k2, sens + 0.5 * l2, params)
+        k4, l4 = sensitivity_rhs(t + 1.0, y + k3, sens + l3, params)
+        y = y + (k1 + 2.0 * k2 + 2.0 * k3 + k4) / 6.0
+        sens = sens + (l1 + 2.0 * l2 + 2.0 * l3 + l4) / 6.0
+        states[d] = y
+        sensitivities[d] = sens
+    return states, sensitivities
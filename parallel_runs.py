@@ -0,0 +1,90 @@
+"""
+Runs many independent simulations in a pool of worker processes.
+
+Shared by the sensitivity analysis and the tuners, which need whole batches of
+runs that differ only in their parameters:
+
+    results = run_simulations([{'k_half': 1e7}, {'k_half': 1e8}], engine='abm',
+                              duration_years=5, initial_population=10000, initial_infected_count=300)
+
+Each run is seeded (seed + its index) so batches are reproducible whatever
+the number of workers, and its console output is discarded. Callers that need
+only a few numbers per run should name them (outputs=('peak_acute', 'dalys')):
+the workers then return those instead of pickling every run's full histories.
+"""
+import contextlib
+import io
+import os
+from initialparaandconst import SIMULATION_YEARS
+
+
+def run_outputs(result, outputs, dalys_from_day=0):
+    """
+    Extracts named outputs from a run.
+
+    Args:
+        result (SimulationResult): The run.
+        outputs (tuple): Names among the SimulationResult.summary() keys, 'dalys'
+            (counted after dalys_from_day) and the run's 'wall_time' and 'compile_time'.
+
+    Returns:
+        dict: A float per output name.
+    """
+    summary = result.summary() if set(outputs) - {'dalys', 'wall_time', 'compile_time'} else {}
+    values = {}
+    for name in outputs:
+        if name == 'dalys':
+            values[name] = float(result.dalys(dalys_from_day))
+        elif name in ('wall_time', 'compile_time'):
+            values[name] = float(result.metadata[name])
+        else:
+            values[name] = float(summary[name])
+    return values
+
+
+def _run_one(task):
+    """
+    Runs one parameter set and returns its SimulationResult, or only the requested
+    outputs (see run_outputs). Executed in the worker processes.
+    """
+    engine_name, duration_years, params, seed, outputs, dalys_from_day = task
+    from engine import make_engine
+    from simulation import Simulation
+    from model import set_seed
+
+    set_seed(seed)
+    # The runs' progress output would interleave across workers
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = Simulation(make_engine(engine_name, **params)).run(duration_years, save=False)
+    return result if outputs is None else run_outputs(result, outputs, dalys_from_day)
+
+
+def run_simulations(samples, engine='ode', duration_years=None, workers=None, seed=0, outputs=None,
+                    dalys_from_day=0, **engine_kwargs):
+    """
+    Runs every parameter set through Simulation, in parallel.
+
+    Args:
+        samples (list): Parameter dicts, one per run.
+        engine (str): Engine name (see engine.ENGINES).
+        duration_years (int): Length of every run.
+        workers (int): Worker processes; defaults to the number of CPUs, 1 runs in-process.
+        seed (int): Run i is seeded with seed + i.
+        outputs (tuple): Output names (see run_outputs) to return instead of the full results.
+        dalys_from_day (int): DALYs are counted after this day.
+        **engine_kwargs: Parameters shared by every run (initial_population, mode, ...).
+
+    Returns:
+        list: The SimulationResult of each run, or with outputs a dict of those
+        outputs per run, in the order of samples.
+    """
+    duration_years = duration_years if duration_years is not None else SIMULATION_YEARS
+    workers = workers if workers is not None else os.cpu_count() or 1
+    outputs = tuple(outputs) if outputs is not None else None
+    tasks = [(engine, duration_years, dict(engine_kwargs, **params), seed + i, outputs, dalys_from_day)
+             for i, params in enumerate(samples)]
+    if workers <= 1 or len(tasks) <= 1:
+        return [_run_one(task) for task in tasks]
+    from multiprocessing import Pool
+    with Pool(min(workers, len(tasks))) as pool:
+        return pool.map(_run_one, tasks, chunksize=max(1, len(tasks) // (4 * workers)))
@@ -0,0 +1,45 @@
+"""
+Builds the numba kernel cache ahead of time.
+
+Run this once after installing or changing the kernels (kernels.py for the
+agent-based model, ode_kernels.py and stochastic_kernels.py for the
+compartmental engines) so the first simulation starts without paying the JIT
+compilation cost:
+
+    python precompile.py
+    python precompile.py --cache-dir jit_cache   # build a cache directory to ship
+
+When shipping a prebuilt cache, set NUMBA_CACHE_DIR to the same directory on
+the target machine before starting runmain.py or the web app.
+"""
+import argparse
+import os
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile and cache the simulation kernels.")
+    parser.add_argument("--cache-dir", help="Directory to write the kernel cache to (sets NUMBA_CACHE_DIR)")
+    args = parser.parse_args()
+
+    if args.cache_dir:
+        # Must be set before numba is imported for the cache locator to pick it up.
+        os.makedirs(args.cache_dir, exist_ok=True)
+        os.environ["NUMBA_CACHE_DIR"] = os.path.abspath(args.cache_dir)
+
+    start_time = time.perf_counter()
+    from model import compile_kernels
+    from compartmental_model import compile_ode_kernels
+    from stochastic_model import compile_stochastic_kernels
+    import_time = time.perf_counter() - start_time
+
+    compile_time = compile_kernels() + compile_kernels(compact_dtypes=True) # The memory-budget mode's agent arrays
+    compile_time += compile_ode_kernels() + compile_stochastic_kernels()
+    print(f"Import time: {import_time:.4f} s")
+    print(f"Kernel compile/load time: {compile_time:.4f} s")
+    if args.cache_dir:
+        print(f"Kernel cache written to '{os.environ['NUMBA_CACHE_DIR']}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Scaled-down proxy runs of a large population.
+
+The environmental force of infection depends on the contagion level relative
+to K_HALF, and the contagion grows with N * shedding / decay, so a smaller
+population behaves per capita like the full one once K_HALF is divided (or
+the shedding rate multiplied) by the same factor and the initial infections
+are scaled down with it (see calculate_r0.py):
+
+    result = run_proxy(target_population=10000000, proxy_population=100000, duration_years=20)
+    result.summary()   # reported at the 10M scale
+
+    validate_proxy(target_population=1000000, proxy_population=100000, duration_years=10)
+
+Counts are scaled back up by the same factor, so the proxy reproduces the
+expected dynamics of the full population; its run-to-run noise is that of the
+smaller population. Rare events suffer most: the YLL part of DALYs comes from a
+handful of disease deaths in a small proxy, so average several replicates.
+"""
+import numpy as np
+from initialparaandconst import K_HALF, ENVIRONMENTAL_SHEDDING_RATE
+from results import SimulationResult
+
+RESCALE_MODES = ('k_half', 'shedding')
+# Daily environment variables that grow with the population (the rest are rates and multipliers)
+EXTENSIVE_ENVIRONMENT_VARIABLES = ('num_environmentally_shedding', 'num_shedding_agents')
+CONTAGION_VARIABLES = ('contagion', 'new_contagion_inc')
+
+
+def proxy_parameters(target_population, proxy_population, rescale='k_half', **params):
+    """
+    Parameters that make a proxy_population run match target_population per capita.
+
+    Args:
+        target_population (int): Population the results should describe.
+        proxy_population (int): Population actually simulated.
+        rescale (str): 'k_half' divides K_HALF by the scale factor; 'shedding'
+            multiplies the shedding rate instead (the contagion level is then unchanged).
+        **params: Model parameters for the full-size run (defaults from initialparaandconst).
+
+    Returns:
+        Tuple: (proxy parameters, scale factor target_population / proxy_population).
+    """
+    if rescale not in RESCALE_MODES:
+        raise ValueError(f"Unknown rescale mode '{rescale}'. Choose from: {', '.join(RESCALE_MODES)}")
+    factor = target_population / proxy_population
+    proxy = dict(params)
+    proxy['initial_population'] = int(proxy_population)
+    if params.get('initial_infected_count') is not None: # Otherwise the model scales the default to the proxy
+        proxy['initial_infected_count'] = max(1, int(round(params['initial_infected_count'] / factor)))
+    if rescale == 'k_half':
+        proxy['k_half'] = params.get('k_half', K_HALF) / factor
+    else:
+        proxy['environmental_shedding_rate'] = params.get('environmental_shedding_rate', ENVIRONMENTAL_SHEDDING_RATE) * factor
+    return proxy, factor
+
+
+def _scale_value(value, factor):
+    if isinstance(value, list):
+        return [_scale_value(item, factor) for item in value]
+    if isinstance(value, (int, np.integer)):
+        return int(round(value * factor))
+    return value * factor
+
+
+def scale_result(result, factor, rescale='k_half'):
+    """
+    Scales the counts of a proxy run up to the target population.
+
+    Returns:
+        SimulationResult: A new result; rates and multipliers are left unchanged.
+    """
+    population_history = [{key: value if key == 'year' else _scale_value(value, factor) for key, value in year.items()}
+                          for year in result.population_history]
+    sir_history = [{key: value if key == 'day' else _scale_value(value, factor) for key, value in day.items()}
+                   for day in result.sir_history]
+    extensive = EXTENSIVE_ENVIRONMENT_VARIABLES + (CONTAGION_VARIABLES if rescale == 'k_half' else ())
+    environment_history = [{key: _scale_value(value, factor) if key in extensive else value for key, value in day.items()}
+                           for day in result.environment_history]
+    metadata = dict(result.metadata)
+    metadata['proxy'] = {
+        'scale_factor': factor,
+        'rescale': rescale,
+        'simulated_population': result.metadata.get('parameters', {}).get('initial_population'),
+    }
+    name = f"{result.name}_proxy{int(round(factor))}x"
+    return SimulationResult(name, population_history, sir_history, environment_history, metadata)
+
+
+def run_proxy(target_population, proxy_population=None, scale=None, engine='abm', duration_years=None,
+              rescale='k_half', seed=None, save=False, **params):
+    """
+    Runs a scaled-down proxy of a target_population simulation.
+
+    Args:
+        target_population (int): Population the results should describe.
+        proxy_population (int): Population to simulate; or give scale instead.
+        scale (float): Reduction factor (proxy_population = target_population / scale).
+        engine (str): Engine name (see engine.ENGINES).
+        duration_years (int): Length of the run.
+        rescale (str): 'k_half' or 'shedding' (see proxy_parameters()).
+        seed (int): Random seed.
+        save (bool): Whether to write the scaled history files.
+        **params: Model parameters for the full-size run.
+
+    Returns:
+        SimulationResult: The proxy run with its counts scaled to target_population.
+    """
+    from parallel_runs import run_simulations
+
+    if proxy_population is None:
+        if scale is None:
+            raise ValueError("Give proxy_population or scale")
+        proxy_population = int(round(target_population / scale))
+    proxy, factor = proxy_parameters(target_population, proxy_population, rescale, **params)
+    result = run_simulations([proxy], engine, duration_years, workers=1, seed=seed or 0)[0]
+    scaled = scale_result(result, factor, rescale)
+    if save:
+        scaled.save()
+    return scaled
+
+
+def _yearly_incidence(result):
+    return np.array([year['yearly_new_infections'] for year in result.population_history if year['year'] > 0], dtype=float)
+
+
+def validate_proxy(target_population, proxy_population, engine='abm', duration_years=None, rescale='k_half',
+                   replicates=1, seed=None, **params):
+    """
+    Compares proxy runs with a full-size run of the same parameters.
+
+    Args:
+        replicates (int): Proxy runs to average (the proxy is noisier than the full run).
+        Other arguments as for run_proxy().
+
+    Returns:
+        dict: For cumulative infections, cumulative acute cases, peak ACUTE and DALYs
+        the 'full' and mean 'proxy' value and their 'relative_error'; the yearly
+        incidence 'max_relative_error'; the full and proxy 'wall_time' and the 'speedup'.
+    """
+    from parallel_runs import run_simulations
+
+    full_params = dict(params, initial_population=int(target_population))
+    full = run_simulations([full_params], engine, duration_years, workers=1, seed=seed or 0)[0]
+    proxies = [run_proxy(target_population, proxy_population, engine=engine, duration_years=duration_years,
+                         rescale=rescale, seed=(seed or 0) + 1 + i, **params) for i in range(replicates)]
+    # Simulation time only; JIT compilation is a one-off cost
+    full_time = full.metadata['wall_time']
+    proxy_time = float(np.mean([proxy.metadata['wall_time'] for proxy in proxies]))
+
+    def headline(result):
+        summary = result.summary()
+        return {
+            'cumulative_infections': summary['cumulative_infections'],
+            'cumulative_acute_cases': summary['cumulative_acute_cases'],
+            'peak_acute': summary['peak_acute'],
+            'dalys': result.dalys(),
+        }
+
+    full_values = headline(full)
+    proxy_values = [headline(proxy) for proxy in proxies]
+    report = {}
+    for key, full_value in full_values.items():
+        proxy_value = float(np.mean([values[key] for values in proxy_values]))
+        report[key] = {
+            'full': float(full_value),
+            'proxy': proxy_value,
+            'relative_error': (proxy_value - full_value) / full_value if full_value else float('nan'),
+        }
+    full_incidence = _yearly_incidence(full)
+    proxy_incidence = np.mean([_yearly_incidence(proxy) for proxy in proxies], axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yearly_errors = np.abs(proxy_incidence - full_incidence) / full_incidence
+    report['yearly_incidence'] = {
+        'full': full_incidence,
+        'proxy': proxy_incidence,
+        'max_relative_error': float(np.nanmax(yearly_errors)) if len(yearly_errors) else float('nan'),
+    }
+    report['wall_time'] = {'full': full_time, 'proxy': proxy_time}
+    report['speedup'] = full_time / proxy_time if proxy_time > 0 else float('inf')
+
+    print(f"Proxy validation: N={target_population} vs proxy N={proxy_population} ({rescale} rescaled, {replicates} replicate(s))")
+    for key in full_values:
+        print(f"  {key:<24} full={report[key]['full']:>14,.1f}  proxy={report[key]['proxy']:>14,.1f}  "
+              f"error={report[key]['relative_error']:+.2%}")
+    print(f"  yearly incidence max error {report['yearly_incidence']['max_relative_error']:.2%}")
+    print(f"  wall time {full_time:.2f} s vs {proxy_time:.2f} s per proxy run ({report['speedup']:.1f}x faster)")
+    return report
@@ -15,7 +15,9 @@ DAILY_ENVIRONMENT_VARIABLES = [
     "infection_pressure",
     "seasonality_multiplier",
     "new_contagion_inc",
-    "num_environmentally_shedding"
+    "num_environmentally_shedding",
+    "hazard_factor",
+    "num_shedding_agents"
 ]
 
 # --- Yearly Summary Variables ---
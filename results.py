@@ -0,0 +1,250 @@
+"""
+Result schema and file helpers shared by every engine.
+
+Kept free of numba/plotly imports so the visualizers, the web app and the CLI
+can locate and load run outputs cheaply.
+"""
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import weakref
+
+LATEST_SIMULATION_FILE = 'latest_simulation_name.txt'
+HISTORY_KINDS = ('population', 'sir', 'environment')
+# Disability weights used for the YLD part of DALYs (as in vaccine_analysis.py)
+DISABILITY_WEIGHTS = {'ACUTE': 0.27, 'SUBCLINICAL': 0.01, 'CHRONIC': 0.05}
+STREAM_BUFFER_RECORDS = 365 # Records a StreamedHistory holds in memory before appending them to its file
+
+
+def latest_simulation_name(directory='.'):
+    """Returns the base name of the most recent run, as recorded by SimulationResult.save."""
+    with open(os.path.join(directory, LATEST_SIMULATION_FILE), 'r') as f:
+        return f.read().strip()
+
+
+def history_path(kind, name=None, directory='.'):
+    """Returns the path of a history file ('population', 'sir' or 'environment') for a run (default: latest)."""
+    if name is None:
+        name = latest_simulation_name(directory)
+    return os.path.join(directory, f'{name}_{kind}_history.json')
+
+
+def _remove_file(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class StreamedHistory:
+    """
+    A daily history kept in a JSON file instead of in memory (the memory-budget
+    mode, see memory_budget.py). Records are appended in batches of
+    STREAM_BUFFER_RECORDS, one per line, so the file is read back a record at a
+    time; it is still a plain JSON list once finished, loadable like any history.
+
+    Supports what the histories are used for: append, len, iteration, indexing
+    and slicing. Until save_to() moves it, the file is temporary and removed
+    when the object is.
+    """
+    def __init__(self, kind, records=(), directory=None):
+        handle, self.path = tempfile.mkstemp(prefix=f'typhoid_{kind}_', suffix='.json', dir=directory)
+        with os.fdopen(handle, 'w') as f:
+            f.write('[\n')
+        self._cleanup = weakref.finalize(self, _remove_file, self.path)
+        self._buffer = []
+        self._written = 0
+        self._finished = False
+        for record in records:
+            self.append(record)
+
+    def append(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= STREAM_BUFFER_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered records to the file."""
+        if not self._buffer:
+            return
+        if self._finished:
+            raise ValueError(f"'{self.path}' is already finished")
+        with open(self.path, 'a') as f:
+            for record in self._buffer:
+                f.write((',\n' if self._written else '') + json.dumps(record))
+                self._written += 1
+        self._buffer = []
+
+    def finish(self):
+        """Flushes the buffer and closes the JSON list; no records can be appended afterwards."""
+        if not self._finished:
+            self.flush()
+            with open(self.path, 'a') as f:
+                f.write('\n]\n')
+            self._finished = True
+
+    def save_to(self, path):
+        """Finishes the file and moves it to path (copies it when it was already saved elsewhere)."""
+        self.finish()
+        if os.path.abspath(path) == os.path.abspath(self.path):
+            return
+        if self._cleanup.alive:
+            shutil.move(self.path, path)
+            self._cleanup.detach()
+            self.path = path
+        else:
+            shutil.copyfile(self.path, path)
+
+    def nbytes_in_memory(self):
+        """Approximate bytes of the buffered records."""
+        return len(self._buffer) * record_bytes(self._buffer[-1]) if self._buffer else 0
+
+    def __len__(self):
+        return self._written + len(self._buffer)
+
+    def __iter__(self):
+        with open(self.path, 'r') as f:
+            for line in itertools.islice(f, 1, self._written + 1): # The first line is '['
+                yield json.loads(line.rstrip().rstrip(','))
+        yield from list(self._buffer)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= self._written and step > 0:
+                return self._buffer[start - self._written:stop - self._written:step]
+            if step < 0:
+                return list(self)[index]
+            return list(itertools.islice(iter(self), start, stop, step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        if index >= self._written:
+            return self._buffer[index - self._written]
+        return next(itertools.islice(iter(self), index, None))
+
+
+def record_bytes(record):
+    """Approximate memory of one history record: the dict and its values (the keys are shared)."""
+    return sys.getsizeof(record) + sum(sys.getsizeof(value) for value in record.values())
+
+
+class SimulationResult:
+    """
+    The outputs of one run in the shared schema.
+
+    population_history: yearly snapshots ('year', 'male_age_counts', 'female_age_counts',
+        'vaccinated_count' and the yearly aggregates).
+    sir_history: daily records with 'day', one count per DISEASE_STATES name and 'yll'.
+    environment_history: daily records with 'day' and the DAILY_ENVIRONMENT_VARIABLES.
+    metadata: engine name, duration and the parameters used for the run.
+    profile_history: yearly phase times and event counts of a profiled run (see
+        instrumentation.py), or None; saved as the 'profile' history when present.
+    memory_history: yearly memory accounting of the run (see memory_budget.py), or
+        None; saved as the 'memory' history when present.
+
+    The daily histories of a run in the memory-budget mode are StreamedHistory
+    objects rather than lists.
+    """
+    def __init__(self, name, population_history, sir_history, environment_history, metadata=None,
+                 profile_history=None, memory_history=None):
+        self.name = name
+        self.population_history = population_history
+        self.sir_history = sir_history
+        self.environment_history = environment_history
+        self.metadata = metadata or {}
+        self.profile_history = profile_history
+        self.memory_history = memory_history
+
+    def histories(self):
+        return {
+            'population': self.population_history,
+            'sir': self.sir_history,
+            'environment': self.environment_history,
+        }
+
+    def summary(self):
+        """Returns headline totals for the run: cumulative infections and acute cases, peak ACUTE and final population."""
+        return {
+            'cumulative_infections': sum(year.get('yearly_new_infections', 0) for year in self.population_history),
+            'cumulative_acute_cases': sum(year.get('num_acute_cases_yearly', 0) for year in self.population_history),
+            'peak_acute': max((day['ACUTE'] for day in self.sir_history), default=0),
+            'final_population': sum(value for key, value in self.sir_history[-1].items() if key not in ('day', 'yll')) if self.sir_history else 0,
+        }
+
+    def dalys(self, from_day=0):
+        """
+        Disability-adjusted life years lost after from_day: YLD from the person-days
+        spent in ACUTE, SUBCLINICAL and CHRONIC (DISABILITY_WEIGHTS) plus the YLL
+        the engine recorded (the compartmental engines record none).
+        """
+        days = [day for day in self.sir_history if day['day'] > from_day]
+        yld = sum(sum(day.get(state, 0) for day in days) / 365.0 * weight for state, weight in DISABILITY_WEIGHTS.items())
+        yll = sum(day.get('yll', 0) for day in days)
+        return yld + yll
+
+    def save(self, directory='.', update_latest=True, catalog=True):
+        """
+        Writes the history files (and a metadata file) using the standard naming,
+        and records the run in the run catalog (see run_catalog.py). If another
+        run with different parameters is catalogued under the same name, the
+        name gets a suffix (self.name is updated) instead of overwriting it.
+        """
+        if catalog:
+            from run_catalog import unique_name
+            self.name = unique_name(self.name, directory, self.metadata)
+        start = time.perf_counter()
+        for kind, history in self.histories().items():
+            path = history_path(kind, self.name, directory)
+            if isinstance(history, StreamedHistory):
+                history.save_to(path)
+            else:
+                with open(path, 'w') as f:
+                    json.dump(history, f, indent=4)
+            label = 'SIR' if kind == 'sir' else kind.capitalize()
+            print(f"{label} history saved to '{path}'")
+        if self.profile_history:
+            # The histories are written once, at the end of the last year
+            phase_seconds = self.profile_history[-1]['phase_seconds']
+            phase_seconds['json_output'] = phase_seconds.get('json_output', 0.0) + time.perf_counter() - start
+            path = history_path('profile', self.name, directory)
+            with open(path, 'w') as f:
+                json.dump(self.profile_history, f, indent=4)
+            print(f"Profile history saved to '{path}'")
+        if self.memory_history:
+            path = history_path('memory', self.name, directory)
+            with open(path, 'w') as f:
+                json.dump(self.memory_history, f, indent=4)
+            print(f"Memory history saved to '{path}'")
+        with open(os.path.join(directory, f'{self.name}_metadata.json'), 'w') as f:
+            json.dump(self.metadata, f, indent=4)
+        if update_latest:
+            with open(os.path.join(directory, LATEST_SIMULATION_FILE), 'w') as f:
+                f.write(self.name)
+        if catalog:
+            from run_catalog import record_run
+            record_run(self, directory)
+
+    @classmethod
+    def load(cls, name, directory='.'):
+        """Loads a result previously written by save(). The metadata, profile and memory files are optional."""
+        histories = {}
+        for kind in HISTORY_KINDS:
+            with open(history_path(kind, name, directory), 'r') as f:
+                histories[kind] = json.load(f)
+        metadata = {}
+        metadata_path = os.path.join(directory, f'{name}_metadata.json')
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'r') as f:
+                metadata = json.load(f)
+        optional = {}
+        for kind in ('profile', 'memory'):
+            path = history_path(kind, name, directory)
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    optional[kind] = json.load(f)
+        return cls(name, histories['population'], histories['sir'], histories['environment'], metadata,
+                   optional.get('profile'), optional.get('memory'))
@@ -0,0 +1,240 @@
+"""
+Catalog of saved runs, kept in a SQLite database.
+
+SimulationResult.save() records every run it writes: engine, the full
+parameter set, seed, vaccine settings, timings, headline outcomes and where
+its history files are. The parameters and outcomes are indexed columns, so
+past runs can be found by value ranges and loaded without recomputing:
+
+    rows = find_runs(engine='abm', k_half=(1e6, 1e8), initial_population=100000)
+    result = load_run(rows[0]['id'])
+
+Output names ({years}_{population}_{campaign}) do not include the transmission
+parameters, so save() asks unique_name() for the name to write under: a run
+whose name is already catalogued in the same directory with different
+parameters gets a suffix instead of overwriting the earlier files.
+Runs saved before the catalog existed can be added with import_runs().
+"""
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+CATALOG_PATH = 'run_catalog.sqlite'
+# Indexed columns: model parameters (see Engine.parameters), run settings and outcomes
+PARAMETER_COLUMNS = {
+    'initial_population': 'INTEGER',
+    'initial_infected_count': 'INTEGER',
+    'base_transmission_risk': 'REAL',
+    'k_half': 'REAL',
+    'environmental_shedding_rate': 'REAL',
+    'environmental_decay_rate': 'REAL',
+}
+VACCINE_COLUMNS = {
+    'vaccine_enabled': 'INTEGER',
+    'vaccine_start_year': 'INTEGER',
+    'vaccine_coverage': 'REAL',
+    'vaccine_efficacy': 'REAL',
+}
+RUN_COLUMNS = {
+    'engine': 'TEXT',
+    'duration_years': 'INTEGER',
+    'completed_years': 'INTEGER',
+    'seed': 'INTEGER',
+    'wall_time': 'REAL',
+    'compile_time': 'REAL',
+    'created_at': 'REAL',
+}
+OUTCOME_COLUMNS = {
+    'cumulative_infections': 'INTEGER',
+    'cumulative_acute_cases': 'INTEGER',
+    'peak_acute': 'INTEGER',
+    'final_population': 'INTEGER',
+    'dalys': 'REAL',
+}
+FILTER_COLUMNS = {**RUN_COLUMNS, **PARAMETER_COLUMNS, **VACCINE_COLUMNS, **OUTCOME_COLUMNS}
+
+
+def _connect(path=None):
+    connection = sqlite3.connect(path or CATALOG_PATH, timeout=30) # Job workers write concurrently
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    columns = ", ".join(f"{name} {kind}" for name, kind in FILTER_COLUMNS.items())
+    connection.execute(f"""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            directory TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            {columns},
+            metadata TEXT,
+            UNIQUE (directory, name)
+        )""")
+    for name in FILTER_COLUMNS:
+        connection.execute(f"CREATE INDEX IF NOT EXISTS runs_{name} ON runs ({name})")
+    return connection
+
+
+def fingerprint(metadata):
+    """Hash of what determines a run's output: engine, duration, parameters, seed and vaccine settings."""
+    key = {name: metadata.get(name) for name in ('engine', 'duration_years', 'parameters', 'seed', 'vaccine')}
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def unique_name(name, directory='.', metadata=None, catalog=None):
+    """
+    The name a run should be saved under: name itself, unless a run with a
+    different fingerprint is already catalogued under it in directory.
+    """
+    digest = fingerprint(metadata or {})
+    with _connect(catalog) as connection:
+        row = connection.execute("SELECT fingerprint FROM runs WHERE directory = ? AND name = ?",
+                                 (os.path.abspath(directory), name)).fetchone()
+    connection.close()
+    if row is None or row['fingerprint'] == digest:
+        return name
+    return f"{name}_{digest[:8]}"
+
+
+def record_run(result, directory='.', catalog=None):
+    """
+    Adds (or updates) a saved run's entry.
+
+    Returns:
+        int: The run's catalog id.
+    """
+    metadata = result.metadata
+    parameters = metadata.get('parameters', {})
+    vaccine = metadata.get('vaccine', {})
+    summary = result.summary()
+    values = {
+        'engine': metadata.get('engine'),
+        'duration_years': metadata.get('duration_years'),
+        'completed_years': metadata.get('completed_years', metadata.get('duration_years')),
+        'seed': metadata.get('seed'),
+        'wall_time': metadata.get('wall_time'),
+        'compile_time': metadata.get('compile_time'),
+        'created_at': time.time(),
+        **{name: parameters.get(name) for name in PARAMETER_COLUMNS},
+        'vaccine_enabled': vaccine.get('is_enabled'),
+        'vaccine_start_year': vaccine.get('start_year'),
+        'vaccine_coverage': vaccine.get('coverage'),
+        'vaccine_efficacy': vaccine.get('efficacy'),
+        **{name: summary[name] for name in OUTCOME_COLUMNS if name in summary},
+        'dalys': result.dalys(),
+    }
+    row = dict(values, name=result.name, directory=os.path.abspath(directory),
+               fingerprint=fingerprint(metadata), metadata=json.dumps(metadata, default=str))
+    updates = ", ".join(f"{name} = excluded.{name}" for name in row if name not in ('name', 'directory'))
+    with _connect(catalog) as connection:
+        # A re-saved run keeps its id
+        connection.execute(
+            f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))}) "
+            f"ON CONFLICT (directory, name) DO UPDATE SET {updates}",
+            tuple(row.values())
+        )
+        run_id = connection.execute("SELECT id FROM runs WHERE directory = ? AND name = ?",
+                                    (row['directory'], row['name'])).fetchone()['id']
+    connection.close()
+    return run_id
+
+
+def find_runs(catalog=None, limit=None, **filters):
+    """
+    Catalogued runs matching every filter, newest first.
+
+    Args:
+        catalog (str): Catalog database (default: CATALOG_PATH).
+        limit (int): Maximum number of runs to return.
+        **filters: Column name (see FILTER_COLUMNS) = a value, or a (low, high)
+            range where either bound may be None.
+
+    Returns:
+        list: One dict per run with the catalog columns and the decoded 'metadata'.
+    """
+    clauses, arguments = [], []
+    for name, value in filters.items():
+        if name not in FILTER_COLUMNS:
+            raise ValueError(f"Unknown catalog column '{name}'. Choose from: {', '.join(FILTER_COLUMNS)}")
+        if isinstance(value, (tuple, list)):
+            low, high = value
+            if low is not None:
+                clauses.append(f"{name} >= ?")
+                arguments.append(low)
+            if high is not None:
+                clauses.append(f"{name} <= ?")
+                arguments.append(high)
+        else:
+            clauses.append(f"{name} = ?")
+            arguments.append(value)
+    query = "SELECT * FROM runs"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    connection = _connect(catalog)
+    try:
+        rows = [dict(row) for row in connection.execute(query, arguments)]
+    finally:
+        connection.close()
+    for row in rows:
+        row['metadata'] = json.loads(row['metadata']) if row['metadata'] else {}
+    return rows
+
+
+def get_run(run_id, catalog=None):
+    """Returns a run's catalog entry (as find_runs does), or None for an unknown id."""
+    connection = _connect(catalog)
+    try:
+        row = connection.execute("SELECT * FROM runs WHERE id = ?", (int(run_id),)).fetchone()
+    finally:
+        connection.close()
+    if row is None:
+        return None
+    row = dict(row)
+    row['metadata'] = json.loads(row['metadata']) if row['metadata'] else {}
+    return row
+
+
+def load_run(run_id, catalog=None):
+    """
+    Loads a catalogued run's histories.
+
+    Returns:
+        SimulationResult: The saved result.
+
+    Raises:
+        KeyError: If run_id is not in the catalog.
+    """
+    from results import SimulationResult
+
+    row = get_run(run_id, catalog)
+    if row is None:
+        raise KeyError(f"No run {run_id} in the catalog")
+    return SimulationResult.load(row['name'], row['directory'])
+
+
+def import_runs(directory='.', catalog=None):
+    """
+    Catalogs the runs already saved in a directory (those with a metadata file).
+
+    Returns:
+        int: The number of runs added or updated.
+    """
+    from results import SimulationResult
+
+    count = 0
+    for path in sorted(glob.glob(os.path.join(directory, '*_metadata.json'))):
+        name = os.path.basename(path)[:-len('_metadata.json')]
+        try:
+            result = SimulationResult.load(name, directory)
+        except (OSError, ValueError) as e:
+            print(f"Skipping '{name}': {e}")
+            continue
+        record_run(result, directory, catalog)
+        count += 1
+    print(f"Cataloged {count} run(s) from '{directory}'")
+    return count
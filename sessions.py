@@ -0,0 +1,290 @@
+"""
+Interactive simulation sessions for the web app.
+
+A session keeps one live engine (by default the agent-based Model) in its own
+worker process and advances it on request, so stepping a large population
+costs only the days simulated, never a re-initialization or a full rerun:
+
+    manager = SessionManager()
+    manager.reset('default', 'abm', {'initial_population': 1000000})
+    manager.step('default', days=7)   # counts after day 7 and the changes since the last call
+    manager.state('default')
+
+Only summaries cross the process boundary: the disease state counts and their
+change since the previous request, the daily records of the days just
+simulated, the latest environment variables and a population summary (total
+and age pyramid). A population snapshot is also kept at every year boundary
+(as Simulation records them) so a session's history can be replayed by year.
+"""
+import datetime
+import multiprocessing
+import threading
+import time
+import uuid
+
+START_DATE = datetime.date(2020, 1, 1) # Calendar date of simulated day 0
+DEFAULT_SESSION_POPULATION = 100000
+MAX_SESSIONS = 4
+SESSION_IDLE_TIMEOUT = 1800 # Seconds after which an unused session may be closed
+MAX_STEP_DAYS = 365 * 100
+
+
+class SessionLimitError(Exception):
+    """Raised when a new session is requested while MAX_SESSIONS are busy."""
+
+
+def simulated_date(day):
+    """Calendar date (ISO format) of a simulated day."""
+    return (START_DATE + datetime.timedelta(days=int(day))).isoformat()
+
+
+class _LiveSimulation:
+    """The engine and bookkeeping held by a session's worker process."""
+
+    def __init__(self, engine_name, params, vaccine):
+        import initialparaandconst
+        from engine import make_engine
+        from simulation import Simulation
+        from jobs import VACCINE_SETTINGS
+
+        # Vaccine settings are process-wide; this process serves only this session, and
+        # _session_loop restores the defaults before each reset
+        for name, value in (vaccine or {}).items():
+            if name in VACCINE_SETTINGS:
+                setattr(initialparaandconst.Vaccine, name, value)
+        self.simulation = Simulation(make_engine(engine_name, **params))
+        self.engine = self.simulation.engine
+        self.engine.initialize()
+        self.engine.warm_up()
+        self.day = 0
+        self.yearly_aggregates = None
+        self.last_counts = self.engine.state_counts()
+        self._record_snapshot(0, self._empty_aggregates())
+
+    def _record_snapshot(self, year, aggregates):
+        """Records the yearly population snapshot, with the total population (the compartmental engines have no pyramid)."""
+        self.simulation._record_population_snapshot(year, aggregates)
+        self.simulation.population_history[-1]['total_population'] = self.engine.total_population()
+
+    def _empty_aggregates(self):
+        from reporting_config import YEARLY_SUMMARY_VARIABLES
+        aggregates = {var: 0 for var in YEARLY_SUMMARY_VARIABLES}
+        aggregates.update({'newborn_males': 0, 'newborn_females': 0, 'male_deaths': 0, 'female_deaths': 0})
+        return aggregates
+
+    def advance(self, days):
+        """
+        Simulates the next days, running each year's vaccination campaign and
+        recording a population snapshot at each year boundary.
+
+        Returns:
+            dict: The session summary (see summary()) for the days just simulated.
+        """
+        first_record = len(self.simulation.sir_history)
+        first_snapshot = len(self.simulation.population_history)
+        for _ in range(days):
+            if self.day % 365 == 0:
+                self.engine.vaccinate(self.day // 365 + 1)
+                self.yearly_aggregates = self._empty_aggregates()
+            daily_results = self.engine.step(self.day + 1)
+            self.day += 1
+            for key in self.yearly_aggregates:
+                if key in daily_results:
+                    self.yearly_aggregates[key] += daily_results[key]
+            self.simulation._record_daily(self.day, daily_results)
+            if self.day % 365 == 0:
+                self._record_snapshot(self.day // 365, self.yearly_aggregates)
+        summary = self.summary(self.simulation.sir_history[first_record:], self.simulation.population_history[first_snapshot:])
+        # Only the newest day is needed to continue; the web process keeps what it needs
+        del self.simulation.sir_history[:-1]
+        del self.simulation.environment_history[:-1]
+        return summary
+
+    def summary(self, daily=(), snapshots=()):
+        counts = self.engine.state_counts()
+        changes = {name: counts[name] - self.last_counts[name] for name in counts}
+        self.last_counts = counts
+        environment = {key: float(value) for key, value in self.engine.environment().items()}
+        return {
+            'engine': self.engine.name,
+            'day': self.day,
+            'year': self.day // 365,
+            'date': simulated_date(self.day),
+            'population': self.engine.total_population(),
+            'state_counts': counts,
+            'changes': changes,
+            'environment': environment,
+            'snapshot': self.engine.population_snapshot(),
+            'daily': list(daily),
+            'yearly_snapshots': list(snapshots),
+        }
+
+
+def _session_loop(connection):
+    """Body of a session's worker process: apply commands until None or the pipe closes."""
+    import initialparaandconst
+    from jobs import VACCINE_SETTINGS
+
+    vaccine_defaults = {name: getattr(initialparaandconst.Vaccine, name) for name in VACCINE_SETTINGS}
+    live = None
+    while True:
+        try:
+            command = connection.recv()
+        except EOFError:
+            break
+        if command is None:
+            break
+        kind, args = command
+        try:
+            if kind == 'reset':
+                # A reset starts from the default vaccine settings, not the previous session's
+                for name, value in vaccine_defaults.items():
+                    setattr(initialparaandconst.Vaccine, name, value)
+                live = _LiveSimulation(*args)
+                reply = live.summary(snapshots=live.simulation.population_history)
+            elif live is None:
+                raise RuntimeError("The session has not been reset yet")
+            elif kind == 'step':
+                reply = live.advance(*args)
+            else:
+                reply = live.summary()
+            connection.send(('ok', reply))
+        except Exception as e:
+            connection.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class Session:
+    """
+    One interactive session: a worker process holding a live engine, and the
+    yearly population snapshots it has recorded so far.
+    """
+
+    def __init__(self, session_id, context):
+        self.id = session_id
+        self.connection, worker_end = context.Pipe()
+        self.process = context.Process(target=_session_loop, args=(worker_end,), daemon=True)
+        self.process.start()
+        worker_end.close()
+        self.lock = threading.Lock() # One command at a time per session
+        self.snapshots = []
+        self.last_used = time.time()
+        self.is_reset = False
+
+    def command(self, kind, *args):
+        """
+        Sends a command to the worker and waits for its reply.
+
+        Returns:
+            dict: The session summary.
+
+        Raises:
+            RuntimeError: If the worker reports an error.
+        """
+        with self.lock:
+            self.last_used = time.time()
+            self.connection.send((kind, args))
+            status, reply = self.connection.recv()
+            if status != 'ok':
+                raise RuntimeError(reply)
+            if kind == 'reset':
+                self.snapshots = []
+                self.is_reset = True
+            self.snapshots.extend(reply['yearly_snapshots'])
+            self.last_used = time.time()
+            return reply
+
+    def close(self):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class SessionManager:
+    """
+    Table of interactive sessions, each with its own worker process.
+
+    Args:
+        max_sessions (int): Sessions that may be open at once; idle ones are closed to make room.
+        default_params (dict): Model parameters of a session used before its first reset.
+    """
+
+    def __init__(self, max_sessions=None, default_params=None):
+        self.max_sessions = max_sessions if max_sessions is not None else MAX_SESSIONS
+        self.default_params = default_params if default_params is not None else {'initial_population': DEFAULT_SESSION_POPULATION}
+        self.context = multiprocessing.get_context('spawn') # Workers must not inherit the web server's threads
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _session(self, session_id, reset=True):
+        """
+        Returns the session, opening it (and closing idle ones if at capacity) if needed.
+        Unless reset is False, a session that has not been reset yet is reset with default_params.
+        """
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                if len(self.sessions) >= self.max_sessions:
+                    idle = [s for s in self.sessions.values() if time.time() - s.last_used > SESSION_IDLE_TIMEOUT]
+                    if not idle:
+                        raise SessionLimitError("Too many interactive sessions are open; try again later")
+                    oldest = min(idle, key=lambda s: s.last_used)
+                    del self.sessions[oldest.id]
+                    oldest.close()
+                session = Session(session_id or uuid.uuid4().hex[:12], self.context)
+                self.sessions[session.id] = session
+        if reset and not session.is_reset:
+            self._command(session, 'reset', 'abm', self.default_params, None)
+        return session
+
+    def _command(self, session, kind, *args):
+        """
+        Sends a command to a session. A session whose worker has died (EOFError or
+        BrokenPipeError on its pipe) is dropped before the error is raised again.
+        """
+        try:
+            return session.command(kind, *args)
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            with self.lock:
+                if self.sessions.get(session.id) is session:
+                    del self.sessions[session.id]
+            session.close()
+            raise
+
+    def reset(self, session_id, engine_name='abm', params=None, vaccine=None):
+        """Re-initializes a session's model at day 0 with the given engine and parameters."""
+        session = self._session(session_id, reset=False)
+        return dict(self._command(session, 'reset', engine_name, params if params is not None else self.default_params, vaccine),
+                    session_id=session.id)
+
+    def step(self, session_id, days=1):
+        """Advances a session's model by days days."""
+        if not 1 <= days <= MAX_STEP_DAYS:
+            raise ValueError(f"days must be between 1 and {MAX_STEP_DAYS}")
+        session = self._session(session_id)
+        return dict(self._command(session, 'step', int(days)), session_id=session.id)
+
+    def state(self, session_id):
+        """The current summary of a session's model (with no daily records)."""
+        session = self._session(session_id)
+        return dict(self._command(session, 'state'), session_id=session.id)
+
+    def snapshots(self, session_id):
+        """The yearly population snapshots a session has recorded since its last reset."""
+        return list(self._session(session_id).snapshots)
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def shutdown(self):
+        with self.lock:
+            sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            session.close()
+
@@ -1,43 +1,77 @@
-import numpy as np
 import time
-from model import MALE, FEMALE# Import gender constants
-from tqdm import tqdm # Optional: for a progress bar
-import json # For saving population history
-from initialparaandconst import PYRAMID_AGE_BINS, PYRAMID_AGE_LABELS, DISEASE_STATES, VACCINATED, INITIAL_POPULATION, SIMULATION_YEARS
+from engine import as_engine
+from results import SimulationResult, StreamedHistory
+from initialparaandconst import DISEASE_STATES, Vaccine
+from model import current_seed
+from instrumentation import Profiler
+from memory_budget import MemoryBudget
 
 from reporting_config import DAILY_ENVIRONMENT_VARIABLES, YEARLY_SUMMARY_VARIABLES
 
 class Simulation:
     def __init__(self, model):
-        self.model = model
+        # Accept a bare Model/CompartmentalModel or any engine from engine.py
+        self.engine = as_engine(model)
+        self.model = self.engine.model
         self.population_history = [] # Initialize list to store yearly age distributions
         self.sir_history = [] # Initialize list to store daily SIR counts
         self.environment_history = [] # Initialize list to store daily environmental contagion
 
-    def run(self, duration_years):
+    def run(self, duration_years, save=True, started_at=None, stop_condition=None, progress=None, profile=False,
+            memory_budget=None, track_memory=False):
         """
         Runs the simulation for a specified number of years.
+
+        Args:
+            duration_years (int): Number of years to simulate.
+            save (bool): Whether to write the history files.
+            started_at (float): time.perf_counter() value taken when the process started.
+                Used to report the interpreter-to-first-step latency; defaults to the
+                moment run() is called.
+            stop_condition (callable): Called with (year, population_history) after each
+                year; the run ends early when it returns True (e.g. a calibration
+                candidate that can no longer fit its target).
+            progress (callable): Called with (day, year, simulation) after each simulated
+                day, e.g. to stream the histories recorded so far.
+            profile (bool): Whether to time the phases of every day and count events per
+                year (see instrumentation.py); the records are the result's profile_history.
+            memory_budget (int): Bytes the process may use; the run streams its histories,
+                narrows its agent arrays and compacts sooner as needed to stay under it
+                (see memory_budget.py). None for no limit.
+            track_memory (bool): Whether to record the yearly memory accounting without a
+                budget (always recorded with one); the records are the result's memory_history.
+
+        Returns:
+            SimulationResult: The recorded histories in the shared result schema.
         """
+        from tqdm import tqdm # Optional: for a progress bar (imported here to keep module import light)
+        if started_at is None:
+            started_at = time.perf_counter()
+        first_step_latency = None
+        profiler = Profiler() if profile else None
+        model_times_step = self.engine.set_profiler(profiler) if profile else False
+        memory = MemoryBudget(memory_budget) if memory_budget is not None or track_memory else None
+        if profiler is not None:
+            phase_start = time.perf_counter()
+
         print("Initializing population...")
-        self.model.initialize_population()
-        print(f"Initial population: {np.sum(self.model.is_alive)}")
+        self.engine.initialize()
+        if profiler is not None:
+            profiler.lap('initialize', phase_start)
+        print(f"Initial population: {self.engine.total_population()}")
+
+        if memory is not None:
+            # Before warm-up, which compiles the kernels for the agent arrays' dtypes
+            memory.check(self, 0, duration_years)
 
         duration_days = duration_years * 365
         print(f"Running simulation for {duration_years} years ({duration_days} days)...")
 
-        # The first call to a numba-jitted function includes a one-time compilation cost.
-        # We can do a "warm-up" run to get this out of the way before the main loop.
-        print("Compiling JIT function (one-time cost)...")
-        start_time = time.time()
-        # Perform a dummy step to trigger JIT compilation if population is empty
-        if np.sum(self.model.is_alive) == 0:
-            self.model.add_agents(1) # Add a temporary agent for warm-up
-        self.model.step(0) # Pass a dummy day
-        if np.sum(self.model.is_alive) == 1 and self.model.age_days[-1] == 0: # Remove temporary agent if added for warm-up
-            self.model.is_alive = self.model.is_alive[:-1]
-            self.model.age_days = self.model.age_days[:-1]
-        end_time = time.time()
-        print(f"JIT compilation took: {end_time - start_time:.4f} seconds.")
+        # Compile (or load cached) kernels up front so compile time is reported
+        # separately from simulation time.
+        print("Compiling JIT functions (one-time cost)...")
+        compile_time = self.engine.warm_up()
+        print(f"JIT compilation took: {compile_time:.4f} seconds.")
         
         # Record initial state (Year 0) with a correctly structured dictionary
         initial_aggregates = {var: 0 for var in YEARLY_SUMMARY_VARIABLES}
@@ -46,15 +80,24 @@ class Simulation:
             'male_deaths': 0, 'female_deaths': 0,
             'disease_male_deaths': 0, 'disease_female_deaths': 0
         })
+        if profiler is not None:
+            phase_start = time.perf_counter()
         self._record_population_snapshot(0, initial_aggregates)
+        if profiler is not None:
+            profiler.lap('snapshot', phase_start)
+            profiler.end_year() # Year 0: initialization and the initial snapshot
 
-
+        start_time = time.perf_counter()
         current_day = 0
+        completed_years = duration_years
         # Run the main simulation loop by year
         for year in tqdm(range(1, duration_years + 1), desc="Simulating Years"):
             # --- Annual Vaccination Campaign ---
-            self.model.vaccinate(year)
-            self.model.num_new_infections=0
+            if profiler is not None:
+                phase_start = time.perf_counter()
+            self.engine.vaccinate(year)
+            if profiler is not None:
+                phase_start = profiler.lap('vaccination', phase_start)
             # Initialize yearly aggregate counters dynamically
             yearly_aggregates = {var: 0 for var in YEARLY_SUMMARY_VARIABLES}
             yearly_aggregates.update({
@@ -62,87 +105,121 @@ class Simulation:
                 'male_deaths': 0, 'female_deaths': 0
             })
             
-            for day in range(365):
+            # Engines may compute the whole year in one call and hand the days back one by one
+            for daily_results in self.engine.advance(current_day, 365):
                 current_day += 1
-                daily_results = self.model.step(current_day)
+                if profiler is not None:
+                    profiler.days += 1
+                    phase_start = profiler.lap('step', phase_start) if not model_times_step else time.perf_counter()
+                if first_step_latency is None:
+                    first_step_latency = time.perf_counter() - started_at
+                    print(f"Time to first simulated day: {first_step_latency:.4f} seconds.")
                 
                 # Aggregate yearly totals
                 for key in yearly_aggregates:
                     if key in daily_results:
                         yearly_aggregates[key] += daily_results[key]
 
-                # Record daily disease state data dynamically
-                daily_record = {'day': current_day}
-                for i, state_name in DISEASE_STATES.items():
-                    daily_record[state_name] = int(daily_results['state_counts'][i])
-                
-                # Add YLL if present
-                if 'yll' in daily_results:
-                    daily_record['yll'] = float(daily_results['yll'])
-                
-                self.sir_history.append(daily_record)
-                
-                # Record daily environmental data
-                env_record = {'day': current_day}
-                for var in DAILY_ENVIRONMENT_VARIABLES:
-                    if var in daily_results:
-                        env_record[var] = daily_results[var]
-                self.environment_history.append(env_record)
+                self._record_daily(current_day, daily_results)
+                if profiler is not None:
+                    phase_start = profiler.lap('history', phase_start)
+                if progress is not None:
+                    progress(current_day, year, self)
+                    if profiler is not None:
+                        phase_start = profiler.lap('progress', phase_start)
 
             
             # Log statistics and record snapshot at the end of each year
             total_births = yearly_aggregates['newborn_males'] + yearly_aggregates['newborn_females']
             total_deaths = yearly_aggregates['male_deaths'] + yearly_aggregates['female_deaths'] + yearly_aggregates.get('disease_male_deaths', 0) + yearly_aggregates.get('disease_female_deaths', 0)
-            print(f"\nYear {year}: Population = {np.sum(self.model.is_alive)}, Births = {total_births}, Deaths = {total_deaths}")
+            print(f"\nYear {year}: Population = {self.engine.total_population()}, Births = {total_births}, Deaths = {total_deaths}")
+            if profiler is not None:
+                phase_start = time.perf_counter()
             self._record_population_snapshot(year, yearly_aggregates)
+            if profiler is not None:
+                profiler.lap('snapshot', phase_start)
+                self._count_yearly_events(profiler, yearly_aggregates)
+                profiler.end_year()
+            if memory is not None:
+                memory.check(self, year, duration_years)
+            if stop_condition is not None and stop_condition(year, self.population_history):
+                print(f"Stopping early after year {year}.")
+                completed_years = year
+                break
 
         # Get the final count of living agents
-        final_population = np.sum(self.model.is_alive)
+        final_population = self.engine.total_population()
+        if profiler is not None:
+            self.engine.set_profiler(None)
+        simulation_time = time.perf_counter() - start_time
         print(f"\nSimulation finished.")
         print(f"Final population: {final_population}")
-        fname=f"{SIMULATION_YEARS}_{INITIAL_POPULATION}_{self.model.vaccine_campaign_name}"
-        # Save the population history to a JSON file for demographic visualization
-        with open(f'{fname}_population_history.json', 'w') as f: 
-            json.dump(self.population_history, f, indent=4)
-        print("Population history saved to 'population_history.json'")
-
-        # Save the SIR history to a JSON file for disease visualization
-        with open(f'{fname}_sir_history.json', 'w') as f:
-            json.dump(self.sir_history, f, indent=4)
-        print("SIR history saved to 'sir_history.json'")
-
-        # Save the environment history to a JSON file for visualization
-        with open(f'{fname}_environment_history.json', 'w') as f:
-            json.dump(self.environment_history, f, indent=4)
-        print("Environment history saved to 'environment_history.json'")
-        with open('latest_simulation_name.txt', 'w') as f:
-            f.write(fname)
+        print(f"Compile time: {compile_time:.4f} s, simulation time: {simulation_time:.4f} s")
+
+        result = SimulationResult(
+            self.engine.output_name(duration_years),
+            self.population_history,
+            self.sir_history,
+            self.environment_history,
+            metadata={
+                'engine': self.engine.name,
+                'duration_years': duration_years,
+                'completed_years': completed_years,
+                'parameters': self.engine.parameters(),
+                'compile_time': compile_time,
+                'wall_time': simulation_time,
+                'first_step_latency': first_step_latency,
+                'seed': current_seed(),
+                'vaccine': {name: getattr(Vaccine, name) for name in ('is_enabled', 'start_year', 'coverage', 'efficacy')},
+            },
+            profile_history=profiler.records if profiler is not None else None,
+            memory_history=memory.records if memory is not None else None
+        )
+        if memory is not None:
+            result.metadata['memory_budget'] = memory_budget
+            result.metadata['memory_measures'] = list(memory.active)
+        if save:
+            result.save()
+        return result
+
+    def _record_daily(self, current_day, daily_results):
+        """Appends one day of disease state and environment data to the histories."""
+        # Record daily disease state data dynamically
+        daily_record = {'day': current_day}
+        for i, state_name in DISEASE_STATES.items():
+            # Whole people for the ABM, fractional compartments for the ODE engines
+            daily_record[state_name] = daily_results['state_counts'][i].item()
+        daily_record['yll'] = float(daily_results.get('yll', 0.0))
+        self.sir_history.append(daily_record)
+        
+        # Record daily environmental data
+        env_record = {'day': current_day}
+        for var in DAILY_ENVIRONMENT_VARIABLES:
+            if var in daily_results:
+                env_record[var] = daily_results[var]
+        self.environment_history.append(env_record)
+
+    def stream_histories(self):
+        """Moves the daily histories to files, where the later days are appended too (see results.StreamedHistory)."""
+        if not isinstance(self.sir_history, StreamedHistory):
+            self.sir_history = StreamedHistory('sir', self.sir_history)
+            self.environment_history = StreamedHistory('environment', self.environment_history)
+
+    @staticmethod
+    def _count_yearly_events(profiler, yearly_aggregates):
+        """Adds the year's births, deaths, infections and acute cases to the profiler's counters."""
+        profiler.count('births', yearly_aggregates['newborn_males'] + yearly_aggregates['newborn_females'])
+        profiler.count('deaths', yearly_aggregates['male_deaths'] + yearly_aggregates['female_deaths'])
+        profiler.count('disease_deaths', yearly_aggregates.get('disease_male_deaths', 0) + yearly_aggregates.get('disease_female_deaths', 0))
+        profiler.count('new_infections', yearly_aggregates.get('yearly_new_infections', 0))
+        profiler.count('acute_cases', yearly_aggregates.get('num_acute_cases_yearly', 0))
 
     def _record_population_snapshot(self, year, yearly_aggregates):
         """Records the current age distribution of the alive population."""
-        alive_mask = self.model.is_alive
-        alive_ages_days = self.model.age_days[alive_mask]
-        alive_genders = self.model.gender[alive_mask]
-        alive_ages_years = alive_ages_days // 365
-
-        # Create masks for males and females
-        male_mask = (alive_genders == MALE)
-        female_mask = (alive_genders == FEMALE)
-
-        # Use np.histogram to bin ages for each gender
-        male_hist, _ = np.histogram(alive_ages_years[male_mask], bins=PYRAMID_AGE_BINS)
-        female_hist, _ = np.histogram(alive_ages_years[female_mask], bins=PYRAMID_AGE_BINS)
-        vaccinated_count = np.sum(self.model.disease_state[alive_mask] == VACCINATED)
-        
-        # Store the distribution
-        snapshot = {
-            'year': year,
-            'male_age_counts': male_hist.tolist(),
-            'female_age_counts': female_hist.tolist(),
-            'vaccinated_count': int(vaccinated_count)
-        }
+        snapshot = {'year': year}
+        snapshot.update(self.engine.population_snapshot())
         # Add all aggregated yearly values, converting to standard Python int
         for key, value in yearly_aggregates.items():
             snapshot[key] = int(value)
             
-        self.population_history.append(snapshot)
\ No newline at end of file
+        self.population_history.append(snapshot)
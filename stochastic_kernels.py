@@ -0,0 +1,244 @@
+"""
+Numba-compiled kernels for the StochasticCompartmentalModel.
+
+The compartments hold whole numbers of people and change through the same
+flows as ode_kernels.ode_rhs, each flow being a random event. Two modes:
+
+- MODE_GILLESPIE: the exact stochastic simulation algorithm (direct method),
+  one event at a time. Cost grows with the population; meant for small N.
+- MODE_TAU_LEAP: binomial tau-leaping. People leave each compartment with a
+  binomial draw over the leap and are split between its outflows, which keeps
+  every compartment non-negative. Births are Poisson.
+
+The environmental contagion stays a continuous quantity and follows
+dE/dt = shedding - decay * E exactly between events (or over each leap).
+States and daily outputs use the ode_kernels layouts so the model reuses the
+CompartmentalModel reporting.
+"""
+import numpy as np
+from numba import jit, prange
+from ode_kernels import (
+    Y_S, Y_M, Y_P, Y_A, Y_U, Y_C, Y_R, Y_V, Y_CUM_INF, Y_CUM_ACUTE, Y_E,
+    NUM_STATE, NUM_COMPARTMENTS, NUM_OUTPUTS,
+    PAR_BASE_RISK, PAR_K_HALF, PAR_SHEDDING_RATE, PAR_DECAY_RATE, PAR_ENABLE_ENV,
+    PAR_TRANSMISSION_RATE, PAR_BIRTH_RATE, PAR_DEATH_RATE, PAR_ACUTE_MORTALITY,
+    PAR_MATERNAL_LOSS, PAR_PREPATENT_EXIT, PAR_ACUTE_EXIT, PAR_SUBCLINICAL_EXIT,
+    PAR_RECOVERY_LOSS, PAR_VACCINE_LOSS, PAR_P_TO_A, PAR_A_TO_C, PAR_U_TO_C,
+    seasonality_multiplier, daily_outputs
+)
+
+MODE_GILLESPIE = 0
+MODE_TAU_LEAP = 1
+
+# --- Events ---
+# Event 0 is a birth into M; every other event moves one person out of
+# EVENT_SOURCE into EVENT_TARGET (-1: the person dies).
+NUM_EVENTS = 21
+EV_BIRTH = 0
+EV_DEATH = 1 # Events 1-8: background death of compartment 0-7
+EV_ACUTE_DEATH = 9
+(EV_M_TO_S, EV_S_TO_P, EV_V_TO_P, EV_P_TO_A, EV_P_TO_U, EV_A_TO_C, EV_A_TO_R,
+ EV_U_TO_C, EV_U_TO_R, EV_R_TO_S, EV_V_TO_S) = range(10, 21)
+
+EVENT_SOURCE = np.array([-1, Y_S, Y_M, Y_P, Y_A, Y_U, Y_C, Y_R, Y_V, Y_A,
+                         Y_M, Y_S, Y_V, Y_P, Y_P, Y_A, Y_A, Y_U, Y_U, Y_R, Y_V], dtype=np.int64)
+EVENT_TARGET = np.array([Y_M, -1, -1, -1, -1, -1, -1, -1, -1, -1,
+                         Y_S, Y_P, Y_P, Y_A, Y_U, Y_C, Y_R, Y_C, Y_R, Y_S, Y_S], dtype=np.int64)
+
+
+@jit(nopython=True, cache=True)
+def infection_pressure(t, x, environmental_contagion, params):
+    """Force of infection for integer compartments x, as in ode_kernels.ode_rhs."""
+    if params[PAR_ENABLE_ENV] > 0.0:
+        hazard_factor = 0.0
+        if environmental_contagion > 0.0:
+            hazard_factor = environmental_contagion / (params[PAR_K_HALF] + environmental_contagion)
+        return params[PAR_BASE_RISK] * hazard_factor * seasonality_multiplier(t, params)
+    total_pop = 0.0
+    for i in range(NUM_COMPARTMENTS):
+        total_pop += x[i]
+    if total_pop <= 0.0:
+        return 0.0
+    return (x[Y_P] + x[Y_A] + x[Y_U] + x[Y_C]) * 0.8 / total_pop * params[PAR_TRANSMISSION_RATE]
+
+
+@jit(nopython=True, cache=True)
+def event_rates(t, x, environmental_contagion, params, rates):
+    """
+    Fills rates with the per-person rate of every event (the total rate for births).
+    Multiplying by the source compartment gives the propensity.
+    """
+    pressure = infection_pressure(t, x, environmental_contagion, params)
+    total_pop = 0.0
+    for i in range(NUM_COMPARTMENTS):
+        total_pop += x[i]
+    prepatent_exit = params[PAR_PREPATENT_EXIT]
+    acute_exit = params[PAR_ACUTE_EXIT]
+    subclinical_exit = params[PAR_SUBCLINICAL_EXIT]
+
+    rates[EV_BIRTH] = total_pop * 0.5 * params[PAR_BIRTH_RATE]
+    for i in range(NUM_COMPARTMENTS):
+        rates[EV_DEATH + i] = params[PAR_DEATH_RATE]
+    rates[EV_ACUTE_DEATH] = params[PAR_ACUTE_MORTALITY]
+    rates[EV_M_TO_S] = params[PAR_MATERNAL_LOSS]
+    rates[EV_S_TO_P] = pressure
+    rates[EV_V_TO_P] = 0.05 * pressure * 0.1
+    rates[EV_P_TO_A] = prepatent_exit * params[PAR_P_TO_A]
+    rates[EV_P_TO_U] = prepatent_exit * (1.0 - params[PAR_P_TO_A])
+    rates[EV_A_TO_C] = acute_exit * params[PAR_A_TO_C]
+    rates[EV_A_TO_R] = acute_exit * (1.0 - params[PAR_A_TO_C])
+    rates[EV_U_TO_C] = subclinical_exit * params[PAR_U_TO_C]
+    rates[EV_U_TO_R] = subclinical_exit * (1.0 - params[PAR_U_TO_C])
+    rates[EV_R_TO_S] = params[PAR_RECOVERY_LOSS]
+    rates[EV_V_TO_S] = params[PAR_VACCINE_LOSS]
+
+
+@jit(nopython=True, cache=True)
+def _apply_event(x, event, count):
+    """Applies count occurrences of an event, including the cumulative counters."""
+    source = EVENT_SOURCE[event]
+    target = EVENT_TARGET[event]
+    if source >= 0:
+        x[source] -= count
+    if target >= 0:
+        x[target] += count
+    if event == EV_S_TO_P or event == EV_V_TO_P:
+        x[Y_CUM_INF] += count
+    elif event == EV_P_TO_A:
+        x[Y_CUM_ACUTE] += count
+
+
+@jit(nopython=True, cache=True)
+def _decay_environment(environmental_contagion, x, dt, params):
+    """Exact solution of dE/dt = shedding - decay * E over dt with the shedders fixed."""
+    if params[PAR_ENABLE_ENV] == 0.0:
+        return environmental_contagion
+    decay = params[PAR_DECAY_RATE]
+    shedding = (x[Y_P] + x[Y_A] + x[Y_U] + x[Y_C]) * 0.8 * params[PAR_SHEDDING_RATE]
+    factor = np.exp(-decay * dt)
+    return environmental_contagion * factor + shedding / decay * (1.0 - factor)
+
+
+@jit(nopython=True, cache=True)
+def simulate_day(x, environmental_contagion, day, params, mode, substeps, rates):
+    """
+    Advances the integer state x (ode_kernels layout without Y_E) over one day in place.
+
+    Returns:
+        float: The environmental contagion at the end of the day.
+    """
+    t = float(day)
+    t_end = t + 1.0
+    if mode == MODE_GILLESPIE:
+        while True:
+            event_rates(t, x, environmental_contagion, params, rates)
+            total_rate = rates[EV_BIRTH]
+            for event in range(1, NUM_EVENTS):
+                total_rate += rates[event] * x[EVENT_SOURCE[event]]
+            dt = np.inf if total_rate <= 0.0 else -np.log(1.0 - np.random.random()) / total_rate
+            if t + dt >= t_end:
+                environmental_contagion = _decay_environment(environmental_contagion, x, t_end - t, params)
+                break
+            environmental_contagion = _decay_environment(environmental_contagion, x, dt, params)
+            t += dt
+            # Pick the event with probability proportional to its propensity
+            threshold = np.random.random() * total_rate
+            event = 0
+            cumulative = rates[EV_BIRTH]
+            while cumulative < threshold and event < NUM_EVENTS - 1:
+                event += 1
+                cumulative += rates[event] * x[EVENT_SOURCE[event]]
+            _apply_event(x, event, 1.0)
+    else:
+        tau = 1.0 / substeps
+        changes = np.zeros(NUM_EVENTS)
+        for _ in range(substeps):
+            event_rates(t, x, environmental_contagion, params, rates)
+            changes[EV_BIRTH] = np.random.poisson(rates[EV_BIRTH] * tau)
+            for source in range(NUM_COMPARTMENTS):
+                total_rate = 0.0
+                for event in range(1, NUM_EVENTS):
+                    if EVENT_SOURCE[event] == source:
+                        total_rate += rates[event]
+                remaining = 0
+                if total_rate > 0.0 and x[source] > 0:
+                    remaining = np.random.binomial(int(x[source]), 1.0 - np.exp(-total_rate * tau))
+                # Split the leavers between the outflows of this compartment
+                for event in range(1, NUM_EVENTS):
+                    if EVENT_SOURCE[event] != source:
+                        continue
+                    count = 0
+                    if remaining > 0:
+                        count = np.random.binomial(remaining, min(1.0, rates[event] / total_rate))
+                    changes[event] = count
+                    remaining -= count
+                    total_rate -= rates[event]
+            environmental_contagion = _decay_environment(environmental_contagion, x, tau, params)
+            for event in range(NUM_EVENTS):
+                if changes[event] > 0:
+                    _apply_event(x, event, changes[event])
+            t += tau
+    return environmental_contagion
+
+
+@jit(nopython=True, cache=True)
+def advance_days(y, start_day, n_days, params, mode, substeps):
+    """
+    Advances a stochastic trajectory n_days days after start_day.
+
+    Returns:
+        Tuple: (n_days x NUM_STATE) end-of-day states and (n_days x NUM_OUTPUTS)
+        daily outputs, in the ode_kernels.advance_days layouts.
+    """
+    states = np.empty((n_days, NUM_STATE))
+    outputs = np.zeros((n_days, NUM_OUTPUTS))
+    rates = np.empty(NUM_EVENTS)
+    x = np.round(y[:Y_E])
+    environmental_contagion = y[Y_E]
+    previous = y.copy()
+    for d in range(n_days):
+        day = start_day + d + 1
+        environmental_contagion = simulate_day(x, environmental_contagion, day, params, mode, substeps, rates)
+        states[d, :Y_E] = x
+        states[d, Y_E] = environmental_contagion
+        daily_outputs(day, states[d], previous, params, outputs[d])
+        previous = states[d]
+    return states, outputs
+
+
+@jit(nopython=True, cache=True, parallel=True)
+def fadeout_ensemble(y, n_days, params, mode, substeps, n_runs, extinction_threshold, seed):
+    """
+    Runs n_runs independent trajectories from the state y, in parallel.
+
+    A run is extinct once nobody is infected and the infections the remaining
+    environmental contagion can still cause, S * base risk * E / (k_half * decay),
+    fall below extinction_threshold; extinct runs stop early. With seed >= 0, run i
+    reseeds its thread's generator with seed + i, so the ensemble does not depend
+    on the number of threads.
+
+    Returns:
+        Tuple: Per run, the day of extinction (-1 if the infection persisted), the
+        first day with no infected people (-1 if never) and the final infected count.
+    """
+    extinction_day = np.full(n_runs, -1, dtype=np.int64)
+    first_fadeout_day = np.full(n_runs, -1, dtype=np.int64)
+    final_infected = np.zeros(n_runs, dtype=np.int64)
+    for run in prange(n_runs):
+        if seed >= 0:
+            np.random.seed(seed + run)
+        rates = np.empty(NUM_EVENTS)
+        x = np.round(y[:Y_E])
+        environmental_contagion = y[Y_E]
+        for day in range(1, n_days + 1):
+            environmental_contagion = simulate_day(x, environmental_contagion, day, params, mode, substeps, rates)
+            infected = x[Y_P] + x[Y_A] + x[Y_U] + x[Y_C]
+            if infected == 0:
+                if first_fadeout_day[run] < 0:
+                    first_fadeout_day[run] = day
+                residual_risk = x[Y_S] * params[PAR_BASE_RISK] * environmental_contagion / (params[PAR_K_HALF] * params[PAR_DECAY_RATE])
+                if params[PAR_ENABLE_ENV] == 0.0 or residual_risk < extinction_threshold:
+                    extinction_day[run] = day
+                    break
+        final_infected[run] = int(x[Y_P] + x[Y_A] + x[Y_U] + x[Y_C])
+    return extinction_day, first_fadeout_day, final_infected
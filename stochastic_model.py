@@ -0,0 +1,132 @@
+"""
+Stochastic compartmental model.
+
+Same compartments and flows as CompartmentalModel, but with whole numbers of
+people moving through random events (see stochastic_kernels.py). It captures
+stochastic fade-out and extinction at a fraction of the cost of the
+agent-based Model:
+
+    model = StochasticCompartmentalModel(initial_population=10000, initial_infected_count=5)
+    extinction_probability(n_runs=1000, duration_years=2, initial_population=10000, initial_infected_count=5)
+
+mode='gillespie' is exact and suited to small populations; mode='tau_leap'
+(the default) takes binomial leaps of tau days and scales to large ones.
+"""
+import time
+import numpy as np
+from compartmental_model import CompartmentalModel, vaccination_target_fraction
+from initialparaandconst import SIMULATION_YEARS, Vaccine
+
+MODES = ('tau_leap', 'gillespie')
+
+
+def _load_stochastic_kernels():
+    """Imports the numba kernels on first use so importing this module stays lightweight."""
+    import stochastic_kernels
+    return stochastic_kernels
+
+
+class StochasticCompartmentalModel(CompartmentalModel):
+    """CompartmentalModel whose flows are random events between integer compartments."""
+
+    def __init__(self, mode='tau_leap', tau=0.25, **kwargs):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode '{mode}'. Choose from: {', '.join(MODES)}")
+        substeps = int(round(1.0 / tau))
+        if substeps < 1 or abs(substeps * tau - 1.0) > 1e-9:
+            raise ValueError("tau must divide a day (e.g. 1, 0.5, 0.25)")
+        self.mode = mode
+        self.tau = tau
+        super().__init__(**kwargs)
+
+    def initialize_state(self):
+        super().initialize_state()
+        self.state['S'] = float(int(self.state['S']))
+        self.state['P'] = float(int(self.state['P']))
+
+    def advance_days(self, start_day, n_days):
+        """
+        Simulates n_days days after start_day (one random trajectory).
+
+        Returns:
+            Tuple: (n_days x ode_kernels.NUM_STATE) end-of-day states and
+            (n_days x ode_kernels.NUM_OUTPUTS) daily environment outputs.
+        """
+        k = _load_stochastic_kernels()
+        mode_id = k.MODE_GILLESPIE if self.mode == 'gillespie' else k.MODE_TAU_LEAP
+        states, outputs = k.advance_days(
+            self.state_vector(), int(start_day), int(n_days), self.parameter_vector(),
+            mode_id, int(round(1.0 / self.tau))
+        )
+        self.set_state_vector(states[-1])
+        return states, outputs
+
+    def vaccinate(self, year):
+        """Vaccinates a whole number of people, taken from S first and then R."""
+        if not Vaccine.is_enabled or year < Vaccine.start_year:
+            return
+        total_pop = sum(self.state[key] for key in ('S', 'M', 'P', 'A', 'U', 'C', 'R', 'V'))
+        num_to_vaccinate = int(total_pop * vaccination_target_fraction() * Vaccine.coverage)
+        from_S = min(self.state['S'], num_to_vaccinate)
+        from_R = min(self.state['R'], num_to_vaccinate - from_S)
+        self.state['S'] -= from_S
+        self.state['R'] -= from_R
+        self.state['V'] += from_S + from_R
+        print(f"Year {year}: Vaccinating {int(from_S + from_R)} people.")
+
+
+def extinction_probability(n_runs=1000, duration_years=None, mode='tau_leap', tau=0.25,
+                           extinction_threshold=0.01, seed=None, **model_kwargs):
+    """
+    Estimates the probability that the infection goes extinct within duration_years.
+
+    Args:
+        n_runs (int): Number of independent trajectories.
+        duration_years (int): Time horizon.
+        mode (str): 'tau_leap' or 'gillespie'.
+        tau (float): Leap length in days (tau_leap only).
+        extinction_threshold (float): Expected infections from the remaining
+            environmental contagion below which a run with no infected people is extinct.
+        seed (int): Run i is seeded with seed + i, so estimates are reproducible whatever
+            the number of threads; None leaves the generators unseeded.
+        **model_kwargs: CompartmentalModel parameters (initial_population, initial_infected_count, ...).
+
+    Returns:
+        dict: 'probability', its 'standard_error', the number of 'extinct' runs,
+        per-run 'extinction_day' and 'first_fadeout_day' (-1 if none), and 'wall_time'.
+    """
+    k = _load_stochastic_kernels()
+    duration_years = duration_years if duration_years is not None else SIMULATION_YEARS
+    model = StochasticCompartmentalModel(mode=mode, tau=tau, **model_kwargs)
+    mode_id = k.MODE_GILLESPIE if mode == 'gillespie' else k.MODE_TAU_LEAP
+
+    start_time = time.perf_counter()
+    extinction_day, first_fadeout_day, _ = k.fadeout_ensemble(
+        model.state_vector(), int(duration_years * 365), model.parameter_vector(), mode_id,
+        int(round(1.0 / tau)), int(n_runs), float(extinction_threshold), -1 if seed is None else int(seed)
+    )
+    extinct = int(np.sum(extinction_day >= 0))
+    probability = extinct / n_runs
+    return {
+        'probability': probability,
+        'standard_error': float(np.sqrt(probability * (1.0 - probability) / n_runs)),
+        'extinct': extinct,
+        'n_runs': n_runs,
+        'extinction_day': extinction_day,
+        'first_fadeout_day': first_fadeout_day,
+        'wall_time': time.perf_counter() - start_time,
+    }
+
+
+def compile_stochastic_kernels():
+    """
+    Compiles the stochastic kernels (or loads them from the on-disk cache) on tiny dummy runs.
+
+    Returns:
+        float: Seconds spent compiling (or loading) the kernels.
+    """
+    start_time = time.perf_counter()
+    for mode in MODES:
+        StochasticCompartmentalModel(mode=mode, initial_population=100, initial_infected_count=1).advance_days(0, 1)
+    extinction_probability(n_runs=1, duration_years=0, seed=0, initial_population=100, initial_infected_count=1)
+    return time.perf_counter() - start_time
@@ -0,0 +1,54 @@
+import numpy as np
+from downsampling import lttb, minmax, downsample
+
+
+def _series(n=7300, seed=1):
+    rng = np.random.default_rng(seed)
+    x = np.arange(n, dtype=float)
+    y = np.sin(x / 200.0) * 100 + rng.normal(0, 5, n)
+    if n > 5678: # Single-day spikes
+        y[1234] = 1000.0
+        y[5678] = -1000.0
+    return x, y
+
+
+def test_lttb_keeps_endpoints_and_length():
+    x, y = _series()
+    kept = lttb(x, y, 500)
+    assert len(kept) == 500
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_extremes():
+    x, y = _series()
+    kept = lttb(x, y, 500)
+    assert 1234 in kept and 5678 in kept
+
+
+def test_minmax_keeps_endpoints_length_and_extremes():
+    x, y = _series()
+    kept = minmax(x, y, 500)
+    assert len(kept) <= 500
+    assert np.all(np.diff(kept) > 0)
+    assert y[kept].max() == y.max() and y[kept].min() == y.min()
+    # Each bucket keeps its extremes, so the first and last buckets' extremes are there
+    assert kept[0] < len(x) / 250 and kept[-1] >= len(x) - len(x) / 250
+
+
+def test_short_series_are_returned_whole():
+    x, y = _series(n=100)
+    assert np.array_equal(lttb(x, y, 500), np.arange(100))
+    assert np.array_equal(minmax(x, y, 500), np.arange(100))
+
+
+def test_nan_values_are_never_kept():
+    x, y = _series()
+    y[:100] = np.nan # Days a variable was not recorded
+    y[3000:3100] = np.nan
+    for method in ('lttb', 'minmax'):
+        days, values = downsample(x, y, 500, method)
+        assert not np.isnan(values).any()
+        assert max(values) == 1000.0 and min(values) == -1000.0
+    kept = lttb(x, y, 500)
+    assert kept[0] == 100 and kept[-1] == len(x) - 1 and len(kept) == 500
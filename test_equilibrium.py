@@ -0,0 +1,67 @@
+import contextlib
+import io
+import numpy as np
+from engine import make_engine
+from simulation import Simulation
+
+
+def _yearly_incidence(**params):
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        result = Simulation(make_engine('ode', initial_population=100000, **params)).run(8, save=False)
+    return np.array([year['yearly_new_infections'] for year in result.population_history if year['year'] > 0], dtype=float)
+
+
+def test_equilibrium_start_has_flat_yearly_incidence():
+    # Incidence only follows the population's growth through births: a constant yearly ratio
+    incidence = _yearly_incidence(start_at_equilibrium=True)
+    growth = incidence[1:] / incidence[:-1]
+    assert np.ptp(growth) < 1e-3
+    assert abs(growth.mean() - 1) < 0.02
+
+
+def test_seeded_start_has_a_transient():
+    incidence = _yearly_incidence(initial_infected_count=10)
+    assert np.ptp(incidence[1:] / incidence[:-1]) > 0.1
+
+
+def _seeded_model(population=50000, seed=1):
+    from initialparaandconst import MALE_BIRTH_RATE, FEMALE_BIRTH_RATE
+    from model import Model, set_seed
+    from equilibrium import seed_model_at_equilibrium
+    set_seed(seed)
+    model = Model(population, MALE_BIRTH_RATE, FEMALE_BIRTH_RATE)
+    with contextlib.redirect_stdout(io.StringIO()):
+        model.initialize_population()
+    ages = model.age_days.copy()
+    with contextlib.redirect_stdout(io.StringIO()):
+        equilibrium = seed_model_at_equilibrium(model)
+    return model, ages, equilibrium
+
+
+def test_abm_seeding_matches_equilibrium_proportions():
+    model, _, equilibrium = _seeded_model()
+    alive = model.is_alive.sum()
+    proportions = np.bincount(model.disease_state[model.is_alive], minlength=len(equilibrium['fractions'])) / alive
+    # Within 4 binomial standard deviations of the equilibrium fractions
+    tolerance = 4 * np.sqrt(equilibrium['fractions'] * (1 - equilibrium['fractions']) / alive) + 1e-4
+    assert np.all(np.abs(proportions - equilibrium['fractions']) <= tolerance)
+
+
+def test_abm_seeding_keeps_the_age_distribution():
+    from initialparaandconst import MATERNALLY_IMMUNE, MATERNAL_IMMUNITY_DURATION
+    model, ages, _ = _seeded_model()
+    np.testing.assert_array_equal(model.age_days, ages)
+    maternal = model.disease_state == MATERNALLY_IMMUNE
+    assert maternal.any()
+    assert np.all(model.age_days[maternal] < MATERNAL_IMMUNITY_DURATION)
+    assert np.all(model.days_in_state[maternal] < MATERNAL_IMMUNITY_DURATION)
+
+
+def test_unconverged_equilibrium_warns(capsys):
+    from compartmental_model import CompartmentalModel
+    from equilibrium import endemic_equilibrium, apply_equilibrium
+    model = CompartmentalModel(initial_population=100000)
+    equilibrium = endemic_equilibrium(model, max_iter=0, burn_in_years=0)
+    assert not equilibrium['converged']
+    apply_equilibrium(model, equilibrium)
+    assert "did not converge" in capsys.readouterr().out
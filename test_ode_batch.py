@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from ode_batch import integrate_batch
+
+
+def test_default_infected_count_scales_with_each_population():
+    batch = integrate_batch({'initial_population': [100000, 200000]}, duration_years=1)
+    np.testing.assert_array_equal(batch.parameters['initial_infected_count'], [3000, 6000])
+    final = batch.states[:, -1, :8].sum(axis=1)
+    # Births and deaths change the population by a few percent a year at most
+    np.testing.assert_allclose(final, [100000, 200000], rtol=0.05)
+
+
+def test_rows_match_single_populations():
+    mixed = integrate_batch({'initial_population': [100000, 200000]}, duration_years=1)
+    for row, population in enumerate((100000, 200000)):
+        single = integrate_batch({'initial_population': population}, duration_years=1)
+        np.testing.assert_allclose(mixed.states[row], single.states[0])
+
+
+def test_infected_count_must_be_below_population():
+    with pytest.raises(ValueError):
+        integrate_batch({'initial_population': [100, 1000], 'initial_infected_count': 500}, duration_years=1)
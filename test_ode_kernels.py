@@ -0,0 +1,75 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from compartmental_model import CompartmentalModel
+
+DAYS = 3 * 365
+
+
+def _final_state(**solver_options):
+    model = CompartmentalModel(initial_population=100000, initial_infected_count=3000, **solver_options)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for day in range(1, DAYS + 1):
+            model.step(day)
+    return model.state_vector()
+
+
+def test_compiled_rk4_matches_python_solver():
+    # The 'python' solver updates the environment once a day, as the uncoupled compiled solvers do
+    reference = _final_state(solver='python')
+    np.testing.assert_allclose(_final_state(solver='rk4', coupled_environment=False), reference, rtol=1e-10, atol=1e-6)
+
+
+def test_compiled_rk45_matches_python_solver():
+    reference = _final_state(solver='python')
+    np.testing.assert_allclose(_final_state(solver='rk45', coupled_environment=False), reference, rtol=1e-6, atol=1e-3)
+
+
+def _fine_rk4_reference(model, days, substeps=40):
+    """Daily states of a classical RK4 run with 1/substeps-day steps."""
+    import ode_kernels
+    y, params = model.state_vector(), model.parameter_vector()
+    states = []
+    for day in range(days):
+        for substep in range(substeps):
+            y = ode_kernels.rk4_step(1.0 + day + substep / substeps, y, 1.0 / substeps, params)
+        states.append(y.copy())
+    return np.array(states)
+
+
+def test_coupled_rk45_dense_output_matches_fine_reference():
+    # Adaptive steps span several days; the daily states come from the dense output
+    model = CompartmentalModel(initial_population=100000, initial_infected_count=3000, solver='rk45')
+    reference = _fine_rk4_reference(model, DAYS)
+    states, _ = model.advance_days(0, DAYS)
+    np.testing.assert_allclose(states, reference, rtol=5e-4, atol=1.0)
+
+
+def test_rk45_rejects_non_finite_parameters():
+    import ode_kernels
+    model = CompartmentalModel(initial_population=1000, initial_infected_count=10, solver='rk45')
+    params = model.parameter_vector()
+    params[ode_kernels.PAR_BASE_RISK] = np.nan
+    with pytest.raises(ValueError):
+        ode_kernels.advance_days(model.state_vector(), 0, 5, params, ode_kernels.SOLVER_RK45, 1e-6, 1e-3, 1)
+    with pytest.raises(ValueError):
+        ode_kernels.rk45_integrate(1.0, 2.0, model.state_vector(), params, 1e-6, 1e-3, 1.0)
+
+
+def test_weekly_steps_stay_close_to_reference():
+    # Bounds quoted at MAX_STEP_DAYS (N=100k, 20 years): 0.01% of the population on every day
+    days = 20 * 365
+    reference, _ = CompartmentalModel(initial_population=100000, solver='rk45', rtol=1e-10, atol=1e-6).advance_days(0, days)
+    states, _ = CompartmentalModel(initial_population=100000, step_days=7).advance_days(0, days)
+    assert np.abs(states[:, :8] - reference[:, :8]).max() < 1e-4 * 100000
+    assert abs(states[-1, 8] - reference[-1, 8]) < 3e-5 * reference[-1, 8]
+    # The interpolated days follow the early acute peak instead of cutting it off
+    assert states[:, 3].max() == pytest.approx(reference[:, 3].max(), rel=0.01)
+
+
+def test_batch_peak_includes_days_inside_steps():
+    from ode_batch import integrate_batch
+    reference, _ = CompartmentalModel(initial_population=100000, solver='rk45', rtol=1e-10, atol=1e-6).advance_days(0, 365)
+    batch = integrate_batch({'initial_population': 100000}, duration_years=1, step_days=7, record_every=30)
+    assert batch.peak_acute[0] == pytest.approx(reference[:, 3].max(), rel=0.01)
@@ -0,0 +1,60 @@
+import pytest
+import app as web
+
+
+@pytest.fixture
+def client():
+    web.app.config['TESTING'] = True
+    with web.app.test_client() as client:
+        yield client
+    if web._session_manager is not None:
+        web._session_manager.shutdown()
+        web._session_manager = None
+
+
+def _reset(client, **fields):
+    data = {'engine': 'ode', 'initial_population': 10000, 'session_id': 'test'}
+    data.update(fields)
+    response = client.post('/reset', json=data)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_reset_step_and_state(client):
+    reset = _reset(client)
+    assert reset['day'] == 0 and reset['date'] == '2020-01-01'
+    assert reset['population'] == pytest.approx(10000, abs=1)
+
+    step = client.post('/step', json={'session_id': 'test', 'days': 7}).get_json()
+    assert step['day'] == 7 and len(step['daily']) == 7
+    assert sum(step['changes'].values()) == step['population'] - reset['population']
+
+    state = client.get('/state?session=test').get_json()
+    assert state['day'] == 7 and state['state_counts'] == step['state_counts']
+    assert state['daily'] == []
+
+
+def test_step_rejects_bad_days(client):
+    _reset(client)
+    assert client.post('/step', json={'session_id': 'test', 'days': 'x'}).status_code == 400
+
+
+def test_run_duration_reports_compartmental_population(client):
+    _reset(client)
+    reply = client.post('/run_duration', json={'session_id': 'test', 'years': 2}).get_json()
+    assert [frame['year'] for frame in reply['history']] == [0, 1, 2]
+    for frame in reply['history']:
+        assert frame['population'] == pytest.approx(10000, rel=0.1)
+
+
+def test_reset_without_vaccine_settings_uses_the_defaults():
+    from sessions import SessionManager
+    manager = SessionManager()
+    try:
+        params = {'initial_population': 10000}
+        manager.reset('test', 'ode', params, {'is_enabled': True, 'start_year': 1})
+        assert manager.step('test', 1)['state_counts']['VACCINATED'] > 0
+        manager.reset('test', 'ode', params, None)
+        assert manager.step('test', 1)['state_counts']['VACCINATED'] == 0
+    finally:
+        manager.shutdown()
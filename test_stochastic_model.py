@@ -0,0 +1,17 @@
+import numpy as np
+from stochastic_model import extinction_probability
+
+
+def test_extinction_is_near_certain_at_very_low_risk():
+    estimate = extinction_probability(n_runs=200, duration_years=2, seed=1, base_transmission_risk=1e-9,
+                                      initial_population=1000, initial_infected_count=2)
+    assert estimate['probability'] >= 0.99
+    assert np.all(estimate['extinction_day'][estimate['extinction_day'] >= 0] <= 2 * 365)
+
+
+def test_seeded_ensembles_are_reproducible():
+    kwargs = dict(n_runs=100, duration_years=1, initial_population=2000, initial_infected_count=3)
+    first = extinction_probability(seed=7, **kwargs)
+    second = extinction_probability(seed=7, **kwargs)
+    np.testing.assert_array_equal(first['extinction_day'], second['extinction_day'])
+    np.testing.assert_array_equal(first['first_fadeout_day'], second['first_fadeout_day'])
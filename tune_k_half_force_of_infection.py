@@ -1,6 +1,6 @@
 import numpy as np
 import plotly.graph_objects as go
-from compartmental_model import CompartmentalModel
+from ode_batch import integrate_batch
 from initialparaandconst import K_HALF
 import os
 
@@ -14,20 +14,16 @@ def run_k_half_foi_sensitivity():
     print(f"Starting sensitivity analysis for K_HALF vs Force of Infection...")
     print(f"Testing values: {k_values}")
     
-    for k in k_values:
-        print(f"Testing K_HALF = {k:.2e}...")
-        model = CompartmentalModel(k_half=k)
-        model.run()
-        
-        # Extract data for plotting
-        # Force of Infection is 'infection_pressure' in environment_history
-        # We need to access environment_history from the model
-        days = [d['day'] for d in model.environment_history]
-        foi = [d['infection_pressure'] for d in model.environment_history]
-        
+    # All values are integrated together in one batch, in memory (no history files)
+    batch = integrate_batch({'k_half': k_values})
+    
+    # Extract data for plotting
+    # Force of Infection is the daily infection pressure
+    foi = batch.infection_pressure()
+    for i, k in enumerate(k_values):
         results[k] = {
-            'days': days,
-            'foi': foi
+            'days': batch.days.tolist(),
+            'foi': foi[i].tolist()
         }
         
     return results
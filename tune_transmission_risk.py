@@ -1,6 +1,6 @@
 import numpy as np
 import plotly.graph_objects as go
-from compartmental_model import CompartmentalModel
+from ode_batch import integrate_batch
 import os
 
 def run_parameter_sweep():
@@ -16,25 +16,16 @@ def run_parameter_sweep():
     print(f"Starting parameter sweep for BASE_TRANSMISSION_RISK...")
     print(f"Testing values: {risk_values}")
     
-    for risk in risk_values:
-        print(f"Testing risk = {risk:.2e}...")
-        model = CompartmentalModel(base_transmission_risk=risk)
-        
-        # Run model (suppress print output if possible, or just let it print)
-        # We need to capture the history. The run() method saves files but also populates self.sir_history
-        
-        # We can't easily suppress print from run() without redirecting stdout, 
-        # but run() prints yearly summaries which is fine.
-        model.run()
-        
-        # Extract data for plotting
-        # We want Infected (Acute + Subclinical) over time
-        days = [d['day'] for d in model.sir_history]
-        infected = [d['ACUTE'] + d['SUBCLINICAL'] for d in model.sir_history]
-        
+    # All values are integrated together in one batch, in memory (no history files)
+    batch = integrate_batch({'base_transmission_risk': risk_values})
+    
+    # Extract data for plotting
+    # We want Infected (Acute + Subclinical) over time
+    infected = batch.infected()
+    for i, risk in enumerate(risk_values):
         results[risk] = {
-            'days': days,
-            'infected': infected
+            'days': batch.days.tolist(),
+            'infected': infected[i].tolist()
         }
         
     return results
@@ -1,9 +1,8 @@
 import plotly.graph_objects as go
 import json
 import numpy as np
+from results import history_path
 
-with open('latest_simulation_name.txt', 'r') as f:
-    latest_fname = f.read().strip() 
 # Define the same age bins and labels as used in simulation.py
 PYRAMID_AGE_BINS = [0, 5, 10, 15, 20, 25, 30, 35, 40, 45, 50, 55, 60, 65, 70, 75, 80, 150]
 PYRAMID_AGE_LABELS = []
@@ -11,12 +10,14 @@ for i in range(len(PYRAMID_AGE_BINS) - 2):
     PYRAMID_AGE_LABELS.append(f'{PYRAMID_AGE_BINS[i]}-{PYRAMID_AGE_BINS[i+1]-1}')
 PYRAMID_AGE_LABELS.append(f'{PYRAMID_AGE_BINS[-2]}+') # This will be '80+'
 
-def create_population_pyramid_visualization(history_file=f'{latest_fname}_population_history.json'):
+def get_figure(history_file=None):
     """
-    Creates an interactive Plotly population pyramid visualization with a slider
-    based on the simulation history.
+    Builds the interactive Plotly population pyramid (with a year slider) from the
+    simulation history. Defaults to the latest run. Returns None if there is no data.
     """
     try:
+        if history_file is None:
+            history_file = history_path('population')
         with open(history_file, 'r') as f:
             population_history = json.load(f)
     except FileNotFoundError:
@@ -157,7 +158,56 @@ def create_population_pyramid_visualization(history_file=f'{latest_fname}_popula
         font=dict(size=18)
     )
 
-    fig.show()
+    return fig
+
+def get_snapshot_figure(snapshot, title='Population Pyramid'):
+    """
+    Builds a single population pyramid from one population snapshot (as recorded
+    each year, or returned by an interactive session).
+    """
+    from initialparaandconst import PYRAMID_AGE_LABELS as snapshot_labels # The bins engines record with
+    male_counts = np.array(snapshot['male_age_counts'])
+    female_counts = np.array(snapshot['female_age_counts'])
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        y=snapshot_labels,
+        x=-male_counts,
+        orientation='h',
+        name='Male',
+        marker=dict(color='cornflowerblue'),
+        customdata=male_counts,
+        hovertemplate='Age: %{y}<br>Population: %{customdata}<extra></extra>'
+    ))
+    fig.add_trace(go.Bar(
+        y=snapshot_labels,
+        x=female_counts,
+        orientation='h',
+        name='Female',
+        marker=dict(color='lightcoral'),
+        hovertemplate='Age: %{y}<br>Population: %{x}<extra></extra>'
+    ))
+    max_count = max(int(male_counts.max(initial=0)), int(female_counts.max(initial=0)), 1)
+    fig.update_layout(
+        barmode='relative',
+        title=title,
+        xaxis_title='Population',
+        xaxis=dict(
+            range=[-max_count * 1.1, max_count * 1.1],
+            tickvals=[-max_count, 0, max_count],
+            ticktext=[f'{max_count:,.0f}', '0', f'{max_count:,.0f}']
+        ),
+        font=dict(size=18)
+    )
+    return fig
+
+def create_population_pyramid_visualization(history_file=None):
+    """
+    Creates an interactive Plotly population pyramid visualization with a slider
+    based on the simulation history.
+    """
+    fig = get_figure(history_file)
+    if fig is not None:
+        fig.show()
 
 if __name__ == '__main__':
     create_population_pyramid_visualization()
\ No newline at end of file
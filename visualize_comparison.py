@@ -12,9 +12,10 @@ def load_history(filepath):
         print(f"Error: The file {filepath} was not found.")
         return None
 
-def visualize_comparison(file1, file2, label1="Run 1", label2="Run 2", normalize=False):
+def visualize_comparison(file1, file2, label1="Run 1", label2="Run 2", normalize=False, max_points=None):
     """
     Compares two SIR history files and generates a Plotly line chart.
+    max_points decimates each trace (LTTB, see downsampling.py) to keep long runs responsive.
     """
     history1 = load_history(file1)
     history2 = load_history(file2)
@@ -32,6 +33,12 @@ def visualize_comparison(file1, file2, label1="Run 1", label2="Run 2", normalize
     
     fig = go.Figure()
 
+    def trace_data(days, counts):
+        if max_points is None:
+            return days, counts
+        from downsampling import downsample
+        return downsample(days, counts, max_points)
+
     for i, state in enumerate(keys1):
         color = colors[i % len(colors)]
         
@@ -41,8 +48,9 @@ def visualize_comparison(file1, file2, label1="Run 1", label2="Run 2", normalize
             totals1 = [sum(item.get(k, 0) for k in keys1) for item in history1]
             counts1 = [c / t if t > 0 else 0 for c, t in zip(counts1, totals1)]
             
+        x1, y1 = trace_data(days1, counts1)
         fig.add_trace(go.Scatter(
-            x=days1, y=counts1, 
+            x=x1, y=y1, 
             mode='lines', 
             name=f"{state} ({label1})", 
             line=dict(color=color, width=2),
@@ -55,8 +63,9 @@ def visualize_comparison(file1, file2, label1="Run 1", label2="Run 2", normalize
             totals2 = [sum(item.get(k, 0) for k in keys1) for item in history2]
             counts2 = [c / t if t > 0 else 0 for c, t in zip(counts2, totals2)]
 
+        x2, y2 = trace_data(days2, counts2)
         fig.add_trace(go.Scatter(
-            x=days2, y=counts2, 
+            x=x2, y=y2, 
             mode='lines', 
             name=f"{state} ({label2})", 
             line=dict(color=color, width=2, dash='dash'),
@@ -82,7 +91,8 @@ if __name__ == "__main__":
     parser.add_argument("label1", nargs='?', default="Run 1", help="Label for the first run")
     parser.add_argument("label2", nargs='?', default="Run 2", help="Label for the second run")
     parser.add_argument("--normalize", action="store_true", help="Normalize counts by total population")
+    parser.add_argument("--max-points", type=int, help="Decimate each trace to this many points")
     
     args = parser.parse_args()
     
-    visualize_comparison(args.file1, args.file2, args.label1, args.label2, args.normalize)
+    visualize_comparison(args.file1, args.file2, args.label1, args.label2, args.normalize, args.max_points)
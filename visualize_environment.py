@@ -2,17 +2,21 @@ import json
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.colors as pcolors
-with open('latest_simulation_name.txt', 'r') as f:
-    latest_fname = f.read().strip()
+from results import history_path
 
-def visualize_environment_history(filepath=f"{latest_fname}_environment_history.json"):
+def get_figure(filepath=None):
     """
-    Loads environmental contagion history and generates an interactive line chart.
+    Loads environmental contagion history and builds an interactive line chart.
 
     Args:
-        filepath (str): The path to the environment history JSON file.
+        filepath (str): The path to the environment history JSON file. Defaults to the latest run.
+
+    Returns:
+        The Plotly figure, or None if there is no data.
     """
     try:
+        if filepath is None:
+            filepath = history_path('environment')
         with open(filepath, 'r') as f:
             env_history = json.load(f)
     except FileNotFoundError:
@@ -61,7 +65,18 @@ def visualize_environment_history(filepath=f"{latest_fname}_environment_history.
     fig.update_yaxes(title_text="Contagion Units", secondary_y=False, exponentformat="power")
     fig.update_yaxes(title_text="Value", secondary_y=True, exponentformat="power")
 
-    fig.show()
+    return fig
+
+def visualize_environment_history(filepath=None):
+    """
+    Loads environmental contagion history and generates an interactive line chart.
+
+    Args:
+        filepath (str): The path to the environment history JSON file. Defaults to the latest run.
+    """
+    fig = get_figure(filepath)
+    if fig is not None:
+        fig.show()
 
 if __name__ == "__main__":
     visualize_environment_history()
\ No newline at end of file
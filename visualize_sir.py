@@ -1,19 +1,21 @@
 import json
 import plotly.graph_objects as go
 import plotly.colors as pcolors
+from results import history_path
 
-with open('latest_simulation_name.txt', 'r') as f:
-    latest_fname = f.read().strip()
-    print(latest_fname)
-
-def visualize_sir_history(filepath=f"{latest_fname}_sir_history.json"):
+def get_figure(filepath=None):
     """
-    Loads disease history data and generates a dynamic, interactive Plotly line chart.
+    Loads disease history data and builds a dynamic, interactive Plotly line chart.
 
     Args:
-        filepath (str): The path to the SIR history JSON file.
+        filepath (str): The path to the SIR history JSON file. Defaults to the latest run.
+
+    Returns:
+        The Plotly figure, or None if there is no data.
     """
     try:
+        if filepath is None:
+            filepath = history_path('sir')
         with open(filepath, 'r') as f:
             sir_history = json.load(f)
     except FileNotFoundError:
@@ -47,7 +49,18 @@ def visualize_sir_history(filepath=f"{latest_fname}_sir_history.json"):
         font=dict(size=18)
     )
 
-    fig.show()
+    return fig
+
+def visualize_sir_history(filepath=None):
+    """
+    Loads disease history data and generates a dynamic, interactive Plotly line chart.
+
+    Args:
+        filepath (str): The path to the SIR history JSON file. Defaults to the latest run.
+    """
+    fig = get_figure(filepath)
+    if fig is not None:
+        fig.show()
 
 if __name__ == "__main__":
     visualize_sir_history()
\ No newline at end of file
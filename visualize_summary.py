@@ -2,15 +2,17 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import json
 import numpy as np
-with open('latest_simulation_name.txt', 'r') as f:
-    latest_fname = f.read().strip()
 from reporting_config import YEARLY_SUMMARY_VARIABLES
-def create_summary_visualization(history_file=f'{latest_fname}_population_history.json'):
+from results import history_path
+
+def get_figure(history_file=None):
     """
-    Creates an interactive Plotly line chart showing total population, births,
-    and deaths over time from the simulation history.
+    Builds the Plotly chart of total population, births, deaths and the yearly
+    summary variables. Defaults to the latest run. Returns None if there is no data.
     """
     try:
+        if history_file is None:
+            history_file = history_path('population')
         with open(history_file, 'r') as f:
             population_history = json.load(f)
     except FileNotFoundError:
@@ -72,7 +74,16 @@ def create_summary_visualization(history_file=f'{latest_fname}_population_histor
     fig.update_layout(title_text='Demographic and Disease Summary', barmode='group', height=300 * num_rows, showlegend=True, font=dict(size=18))
     fig.update_xaxes(title_text="Year", row=num_rows, col=1)
 
-    fig.show()
+    return fig
+
+def create_summary_visualization(history_file=None):
+    """
+    Creates an interactive Plotly line chart showing total population, births,
+    and deaths over time from the simulation history.
+    """
+    fig = get_figure(history_file)
+    if fig is not None:
+        fig.show()
 
 if __name__ == '__main__':
     create_summary_visualization()
\ No newline at end of file
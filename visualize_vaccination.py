@@ -1,12 +1,16 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import json
+from results import history_path
 
-def create_vaccination_visualization(history_file='population_history.json'):
+def get_figure(history_file=None):
     """
-    Creates an interactive Plotly visualization to compare simulations with and without vaccination.
+    Builds the Plotly chart of annual disease-related deaths used to judge vaccination
+    impact. Defaults to the latest run. Returns None if there is no data.
     """
     try:
+        if history_file is None:
+            history_file = history_path('population')
         with open(history_file, 'r') as f:
             population_history = json.load(f)
     except FileNotFoundError:
@@ -41,4 +45,15 @@ def create_vaccination_visualization(history_file='population_history.json'):
     )
 
     fig.update_layout(title_text='Vaccination Impact on Mortality', font=dict(size=18))
-    fig.show()
\ No newline at end of file
+    return fig
+
+def create_vaccination_visualization(history_file=None):
+    """
+    Creates an interactive Plotly visualization to compare simulations with and without vaccination.
+    """
+    fig = get_figure(history_file)
+    if fig is not None:
+        fig.show()
+
+if __name__ == '__main__':
+    create_vaccination_visualization()